@@ -1,15 +1,27 @@
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import click
 from flask import Flask
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
 
-from routes.analysis import analysis_bp  # Add this import
+from routes.analysis import analysis_bp, materialize_company_insights  # Add this import
 from routes.auth import auth_bp
 from routes.companies import companies_bp
 from routes.experiences import experiences_bp
 from routes.admin import admin_bp  # Add this import
+from services.database import database
+from services.index_registry import index_registry
+from services.job_queue import job_queue
+from services.otp_service import otp_service
+from services.token_blocklist import token_blocklist
+from services.insights_aggregator import InsightsAggregator
+from services.student_search import backfill_student_search
+from services.company_resolver import backfill_company_ids
+from services.experience_search import ExperienceSearchIndex
 
 # Load environment variables
 load_dotenv()
@@ -26,12 +38,11 @@ app.config["JWT_REFRESH_TOKEN_EXPIRES"] = int(
 
 jwt = JWTManager(app)
 
-# MongoDB Config
-mongo_uri = os.getenv("MONGO_URI")
-mongo_db_name = os.getenv("MONGO_DB_NAME", "placify-final-db")
+# Revoked tokens, shared across workers through Redis
+token_blocklist.init_app(app)
 
-client = MongoClient(mongo_uri)
-app.config["MONGO_DB"] = client[mongo_db_name]
+# MongoDB Config: pool settings come from MONGO_* env vars, see services/database.py
+database.init_app(app)
 
 # Register Blueprints
 app.register_blueprint(auth_bp, url_prefix="/api/auth")
@@ -40,5 +51,142 @@ app.register_blueprint(experiences_bp, url_prefix='/api')
 app.register_blueprint(admin_bp, url_prefix='/api')  # Add this line
 app.register_blueprint(analysis_bp, url_prefix='/api')
 
+# Indexes declared by the blueprints, created if missing.
+# Set ENSURE_INDEXES=false to leave this to the CLI command below.
+if os.getenv("ENSURE_INDEXES", "true").lower() == "true":
+    index_registry.ensure(app.config["MONGO_DB"], app.logger)
+
+# Background jobs for post-submission and moderation updates
+job_queue.init_app(app)
+
+# One Redis connection pool per worker for OTP storage
+otp_service.init_app(app)
+
+
+@app.cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """Create every declared index that is missing"""
+    result = index_registry.ensure(app.config["MONGO_DB"], app.logger)
+    click.echo(json.dumps(result, indent=2))
+
+
+@app.cli.command("index-report")
+def index_report_command():
+    """Report missing, unused ($indexStats) and undeclared indexes"""
+    click.echo(json.dumps(index_registry.report(app.config["MONGO_DB"]), indent=2))
+
+
+@app.cli.command("jobs-worker")
+def jobs_worker_command():
+    """Consume background jobs from the Redis queue until interrupted"""
+    click.echo(f"Job worker started ({job_queue.backend} backend)")
+    job_queue.run_worker()
+
+
+@app.cli.command("jobs-requeue")
+def jobs_requeue_command():
+    """Move jobs left in progress by stopped workers back onto the queue"""
+    click.echo(f"Requeued {job_queue.requeue_processing()} jobs")
+
+
+@app.cli.command("jobs-status")
+def jobs_status_command():
+    """Queued, in-progress and failed job counts"""
+    click.echo(json.dumps(job_queue.stats(), indent=2))
+
+
+@app.cli.command("backfill-student-search")
+def backfill_student_search_command():
+    """Fill the lowercase search tokens of students registered before they existed"""
+    click.echo(f"Updated {backfill_student_search(app.config['MONGO_DB'])} students")
+
+
+@app.cli.command("backfill-company-ids")
+def backfill_company_ids_command():
+    """Give companies created without a companyId their _id string as one"""
+    click.echo(f"Updated {backfill_company_ids(app.config['MONGO_DB'])} companies")
+
+
+@app.cli.command("rebuild-experience-search")
+def rebuild_experience_search_command():
+    """Re-index every experience for /experiences/search"""
+    started = time.perf_counter()
+    count = ExperienceSearchIndex(app.config["MONGO_DB"]).rebuild()
+    if count is None:
+        click.echo("Another rebuild is already running")
+        return
+    click.echo(f"Indexed {count} experiences in {time.perf_counter() - started:.2f} s")
+
+
+def init_rebuild_worker():
+    """Pool initializer: MongoClient is not fork-safe, open one per worker process"""
+    if database.pid != os.getpid():
+        database.connect()
+
+
+def rebuild_company_insights(company_id):
+    """Rebuild one company's aggregate, question clusters and materialized insights"""
+    started = time.perf_counter()
+    with app.app_context():
+        db = app.config["MONGO_DB"]
+        try:
+            InsightsAggregator(db).rebuild(company_id)
+            materialized = materialize_company_insights(
+                db, company_id, refit_questions=True)
+            count = materialized["experienceCount"] if materialized else 0
+            error = None
+        except Exception as e:
+            count, error = 0, str(e)
+    return company_id, count, time.perf_counter() - started, error
+
+
+@app.cli.command("rebuild-insights")
+@click.option("--workers", default=os.cpu_count() or 1, show_default=True,
+              help="Worker processes, 1 rebuilds in this process")
+@click.option("--company", "company_ids", multiple=True,
+              help="Only rebuild these companyIds")
+def rebuild_insights_command(workers, company_ids):
+    """Rebuild insights and rounds analytics for every company"""
+    db = app.config["MONGO_DB"]
+    company_ids = list(company_ids) or \
+        [c["companyId"] for c in db.companies.find({}, {"companyId": 1}) if c.get("companyId")]
+    if not company_ids:
+        click.echo("No companies to rebuild")
+        return
+    workers = min(workers, len(company_ids))
+
+    started = time.perf_counter()
+    total_experiences, failed = 0, 0
+
+    def report(result):
+        nonlocal total_experiences, failed
+        company_id, count, seconds, error = result
+        total_experiences += count
+        if error:
+            failed += 1
+            click.echo(f"{company_id}: failed after {seconds * 1000:.1f} ms: {error}", err=True)
+        else:
+            click.echo(f"{company_id}: {count} experiences in {seconds * 1000:.1f} ms")
+
+    if workers <= 1:
+        for company_id in company_ids:
+            report(rebuild_company_insights(company_id))
+    else:
+        # pandas/sklearn work holds the GIL, so companies fan out over
+        # processes. Each process streams one company's experiences at a time.
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_rebuild_worker) as pool:
+            futures = [pool.submit(rebuild_company_insights, company_id)
+                       for company_id in company_ids]
+            for future in as_completed(futures):
+                report(future.result())
+
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f"Rebuilt {len(company_ids) - failed}/{len(company_ids)} companies, "
+        f"{total_experiences} experiences in {elapsed:.2f} s "
+        f"({len(company_ids) / elapsed:.2f} companies/s, "
+        f"{total_experiences / elapsed:.1f} experiences/s) with {max(workers, 1)} workers")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
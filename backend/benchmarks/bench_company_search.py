@@ -0,0 +1,139 @@
+"""
+Benchmark: company search-as-you-type, $regex scan vs the in-memory prefix index.
+
+Generates synthetic companies and replays typeahead sessions, one query per
+keystroke, against:
+  * the previous filter, a case-insensitive unanchored regex over name and
+    location plus an exact tag match, evaluated over every company the way
+    a collection scan does (in-process by default, or as a real $regex
+    find with --mongo-uri)
+  * services.search_index.SearchIndex, the index behind /companies?search=
+
+Index build time is reported separately since it is paid once per rebuild,
+not per keystroke.
+
+Usage (from backend/):
+    python benchmarks/bench_company_search.py [--sizes 10000 100000] [--sessions 50]
+    python benchmarks/bench_company_search.py --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.search_index import SearchIndex  # noqa: E402
+
+WEIGHTS = {"name": 3, "tags": 2, "location": 1}
+
+SYLLABLES = ["al", "ba", "cor", "da", "el", "fin", "go", "hex", "in", "jo",
+             "ka", "lo", "mi", "no", "or", "pa", "qu", "ra", "si", "tek",
+             "um", "vi", "wa", "xo", "ya", "zen"]
+SUFFIXES = ["Technologies", "Systems", "Labs", "Solutions", "Software",
+            "Analytics", "Networks", "Digital", "Consulting", "Infotech"]
+CITIES = ["Bangalore", "Pune", "Hyderabad", "Chennai", "Mumbai", "Delhi",
+          "Ahmedabad", "Vadodara", "Noida", "Gurgaon", "Kolkata", "Remote"]
+TAGS = ["product", "service", "fintech", "saas", "ai", "cloud", "security",
+        "ecommerce", "healthcare", "gaming", "startup", "mnc"]
+
+
+def make_companies(n, seed=42):
+    rng = random.Random(seed)
+    companies = []
+    for i in range(n):
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        companies.append({
+            "_id": i,
+            "name": f"{word.capitalize()} {rng.choice(SUFFIXES)}",
+            "location": rng.choice(CITIES),
+            "tags": rng.sample(TAGS, rng.randint(1, 3))
+        })
+    return companies
+
+
+def make_sessions(companies, n, seed=7):
+    """Keystroke prefixes of company names and cities, as a user types them"""
+    rng = random.Random(seed)
+    sessions = []
+    for _ in range(n):
+        target = rng.choice(companies)
+        text = target["name"] if rng.random() < 0.8 else target["location"]
+        sessions.append([text[:length] for length in range(1, len(text) + 1)
+                         if text[length - 1] != " "])
+    return sessions
+
+
+def regex_scan(companies, search):
+    """Previous $or of name/location regex and exact tag, over every document"""
+    pattern = re.compile(search, re.IGNORECASE)
+    return [c["_id"] for c in companies
+            if pattern.search(c["name"]) or search in c["tags"] or pattern.search(c["location"])]
+
+
+def time_queries(search_fn, sessions):
+    latencies = []
+    for session in sessions:
+        for query in session:
+            start = time.perf_counter()
+            search_fn(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(label, latencies):
+    ordered = sorted(latencies)
+    p95 = ordered[int(0.95 * (len(ordered) - 1))]
+    print(f"  {label:<22} p50 {statistics.median(ordered):8.3f} ms   "
+          f"p95 {p95:8.3f} ms   mean {statistics.fmean(ordered):8.3f} ms")
+    return statistics.median(ordered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--mongo-uri", help="time the $regex baseline against a real MongoDB server")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        companies = make_companies(size)
+        sessions = make_sessions(companies, args.sessions)
+        keystrokes = sum(len(session) for session in sessions)
+        print(f"{size} companies, {keystrokes} keystrokes")
+
+        if args.mongo_uri:
+            from pymongo import MongoClient
+            collection = MongoClient(args.mongo_uri)["placify-benchmark"]["companies"]
+            collection.drop()
+            collection.insert_many(companies)
+
+            def baseline(search):
+                return list(collection.find({"$or": [
+                    {"name": {"$regex": re.escape(search), "$options": "i"}},
+                    {"tags": {"$in": [search]}},
+                    {"location": {"$regex": re.escape(search), "$options": "i"}}
+                ]}, {"_id": 1}))
+            label = "$regex (server)"
+        else:
+            def baseline(search):
+                return regex_scan(companies, re.escape(search))
+            label = "$regex scan"
+
+        start = time.perf_counter()
+        index = SearchIndex(WEIGHTS).build(companies, "_id", "name")
+        print(f"  index build            {(time.perf_counter() - start) * 1000:8.1f} ms "
+              f"({len(index.vocabulary)} terms)")
+
+        scan = summarize(label, time_queries(baseline, sessions))
+        # First page of 20, as /companies?search= asks for
+        indexed = summarize("prefix index", time_queries(
+            lambda search: index.rank(search, 20), sessions))
+        print(f"  median speedup         {scan / indexed:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: dense cosine matrix clustering vs sparse neighbor clustering.
+
+The dense path is the previous cluster_questions core: cosine_similarity(X)
+followed by a Python double loop. It needs n * n * 8 bytes, so it is
+skipped above --dense-limit questions. Where both run, the clusters are
+checked to be identical.
+
+Usage (from backend/):
+    python benchmarks/bench_question_clustering.py [--sizes 1000 10000 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes.analysis import clean_text  # noqa: E402
+from services.question_clustering import (  # noqa: E402
+    similarity_neighbors,
+    greedy_threshold_clusters
+)
+
+THRESHOLD = 0.65
+
+
+def make_questions(n, seed=42):
+    """Unique questions built from topic vocabularies, with near-duplicate rewordings"""
+    rng = random.Random(seed)
+    topics = [[f"term{t}x{w}" for w in range(40)] for t in range(max(10, n // 50))]
+    openers = ["explain", "what is", "describe", "how does", "write code for", "difference between"]
+    questions = []
+    seen = set()
+    while len(questions) < n:
+        if questions and rng.random() < 0.3:
+            # Reword an existing question by swapping one word
+            words = rng.choice(questions).split()
+            words[rng.randrange(len(words))] = rng.choice(rng.choice(topics))
+            question = " ".join(words)
+        else:
+            vocabulary = rng.choice(topics)
+            question = f"{rng.choice(openers)} {' '.join(rng.sample(vocabulary, rng.randint(4, 9)))}"
+        if question not in seen:
+            seen.add(question)
+            questions.append(question)
+    return questions
+
+
+def dense_clusters(X):
+    sim_matrix = cosine_similarity(X)
+    n = X.shape[0]
+    clusters = []
+    assigned = [False] * n
+    for i in range(n):
+        if assigned[i]:
+            continue
+        members = [i]
+        assigned[i] = True
+        for j in range(i + 1, n):
+            if not assigned[j] and sim_matrix[i, j] >= THRESHOLD:
+                members.append(j)
+                assigned[j] = True
+        clusters.append(members)
+    return clusters
+
+
+def sparse_clusters(X):
+    return greedy_threshold_clusters(similarity_neighbors(X, THRESHOLD))
+
+
+def timed(fn, X):
+    start = time.perf_counter()
+    result = fn(X)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 50000])
+    parser.add_argument("--dense-limit", type=int, default=12000,
+                        help="largest size to run the dense matrix for")
+    args = parser.parse_args()
+
+    print(f"{'questions':>10} {'clusters':>9} {'dense (s)':>10} {'sparse (s)':>11} {'speedup':>9}")
+    for n in args.sizes:
+        questions = make_questions(n)
+        X = TfidfVectorizer(ngram_range=(1, 2), stop_words="english").fit_transform(
+            [clean_text(q) for q in questions])
+
+        sparse_result, sparse_time = timed(sparse_clusters, X)
+
+        if n <= args.dense_limit:
+            dense_result, dense_time = timed(dense_clusters, X)
+            assert dense_result == sparse_result, f"clusters differ at n={n}"
+            dense_col = f"{dense_time:>10.2f}"
+            speedup = f"{dense_time / sparse_time:>8.1f}x"
+        else:
+            dense_col = f"{'skipped':>10}"
+            speedup = f"({n * n * 8 / 1e9:.0f} GB)"
+
+        print(f"{n:>10} {len(sparse_result):>9} {dense_col} {sparse_time:>11.2f} {speedup:>9}")
+
+    print("Skipped dense runs show the similarity matrix size they would need.")
+
+
+if __name__ == "__main__":
+    main()
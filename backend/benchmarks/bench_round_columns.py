@@ -0,0 +1,170 @@
+"""
+Benchmark: iterrows based round analysis vs the single-pass round columns.
+
+Times the roundsData consumers of the insights page (round difficulty and
+topics, difficulty analysis, question extraction and the difficulty chart)
+on synthetic experiences, and checks both paths give the same result.
+
+Usage (from backend/):
+    python benchmarks/bench_round_columns.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes.analysis import (  # noqa: E402
+    extract_round_columns,
+    generate_rounds_analysis,
+    generate_difficulty_analysis,
+    extract_questions_from_round,
+    generate_charts
+)
+
+ROUNDS = ["aptitude", "coding", "technical", "hr"]
+QUESTION_KEYS = {"aptitude": "sampleQuestions", "coding": "top3Questions",
+                 "technical": "top5Questions", "hr": "topQuestions"}
+
+
+def make_frame(n, seed=42):
+    """Synthetic experiences shaped like the submission form"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        selected = rng.sample(ROUNDS, rng.randint(1, 4))
+        rounds_data = {}
+        for round_name in selected:
+            round_data = {
+                "difficulty": rng.choice(["Easy", "Medium", "Hard"]),
+                QUESTION_KEYS[round_name]: [
+                    {"question": f"{round_name} question {rng.randint(0, 200)}"}
+                    for _ in range(rng.randint(0, 3))
+                ]
+            }
+            if round_name == "technical":
+                round_data["focusTopics"] = rng.sample(
+                    ["DBMS", "OS", "OOP", "Networks", "DSA"], 2)
+            if round_name == "coding":
+                round_data["languagesUsed"] = rng.sample(
+                    ["Python", "Java", "C++"], 1)
+            rounds_data[round_name] = round_data
+        rows.append({
+            "experienceId": str(i),
+            "companyName": "Benchmark Co",
+            "jobRole": rng.choice(["SDE", "Analyst", "Intern"]),
+            "status": rng.choice(["Selected", "Rejected", "Pending"]),
+            "overallRating": rng.randint(1, 5),
+            "selectedRounds": selected,
+            "roundsData": rounds_data,
+            "experienceSummary": "",
+            "createdAt": None
+        })
+    return pd.DataFrame(rows)
+
+
+# ------------------------- previous iterrows implementation -------------------------
+
+def legacy_round_difficulty(df, round_name):
+    difficulties = []
+    for _, exp in df.iterrows():
+        round_data = exp["roundsData"].get(round_name, {})
+        if "difficulty" in round_data:
+            difficulties.append(round_data["difficulty"])
+    if not difficulties:
+        return "Unknown"
+    return Counter(difficulties).most_common(1)[0][0]
+
+
+def legacy_round_topics(df, round_name):
+    all_topics = []
+    for _, exp in df.iterrows():
+        round_data = exp["roundsData"].get(round_name, {})
+        if round_name == "technical" and "focusTopics" in round_data:
+            all_topics.extend(round_data["focusTopics"])
+        elif round_name == "coding" and "languagesUsed" in round_data:
+            all_topics.extend(round_data["languagesUsed"])
+    return [{"topic": str(t), "frequency": int(c)} for t, c in Counter(all_topics).most_common(5)]
+
+
+def legacy_difficulty_analysis(df):
+    scores = {"Easy": 1, "Medium": 2, "Hard": 3}
+    round_difficulties = {}
+    for _, exp in df.iterrows():
+        for round_name, round_data in exp["roundsData"].items():
+            if "difficulty" in round_data:
+                round_difficulties.setdefault(round_name, []).append(
+                    scores.get(round_data["difficulty"], 2))
+    return {name: float(round(float(np.mean(values)), 1)) for name, values in round_difficulties.items()}
+
+
+def legacy_questions(df, round_type):
+    questions = []
+    for _, exp in df.iterrows():
+        round_data = exp["roundsData"].get(round_type, {})
+        for q in round_data.get(QUESTION_KEYS[round_type], []):
+            if "question" in q and q["question"]:
+                questions.append(q["question"])
+    return questions
+
+
+def legacy_chart_difficulty(df):
+    difficulty_data = {}
+    for _, exp in df.iterrows():
+        for round_name, round_data in exp["roundsData"].items():
+            if "difficulty" in round_data:
+                difficulty_data.setdefault(round_name, Counter())[
+                    round_data["difficulty"]] += 1
+    return {name: {str(k): int(v) for k, v in counter.items()} for name, counter in difficulty_data.items()}
+
+
+def run_legacy(df):
+    rounds_counter = Counter()
+    for rounds in df["selectedRounds"]:
+        rounds_counter.update(rounds)
+    rounds = {name: (legacy_round_difficulty(df, name), legacy_round_topics(df, name))
+              for name, _ in rounds_counter.most_common()}
+    questions = {r: legacy_questions(df, r) for r in ROUNDS}
+    return rounds, legacy_difficulty_analysis(df), questions, legacy_chart_difficulty(df)
+
+
+def run_columns(df):
+    columns = extract_round_columns(df)
+    rounds = {name: (data["difficulty"], data["commonTopics"])
+              for name, data in generate_rounds_analysis(df, columns).items()}
+    difficulty = {name: data["averageDifficulty"]
+                  for name, data in generate_difficulty_analysis(columns).items()}
+    questions = {r: extract_questions_from_round(columns, r) for r in ROUNDS}
+    charts = generate_charts(df, columns, "Benchmark Co")["difficultyByRound"]
+    return rounds, difficulty, questions, charts
+
+
+def timed(fn, df):
+    start = time.perf_counter()
+    result = fn(df)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'experiences':>12} {'iterrows (s)':>14} {'columns (s)':>12} {'speedup':>9}")
+    for n in args.sizes:
+        df = make_frame(n)
+        legacy_result, legacy_time = timed(run_legacy, df)
+        columns_result, columns_time = timed(run_columns, df)
+        assert legacy_result == columns_result, f"results differ at n={n}"
+        print(f"{n:>12} {legacy_time:>14.3f} {columns_time:>12.3f} {legacy_time / columns_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
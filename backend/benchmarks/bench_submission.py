@@ -0,0 +1,153 @@
+"""
+Benchmark: per-counter company updates vs one combined $inc on submission.
+
+Replays the company analytics writes of synthetic submissions through the
+previous update_company_analytics (one update_one per counter) and the
+current one (a single update_one). By default the writes go to an
+in-process collection that sleeps --rtt-ms per call to model the network
+round trip; pass --mongo-uri to time against a real server instead. The
+resulting company counters are checked to be identical.
+
+Usage (from backend/):
+    python benchmarks/bench_submission.py [--submissions 500] [--rtt-ms 1.0]
+    python benchmarks/bench_submission.py --mongo-uri mongodb://localhost:27017
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routes.experiences import update_company_analytics  # noqa: E402
+
+ROUNDS = ["aptitude", "coding", "technical", "hr", "group discussion"]
+
+
+class LatencyCollection:
+    """Just enough of a pymongo collection for $inc updates, with a fixed round trip"""
+
+    def __init__(self, rtt):
+        self.rtt = rtt
+        self.calls = 0
+        self.documents = {}
+
+    def update_one(self, query, update):
+        self.calls += 1
+        time.sleep(self.rtt)
+        document = self.documents.setdefault(query["companyId"], Counter())
+        document.update(update["$inc"])
+
+    def counters(self, company_id):
+        return dict(self.documents.get(company_id, {}))
+
+    def reset(self, company_id):
+        self.documents.pop(company_id, None)
+        self.calls = 0
+
+
+class MongoCollection:
+    """Real server, counters read back as flat dotted paths"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = 0
+
+    def update_one(self, query, update):
+        self.calls += 1
+        self.collection.update_one(query, update)
+
+    def counters(self, company_id):
+        def flatten(node, prefix=""):
+            for key, value in node.items():
+                if isinstance(value, dict):
+                    yield from flatten(value, f"{prefix}{key}.")
+                else:
+                    yield f"{prefix}{key}", value
+        document = self.collection.find_one({"companyId": company_id}, {"_id": 0, "companyId": 0})
+        return dict(flatten(document or {}))
+
+    def reset(self, company_id):
+        self.collection.replace_one({"companyId": company_id},
+                                    {"companyId": company_id}, upsert=True)
+        self.calls = 0
+
+
+class FakeDb:
+    def __init__(self, companies):
+        self.companies = companies
+
+
+def legacy_update_company_analytics(db, company_id, selected_rounds, rounds_data):
+    """Previous implementation, one update_one per counter"""
+    db.companies.update_one(
+        {"companyId": company_id},
+        {"$inc": {"experienceCount": 1, "experienceVersion": 1}}
+    )
+    for round_name in selected_rounds:
+        round_key = f"roundsAnalytics.{round_name.lower().replace(' ', '')}.count"
+        db.companies.update_one({"companyId": company_id}, {"$inc": {round_key: 1}})
+        if round_name in rounds_data:
+            round_data = rounds_data[round_name]
+            if "difficulty" in round_data:
+                difficulty_key = f"roundsAnalytics.{round_name.lower().replace(' ', '')}.difficulty.{round_data['difficulty'].lower()}"
+                db.companies.update_one({"companyId": company_id}, {"$inc": {difficulty_key: 1}})
+
+
+def make_submissions(n, seed=42):
+    rng = random.Random(seed)
+    submissions = []
+    for _ in range(n):
+        selected = rng.sample(ROUNDS, rng.randint(1, len(ROUNDS)))
+        rounds_data = {name: {"difficulty": rng.choice(["Easy", "Medium", "Hard"])}
+                       for name in selected if rng.random() < 0.8}
+        submissions.append((selected, rounds_data))
+    return submissions
+
+
+def run(update_fn, collection, submissions, company_id):
+    collection.reset(company_id)
+    db = FakeDb(collection)
+    start = time.perf_counter()
+    for selected, rounds_data in submissions:
+        update_fn(db, company_id, selected, rounds_data)
+    elapsed = time.perf_counter() - start
+    return collection.counters(company_id), collection.calls, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--submissions", type=int, default=500)
+    parser.add_argument("--rtt-ms", type=float, default=1.0,
+                        help="simulated round trip per write, ignored with --mongo-uri")
+    parser.add_argument("--mongo-uri", help="time against a real MongoDB server")
+    args = parser.parse_args()
+
+    if args.mongo_uri:
+        from pymongo import MongoClient
+        collection = MongoCollection(
+            MongoClient(args.mongo_uri)["placify-benchmark"]["companies"])
+        target = args.mongo_uri
+    else:
+        collection = LatencyCollection(args.rtt_ms / 1000)
+        target = f"simulated {args.rtt_ms} ms round trip"
+
+    submissions = make_submissions(args.submissions)
+    legacy_counters, legacy_calls, legacy_time = run(
+        legacy_update_company_analytics, collection, submissions, "bench-legacy")
+    combined_counters, combined_calls, combined_time = run(
+        update_company_analytics, collection, submissions, "bench-combined")
+    assert legacy_counters == combined_counters, "company counters differ"
+
+    n = len(submissions)
+    print(f"{n} submissions, {target}")
+    print(f"{'':>10} {'writes':>8} {'per submission':>15} {'total (s)':>10} {'ms/submission':>14}")
+    print(f"{'per-key':>10} {legacy_calls:>8} {legacy_calls / n:>15.1f} {legacy_time:>10.3f} {legacy_time / n * 1000:>14.2f}")
+    print(f"{'combined':>10} {combined_calls:>8} {combined_calls / n:>15.1f} {combined_time:>10.3f} {combined_time / n * 1000:>14.2f}")
+    print(f"speedup {legacy_time / combined_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
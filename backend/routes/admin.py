@@ -2,31 +2,112 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson.objectid import ObjectId
 from datetime import datetime
+import hashlib
+import json
 import uuid
-from .auth import create_initial_super_admin
+from .auth import create_initial_super_admin, is_super_admin, is_sub_admin
+from .experiences import bump_experience_version
+from .companies import company_search
+from .analysis import materialize_company_insights
+from services.insights_aggregator import InsightsAggregator, AGGREGATE_FIELDS, event_snapshot
+from services.index_registry import index_registry
+from services.job_queue import job_queue
+from services.pagination import keyset_page, cursor_pagination
+from services.count_cache import count_cache
+from services.student_search import SEARCH_FIELD, student_search_filter
+from services.experience_search import ExperienceSearchIndex
+from services.database import database
+from services.identity_cache import identity_cache
 
 admin_bp = Blueprint("admin", __name__)
 
+# Moderation queue, newest pending first
+index_registry.declare(admin_bp.name, "experiences",
+                       [("isVerified", 1), ("createdAt", -1)])
+# Student directory, newest first with _id as the cursor tie-breaker, on
+# its own or within a department
+index_registry.declare(admin_bp.name, "students",
+                       [("createdAt", -1), ("_id", -1)])
+index_registry.declare(admin_bp.name, "students",
+                       [("branch", 1), ("createdAt", -1), ("_id", -1)])
+# Prefix search on the lowercase token shadow field, optionally per department
+index_registry.declare(admin_bp.name, "students", [SEARCH_FIELD])
+index_registry.declare(admin_bp.name, "students", ["branch", SEARCH_FIELD])
+
+STUDENT_LIST_SORT = [("createdAt", -1), ("_id", -1)]
+
+# Attempts at recording a moderation before giving up on concurrent ones
+MODERATION_ATTEMPTS = 5
+
+
+def moderate_experience(db, object_id, fields, changes):
+    """Set moderation fields and record the change as the experience's next event
+
+    The event (its number, the pre-change snapshot and `changes`) is pushed
+    in the same update, guarded on the event number read, so concurrent
+    moderations are numbered in the order they were applied. Returns the
+    pre-change experience, or None when it does not exist.
+    """
+    for _ in range(MODERATION_ATTEMPTS):
+        experience = db.experiences.find_one(
+            {"_id": object_id}, {**AGGREGATE_FIELDS, "experienceId": 1, "eventSeq": 1})
+        if not experience:
+            return None
+
+        seq = experience.get("eventSeq", 0) + 1
+        result = db.experiences.update_one(
+            {"_id": object_id, "eventSeq": experience.get("eventSeq")},
+            {"$set": {**fields, "eventSeq": seq},
+             "$push": {"pendingEvents": {
+                 "seq": seq, "before": event_snapshot(experience), "changes": changes}}}
+        )
+        if result.matched_count:
+            return experience
+
+    raise RuntimeError(f"Experience {object_id} kept changing during moderation")
+
+
+def handle_experience_moderated(db, payload):
+    """Background job: apply a moderated experience's pending events to the insights
+
+    Jobs are delivered at least once. A redelivery that applies nothing new
+    leaves the company version and its materialized insights alone.
+    """
+    if "experience" in payload:
+        # Queued before events were recorded on the experience, the payload
+        # itself identifies the event
+        experience = payload["experience"]
+        digest = hashlib.sha1(
+            json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        applied = InsightsAggregator(db).replace_experience(
+            experience, {**experience, **payload["changes"]},
+            event_id=f"{experience.get('experienceId')}:moderated:{digest}")
+    else:
+        experience, applied = InsightsAggregator(db).apply_pending(payload["experienceId"])
+    if experience is None:
+        return
 
-def is_sub_admin(email):
-    """Check if user is sub admin"""
+    # Setting the moderated fields is idempotent, it runs on every delivery
     try:
-        db = current_app.config["MONGO_DB"]
-        admin = db.admins.find_one({"email": email, "role": "sub_admin"})
-        return admin is not None
+        ExperienceSearchIndex(db).update_experience(
+            experience.get("experienceId"), payload["changes"])
     except Exception as e:
-        current_app.logger.error(f"Sub admin check error: {str(e)}")
-        return False
+        current_app.logger.error(f"Experience search update error: {str(e)}")
 
-def is_super_admin(email):
-    """Check if user is super admin"""
+    if not applied:
+        return
+    bump_experience_version(db, experience.get("companyId"))
+
+    # Public insights reads are served from this materialization
     try:
-        db = current_app.config["MONGO_DB"]
-        admin = db.admins.find_one({"email": email, "role": "super_admin"})
-        return admin is not None
+        materialize_company_insights(db, experience.get("companyId"))
     except Exception as e:
-        current_app.logger.error(f"Super admin check error: {str(e)}")
-        return False
+        current_app.logger.error(f"Materialize insights error: {str(e)}")
+
+
+job_queue.register("experience.verified", handle_experience_moderated)
+job_queue.register("experience.rejected", handle_experience_moderated)
+
 
 # ========================= SUPER ADMIN ROUTES =========================
 
@@ -83,6 +164,7 @@ def create_sub_admin():
         }
 
         db.admins.insert_one(sub_admin_data)
+        identity_cache.invalidate(student_email)
 
         # Update student record to mark as sub admin
         db.students.update_one(
@@ -120,6 +202,7 @@ def remove_sub_admin(student_email):
         # Remove from admins collection
         result = db.admins.delete_one(
             {"email": student_email, "role": "sub_admin"})
+        identity_cache.invalidate(student_email)
 
         if result.deleted_count == 0:
             return jsonify({"success": False, "message": "Sub admin not found"}), 404
@@ -170,16 +253,36 @@ def get_all_students():
         if department:
             query["branch"] = department
         if search:
-            query["$or"] = [
-                {"name": {"$regex": search, "$options": "i"}},
-                {"studentId": {"$regex": search, "$options": "i"}},
-                {"email": {"$regex": search, "$options": "i"}}
-            ]
-
-        # Get students
-        students_cursor = db.students.find(query).sort(
-            "createdAt", -1).skip(skip).limit(limit)
-        total_students = db.students.count_documents(query)
+            # Anchored prefixes on the lowercase token shadow field use its
+            # index, unlike case-insensitive regexes over name/studentId/email
+            query.update(student_search_filter(search))
+
+        # ?after=<cursor> seeks on (createdAt, _id) instead of skipping, and
+        # only counts the total with ?total=true
+        after = request.args.get('after')
+        if after is not None:
+            try:
+                students_cursor, next_cursor = keyset_page(
+                    db.students, query, STUDENT_LIST_SORT, limit, after)
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+            pagination = cursor_pagination(limit, next_cursor)
+            if request.args.get('total') == 'true':
+                pagination["total"], pagination["totalEstimated"] = \
+                    count_cache.count(db.students, query)
+        else:
+            # Get students
+            students_cursor = db.students.find(query).sort(
+                "createdAt", -1).skip(skip).limit(limit)
+            # Cached or estimated, a full count per page turn costs as much as the page
+            total_students, total_estimated = count_cache.count(db.students, query)
+            pagination = {
+                "page": page,
+                "limit": limit,
+                "total": total_students,
+                "pages": (total_students + limit - 1) // limit,
+                "totalEstimated": total_estimated
+            }
 
         students = []
         for student in students_cursor:
@@ -206,12 +309,7 @@ def get_all_students():
             "success": True,
             "students": students,
             "departments": departments,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total": total_students,
-                "pages": (total_students + limit - 1) // limit
-            }
+            "pagination": pagination
         }), 200
 
     except Exception as e:
@@ -254,6 +352,25 @@ def get_all_sub_admins():
         current_app.logger.error(f"Get sub admins error: {str(e)}")
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
+@admin_bp.route("/super-admin/system/db-pool", methods=["GET"])
+@jwt_required()
+def get_db_pool_stats():
+    """Connection pool settings and counters of this worker process"""
+    try:
+        current_user = get_jwt_identity()
+
+        if not is_super_admin(current_user):
+            return jsonify({"success": False, "message": "Super admin access required"}), 403
+
+        return jsonify({
+            "success": True,
+            "database": database.stats()
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Get db pool stats error: {str(e)}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
 # ========================= SUB ADMIN ROUTES =========================
 
 
@@ -320,6 +437,8 @@ def create_company():
         }
 
         db.companies.insert_one(company_data)
+        count_cache.invalidate("companies")
+        company_search.invalidate()
 
         return jsonify({
             "success": True,
@@ -393,26 +512,22 @@ def verify_experience(experience_id):
 
         db = current_app.config["MONGO_DB"]
 
-        # Verify the experience exists
-        experience = db.experiences.find_one({"_id": ObjectId(experience_id)})
+        # Verify the experience
+        changes = {"isVerified": True}
+        experience = moderate_experience(db, ObjectId(experience_id), {
+            **changes,
+            "verified_by": current_user,
+            "verified_at": datetime.utcnow(),
+            "updatedAt": datetime.utcnow()
+        }, changes)
+
         if not experience:
             return jsonify({"success": False, "message": "Experience not found"}), 404
 
-        # Verify the experience
-        result = db.experiences.update_one(
-            {"_id": ObjectId(experience_id)},
-            {
-                "$set": {
-                    "isVerified": True,
-                    "verified_by": current_user,
-                    "verified_at": datetime.utcnow(),
-                    "updatedAt": datetime.utcnow()
-                }
-            }
-        )
-
-        if result.modified_count == 0:
-            return jsonify({"success": False, "message": "Experience verification failed"}), 400
+        job_queue.enqueue("experience.verified", {
+            "experienceId": experience.get("experienceId"),
+            "changes": changes
+        })
 
         return jsonify({
             "success": True,
@@ -439,22 +554,23 @@ def reject_experience(experience_id):
         rejection_reason = data.get("rejection_reason", "")
 
         # Reject the experience
-        result = db.experiences.update_one(
-            {"_id": ObjectId(experience_id)},
-            {
-                "$set": {
-                    "status": "Rejected",
-                    "rejected_by": current_user,
-                    "rejected_at": datetime.utcnow(),
-                    "rejection_reason": rejection_reason,
-                    "updatedAt": datetime.utcnow()
-                }
-            }
-        )
+        changes = {"status": "Rejected"}
+        experience = moderate_experience(db, ObjectId(experience_id), {
+            **changes,
+            "rejected_by": current_user,
+            "rejected_at": datetime.utcnow(),
+            "rejection_reason": rejection_reason,
+            "updatedAt": datetime.utcnow()
+        }, changes)
 
-        if result.modified_count == 0:
+        if not experience:
             return jsonify({"success": False, "message": "Experience not found"}), 404
 
+        job_queue.enqueue("experience.rejected", {
+            "experienceId": experience.get("experienceId"),
+            "changes": changes
+        })
+
         return jsonify({
             "success": True,
             "message": "Experience rejected successfully"
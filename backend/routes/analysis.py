@@ -1,25 +1,67 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import io
 import base64
 import matplotlib.pyplot as plt
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
-from bson.objectid import ObjectId
 from collections import Counter
 import re
+import time
 import pandas as pd
 import numpy as np
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import matplotlib
 import seaborn as sns
 from wordcloud import WordCloud
 import base64
 from io import BytesIO
+from pymongo.errors import DuplicateKeyError
+from services.insights_aggregator import (
+    InsightsAggregator,
+    DIFFICULTY_SCORES,
+    TOPIC_FIELDS,
+    get_difficulty_level
+)
+from services.question_clustering import (
+    VECTORIZER_OPTIONS,
+    clean_text,
+    similarity_neighbors,
+    greedy_threshold_clusters
+)
+from services.question_store import QuestionVectorStore
+from services.index_registry import index_registry
+from services.company_resolver import company_resolver
+from services.database import analytics_db
+from services.job_queue import job_queue
 matplotlib.use('Agg')  # Use non-interactive backend
 
 analysis_bp = Blueprint("analysis", __name__)
 
+# One running aggregate, materialized insights document and question store
+# header per company (and round type); the store's questions, clusters and
+# vocabulary terms are one document each
+index_registry.declare(analysis_bp.name, "company_aggregates",
+                       ["companyId"], unique=True)
+index_registry.declare(analysis_bp.name, "question_vectors",
+                       ["companyId", "roundType"], unique=True)
+index_registry.declare(analysis_bp.name, "question_entries",
+                       ["companyId", "roundType", "questionHash"], unique=True)
+index_registry.declare(analysis_bp.name, "question_entries",
+                       ["companyId", "roundType", "seq"])
+index_registry.declare(analysis_bp.name, "question_entries",
+                       ["companyId", "roundType", ("count", -1), "seq"])
+index_registry.declare(analysis_bp.name, "question_clusters",
+                       ["companyId", "roundType", "generation", "terms"])
+index_registry.declare(analysis_bp.name, "question_clusters",
+                       ["companyId", "roundType", "generation", ("size", -1), "clusterId"])
+index_registry.declare(analysis_bp.name, "question_terms",
+                       ["companyId", "roundType", "generation", "term"])
+index_registry.declare(analysis_bp.name, "company_insights",
+                       ["companyId"], unique=True)
+
+# A queued insights refresh not started within this long is assumed lost
+INSIGHTS_REFRESH_TIMEOUT = timedelta(minutes=10)
+
 
 def convert_numpy_types(obj):
     """
@@ -46,6 +88,138 @@ def convert_numpy_types(obj):
     else:
         return obj
 
+# ========================= ROUND COLUMNS =========================
+
+
+# Question list field for each round type
+QUESTION_KEYS = {
+    "aptitude": "sampleQuestions",
+    "coding": "top3Questions",
+    "technical": "top5Questions",
+    "hr": "topQuestions"
+}
+
+# Experience fields read by generate_company_stats
+COMPANY_STATS_FIELDS = ("compensation", "status", "createdAt")
+
+# Experience fields read by generate_rounds_analytics_data
+ROUNDS_ANALYTICS_FIELDS = (
+    "companyName", "jobRole", "status", "overallRating", "selectedRounds",
+    "roundsData", "experienceSummary", "createdAt"
+)
+
+
+def parse_time_limit(time_val):
+    """Extract minutes from values like 60, 45.0 or "60 minutes" """
+    if isinstance(time_val, (int, float)):
+        return float(time_val)
+    elif isinstance(time_val, str):
+        numbers = re.findall(r'\d+', time_val)
+        if numbers:
+            return float(numbers[0])
+    return np.nan
+
+
+def extract_round_columns(df):
+    """
+    Flatten the nested roundsData of every experience in a single pass.
+
+    Returns three DataFrames, each keyed by the experience's row position
+    ("exp") and round name, that the generators filter and group instead of
+    walking roundsData again:
+      rounds    - one row per round dict: difficulty, time limit, question count, feedback
+      topics    - one row per focusTopics / languagesUsed entry
+      questions - one row per item of the round's question list
+    """
+    rounds = {"exp": [], "round": [], "selected": [], "hasDifficulty": [], "difficulty": [],
+              "timeLimit": [], "questionCount": [], "feedback": []}
+    topics = {"exp": [], "round": [], "selected": [], "topic": []}
+    questions = {"exp": [], "round": [], "selected": [], "item": [], "text": [], "hasQuestion": []}
+
+    for exp, (rounds_data, selected_rounds) in enumerate(zip(df["roundsData"], df["selectedRounds"])):
+        if not isinstance(rounds_data, dict):
+            continue
+        for round_name, round_data in rounds_data.items():
+            if not isinstance(round_data, dict):
+                continue
+            selected = isinstance(
+                selected_rounds, list) and round_name in selected_rounds
+
+            question_list = round_data.get(QUESTION_KEYS.get(round_name))
+            if not isinstance(question_list, list):
+                question_list = []
+
+            rounds["exp"].append(exp)
+            rounds["round"].append(round_name)
+            rounds["selected"].append(selected)
+            rounds["hasDifficulty"].append("difficulty" in round_data)
+            rounds["difficulty"].append(round_data.get("difficulty"))
+            rounds["timeLimit"].append(parse_time_limit(
+                round_data["timeLimit"]) if "timeLimit" in round_data else np.nan)
+            rounds["questionCount"].append(len(question_list))
+            rounds["feedback"].append(
+                str(round_data["feedback"]) if "feedback" in round_data else None)
+
+            topic_list = round_data.get(TOPIC_FIELDS.get(round_name))
+            if isinstance(topic_list, list):
+                for topic in topic_list:
+                    topics["exp"].append(exp)
+                    topics["round"].append(round_name)
+                    topics["selected"].append(selected)
+                    topics["topic"].append(topic)
+
+            for q in question_list:
+                has_question = isinstance(q, dict) and "question" in q
+                questions["exp"].append(exp)
+                questions["round"].append(round_name)
+                questions["selected"].append(selected)
+                questions["item"].append(q)
+                questions["text"].append(q["question"] if has_question else None)
+                questions["hasQuestion"].append(has_question)
+
+    def frame(columns, bool_columns):
+        data = {name: (np.array(values, dtype=bool) if name in bool_columns else
+                       np.array(values, dtype=np.int64) if name == "exp" else
+                       pd.Series(values, dtype=float if name == "timeLimit" else object))
+                for name, values in columns.items()}
+        return pd.DataFrame(data)
+
+    return {
+        "rounds": frame(rounds, {"selected", "hasDifficulty"}),
+        "topics": frame(topics, {"selected"}),
+        "questions": frame(questions, {"selected", "hasQuestion"})
+    }
+
+
+def ranked_counts(series):
+    """value_counts ordered like Counter.most_common - ties keep first-seen order"""
+    return series.value_counts(sort=False, dropna=False).sort_values(ascending=False, kind="stable")
+
+
+def rated_rounds(columns):
+    """Round rows that carry a difficulty, with its numeric score"""
+    rounds = columns["rounds"]
+    rated = rounds[rounds["hasDifficulty"]].copy()
+    rated["score"] = rated["difficulty"].map(
+        DIFFICULTY_SCORES).fillna(2).astype(float)
+    return rated
+
+
+def aptitude_topic_labels(texts, math_terms):
+    """Label aptitude question texts as Interest / Percentage / Basic Math topics"""
+    texts = texts.astype(str).str.lower()
+    is_math = np.zeros(len(texts), dtype=bool)
+    for term in math_terms:
+        is_math |= texts.str.contains(term, regex=False).to_numpy()
+    labels = np.select(
+        [texts.str.contains("interest", regex=False).to_numpy(),
+         texts.str.contains("percentage", regex=False).to_numpy(),
+         is_math],
+        ["Interest Calculation", "Percentage", "Basic Math"],
+        default=""
+    )
+    return pd.Series(labels, index=texts.index)
+
 # ========================= ANALYZE COMPANY EXPERIENCES =========================
 
 
@@ -53,17 +227,14 @@ def convert_numpy_types(obj):
 def analyze_company_experiences(company_id):
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
         # Get experiences for the company
-        query = {
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        }
+        query = {"companyId": company_id}
 
-        experiences_cursor = db.experiences.find(query)
+        # Full-history scan, served by a secondary when one is available
+        experiences_cursor = analytics_db(db).experiences.find(
+            query, merge_projections(*insights_projection(INSIGHTS_SECTIONS)))
         experiences = list(experiences_cursor)
 
         if not experiences:
@@ -77,16 +248,23 @@ def analyze_company_experiences(company_id):
         company_name = company.get(
             "name", "Unknown Company") if company else "Unknown Company"
 
+        # Per-stage timings are opt-in for profiling
+        timings = {} if request.args.get("timings") == "true" else None
+
         # Analyze the experiences
         analysis_results = analyze_experiences_data(
-            experiences, company_name, company_id)
+            experiences, company_name, company_id, timings=timings)
 
-        return jsonify({
+        response = {
             "success": True,
             "analysis": convert_numpy_types(analysis_results),
             "companyName": company_name,
             "totalExperiences": len(experiences)
-        }), 200
+        }
+        if timings is not None:
+            response["stageTimings"] = timings
+
+        return jsonify(response), 200
 
     except Exception as e:
         current_app.logger.error(
@@ -94,8 +272,14 @@ def analyze_company_experiences(company_id):
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
 
-def analyze_experiences_data(experiences, company_name, company_id):
-    """Analyze experiences data and generate insights"""
+def analyze_experiences_data(experiences, company_name, company_id, summary=None, top_questions=None, timings=None):
+    """Analyze experiences data and generate insights
+
+    `summary` takes the numeric sections from InsightsAggregator.summary so
+    they are not recomputed from the DataFrame, and `top_questions` the
+    stored clusters from QuestionVectorStore.top_questions. `timings`, when
+    a dict, is filled with milliseconds spent in each pipeline stage.
+    """
 
     # Convert to DataFrame for analysis
     df_data = []
@@ -115,18 +299,22 @@ def analyze_experiences_data(experiences, company_name, company_id):
 
     df = pd.DataFrame(df_data)
 
+    # Precomputed sections are seeded as inputs so their stages never run
+    inputs = {"df": df, "companyName": company_name}
+    if summary is not None:
+        inputs.update({stage: summary[stage] for stage in SUMMARY_STAGES})
+    if top_questions is not None:
+        inputs["topQuestions"] = top_questions
+
+    results = run_insights_stages(inputs, INSIGHTS_SECTIONS, timings)
+
     # Generate insights
     insights = {
         "companyName": company_name,
-        "analysisDate": datetime.utcnow().isoformat(),
-        "overallStats": generate_overall_stats(df),
-        "roundsAnalysis": generate_rounds_analysis(df),
-        "difficultyAnalysis": generate_difficulty_analysis(df),
-        "topQuestions": generate_top_questions(df),
-        "successPatterns": generate_success_patterns(df),
-        "preparationTips": generate_preparation_tips(df),
-        "charts": generate_charts(df, company_name)
+        "analysisDate": datetime.utcnow().isoformat()
     }
+    insights.update({section: results[section]
+                    for section in INSIGHTS_SECTIONS})
 
     return convert_numpy_types(insights)
 
@@ -159,7 +347,7 @@ def generate_overall_stats(df):
     }
 
 
-def generate_rounds_analysis(df):
+def generate_rounds_analysis(df, columns):
     """Analyze rounds data"""
     rounds_counter = Counter()
     for rounds in df["selectedRounds"]:
@@ -170,63 +358,46 @@ def generate_rounds_analysis(df):
         round_data = {
             "frequency": int(count),
             "percentage": float(round((count / len(df)) * 100, 1)),
-            "difficulty": analyze_round_difficulty(df, round_name),
-            "commonTopics": analyze_round_topics(df, round_name)
+            "difficulty": analyze_round_difficulty(columns, round_name),
+            "commonTopics": analyze_round_topics(columns, round_name)
         }
         rounds_analysis[round_name] = round_data
 
     return rounds_analysis
 
 
-def analyze_round_difficulty(df, round_name):
+def analyze_round_difficulty(columns, round_name):
     """Analyze difficulty for a specific round"""
-    difficulties = []
-    for _, exp in df.iterrows():
-        round_data = exp["roundsData"].get(round_name, {})
-        if "difficulty" in round_data:
-            difficulties.append(round_data["difficulty"])
+    rounds = columns["rounds"]
+    difficulties = rounds.loc[(rounds["round"] == round_name)
+                              & rounds["hasDifficulty"], "difficulty"]
 
-    if not difficulties:
+    if difficulties.empty:
         return "Unknown"
 
-    difficulty_counter = Counter(difficulties)
-    return difficulty_counter.most_common(1)[0][0]
+    return ranked_counts(difficulties).index[0]
 
 
-def analyze_round_topics(df, round_name):
+def analyze_round_topics(columns, round_name):
     """Extract common topics for a round"""
-    all_topics = []
-    for _, exp in df.iterrows():
-        round_data = exp["roundsData"].get(round_name, {})
-
-        # Extract topics based on round type
-        if round_name == "technical" and "focusTopics" in round_data:
-            all_topics.extend(round_data["focusTopics"])
-        elif round_name == "coding" and "languagesUsed" in round_data:
-            all_topics.extend(round_data["languagesUsed"])
+    # Only technical focus topics and coding languages are tracked
+    if round_name not in TOPIC_FIELDS:
+        return []
 
-    topic_counter = Counter(all_topics)
-    return [{"topic": str(topic), "frequency": int(count)} for topic, count in topic_counter.most_common(5)]
+    topics = columns["topics"]
+    round_topics = topics.loc[topics["round"] == round_name, "topic"]
+    return [{"topic": str(topic), "frequency": int(count)} for topic, count in ranked_counts(round_topics).head(5).items()]
 
 
-def generate_difficulty_analysis(df):
+def generate_difficulty_analysis(columns):
     """Analyze difficulty patterns"""
-    difficulty_scores = {"Easy": 1, "Medium": 2, "Hard": 3}
-    round_difficulties = {}
-
-    for _, exp in df.iterrows():
-        for round_name, round_data in exp["roundsData"].items():
-            if "difficulty" in round_data:
-                difficulty = round_data["difficulty"]
-                if round_name not in round_difficulties:
-                    round_difficulties[round_name] = []
-                round_difficulties[round_name].append(
-                    difficulty_scores.get(difficulty, 2))
+    rated = rated_rounds(columns)
+    avg_scores = rated.groupby("round", sort=False)["score"].mean()
 
     avg_difficulties = {}
-    for round_name, scores in round_difficulties.items():
+    for round_name, avg_score in avg_scores.items():
         # Convert to float
-        avg_score = float(np.mean(scores)) if scores else 0.0
+        avg_score = float(avg_score)
         avg_difficulties[round_name] = {
             "averageDifficulty": float(round(avg_score, 1)),
             "difficultyLevel": get_difficulty_level(avg_score)
@@ -235,17 +406,7 @@ def generate_difficulty_analysis(df):
     return avg_difficulties
 
 
-def get_difficulty_level(score):
-    """Convert numerical score to difficulty level"""
-    if score < 1.5:
-        return "Easy"
-    elif score < 2.5:
-        return "Medium"
-    else:
-        return "Hard"
-
-
-def generate_top_questions(df):
+def generate_top_questions(columns):
     """Generate top questions from all rounds"""
     top_questions = {}
 
@@ -253,7 +414,7 @@ def generate_top_questions(df):
     round_types = ["aptitude", "coding", "technical", "hr"]
 
     for round_type in round_types:
-        questions = extract_questions_from_round(df, round_type)
+        questions = extract_questions_from_round(columns, round_type)
         if questions:
             top_clusters = cluster_questions(questions, round_type)
             top_questions[round_type] = top_clusters
@@ -261,34 +422,12 @@ def generate_top_questions(df):
     return top_questions
 
 
-def extract_questions_from_round(df, round_type):
+def extract_questions_from_round(columns, round_type):
     """Extract questions from a specific round type"""
-    questions = []
-
-    for _, exp in df.iterrows():
-        round_data = exp["roundsData"].get(round_type, {})
-
-        if round_type == "aptitude" and "sampleQuestions" in round_data:
-            for q in round_data["sampleQuestions"]:
-                if "question" in q and q["question"]:
-                    questions.append(q["question"])
-
-        elif round_type == "coding" and "top3Questions" in round_data:
-            for q in round_data["top3Questions"]:
-                if "question" in q and q["question"]:
-                    questions.append(q["question"])
-
-        elif round_type == "technical" and "top5Questions" in round_data:
-            for q in round_data["top5Questions"]:
-                if "question" in q and q["question"]:
-                    questions.append(q["question"])
-
-        elif round_type == "hr" and "topQuestions" in round_data:
-            for q in round_data["topQuestions"]:
-                if "question" in q and q["question"]:
-                    questions.append(q["question"])
-
-    return questions
+    questions = columns["questions"]
+    texts = questions.loc[(questions["round"] == round_type)
+                          & questions["hasQuestion"], "text"]
+    return [q for q in texts if q]
 
 
 def cluster_questions(questions, round_type, top_n=5, threshold=0.65):
@@ -296,11 +435,8 @@ def cluster_questions(questions, round_type, top_n=5, threshold=0.65):
     if not questions:
         return []
 
-    # Clean questions
-    cleaned_questions = [clean_text(q) for q in questions]
-
-    # Remove duplicates
-    unique_questions = list(set(questions))
+    # Remove duplicates, keeping first-seen order so clusters are stable
+    unique_questions = list(dict.fromkeys(questions))
     unique_cleaned = [clean_text(q) for q in unique_questions]
 
     if len(unique_questions) <= 1:
@@ -308,26 +444,12 @@ def cluster_questions(questions, round_type, top_n=5, threshold=0.65):
 
     # Vectorize and cluster
     try:
-        vectorizer = TfidfVectorizer(ngram_range=(1, 2), stop_words="english")
+        vectorizer = TfidfVectorizer(**VECTORIZER_OPTIONS)
         X = vectorizer.fit_transform(unique_cleaned)
-        sim_matrix = cosine_similarity(X)
 
-        clusters = []
-        assigned = [False] * len(unique_questions)
-
-        for i in range(len(unique_questions)):
-            if assigned[i]:
-                continue
-
-            cluster_members = [i]
-            assigned[i] = True
-
-            for j in range(i + 1, len(unique_questions)):
-                if not assigned[j] and sim_matrix[i, j] >= threshold:
-                    cluster_members.append(j)
-                    assigned[j] = True
-
-            clusters.append(cluster_members)
+        # Only pairs above the threshold are materialised, not the full n x n matrix
+        clusters = greedy_threshold_clusters(
+            similarity_neighbors(X, threshold))
 
         # Format cluster info
         cluster_info = []
@@ -353,14 +475,6 @@ def cluster_questions(questions, round_type, top_n=5, threshold=0.65):
         return [{"question": str(q), "frequency": int(count)} for q, count in question_counter.most_common(top_n)]
 
 
-def clean_text(text):
-    """Clean text for NLP processing"""
-    text = str(text).lower()
-    text = re.sub(r"[^\w\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text
-
-
 def generate_success_patterns(df):
     """Identify patterns for successful candidates"""
     successful = df[df["status"] == "Selected"]
@@ -414,12 +528,11 @@ def find_key_differentiators(successful_df, unsuccessful_df):
     return differentiators
 
 
-def generate_preparation_tips(df):
+def generate_preparation_tips(df, rounds_analysis, top_questions):
     """Generate preparation tips based on analysis"""
     tips = []
 
     # Analyze rounds frequency
-    rounds_analysis = generate_rounds_analysis(df)
     most_common_rounds = sorted(rounds_analysis.items(
     ), key=lambda x: x[1]["frequency"], reverse=True)[:3]
 
@@ -430,7 +543,6 @@ def generate_preparation_tips(df):
                 f"Focus on {round_name} round - appears in {data['percentage']}% of interviews (Typically {difficulty} difficulty)")
 
     # Add tips based on top questions
-    top_questions = generate_top_questions(df)
     for round_type, questions in top_questions.items():
         if questions:
             top_q = questions[0]["representativeQuestion"] if "representativeQuestion" in questions[0] else questions[0]["question"]
@@ -450,7 +562,7 @@ def generate_preparation_tips(df):
     return tips
 
 
-def generate_charts(df, company_name):
+def generate_charts(df, columns, company_name):
     """Generate chart data for frontend"""
     charts = {}
 
@@ -474,24 +586,153 @@ def generate_charts(df, company_name):
     }
 
     # Difficulty distribution
-    difficulty_data = {}
-    for _, exp in df.iterrows():
-        for round_name, round_data in exp["roundsData"].items():
-            if "difficulty" in round_data:
-                if round_name not in difficulty_data:
-                    difficulty_data[round_name] = Counter()
-                difficulty_data[round_name][round_data["difficulty"]] += 1
-
-    # Convert Counter objects to regular dicts
+    rated = rated_rounds(columns)
+    difficulty_counts = rated.groupby(
+        ["round", "difficulty"], sort=False, dropna=False).size()
+
     difficulty_data_serializable = {}
-    for round_name, counter in difficulty_data.items():
-        difficulty_data_serializable[round_name] = {
-            str(k): int(v) for k, v in counter.items()}
+    for (round_name, difficulty), count in difficulty_counts.items():
+        difficulty_data_serializable.setdefault(
+            round_name, {})[str(difficulty)] = int(count)
 
     charts["difficultyByRound"] = difficulty_data_serializable
 
     return charts
 
+# ========================= INSIGHTS PIPELINE =========================
+
+
+# Stage name -> (dependencies, function, experience fields). Dependencies are
+# other stages or the request inputs "df" and "companyName", passed
+# positionally. The fields are the DataFrame columns the stage itself reads.
+INSIGHTS_STAGES = {
+    "columns": (("df",), extract_round_columns, ("roundsData", "selectedRounds")),
+    "overallStats": (("df",), generate_overall_stats, ("status", "overallRating", "jobRole")),
+    "roundsAnalysis": (("df", "columns"), generate_rounds_analysis, ("selectedRounds",)),
+    "difficultyAnalysis": (("columns",), generate_difficulty_analysis, ()),
+    "topQuestions": (("columns",), generate_top_questions, ()),
+    "successPatterns": (("df",), generate_success_patterns, ("status", "overallRating", "selectedRounds")),
+    "preparationTips": (("df", "roundsAnalysis", "topQuestions"), generate_preparation_tips, ("status",)),
+    "charts": (("df", "columns", "companyName"), generate_charts, ("status", "selectedRounds"))
+}
+
+# Stages that make up the insights document, in response order
+INSIGHTS_SECTIONS = [
+    "overallStats", "roundsAnalysis", "difficultyAnalysis", "topQuestions",
+    "successPatterns", "preparationTips", "charts"
+]
+
+# Stages InsightsAggregator.summary can supply
+SUMMARY_STAGES = ["overallStats", "roundsAnalysis",
+                  "difficultyAnalysis", "successPatterns"]
+
+
+def run_insights_stages(inputs, targets, timings=None):
+    """
+    Compute the target stages and their dependencies, each exactly once.
+
+    Results are memoized per call, so stages shared by several consumers
+    (e.g. roundsAnalysis and topQuestions feeding preparationTips) are not
+    recomputed. Values already present in `inputs` are used as-is.
+    """
+    results = dict(inputs)
+
+    def resolve(name):
+        if name in results:
+            return results[name]
+        if name not in INSIGHTS_STAGES:
+            raise KeyError(f"Unknown insights stage: {name}")
+
+        dependencies, stage_fn, _ = INSIGHTS_STAGES[name]
+        args = [resolve(dependency) for dependency in dependencies]
+
+        start = time.perf_counter()
+        results[name] = stage_fn(*args)
+        if timings is not None:
+            timings[name] = round((time.perf_counter() - start) * 1000, 2)
+        return results[name]
+
+    for target in targets:
+        resolve(target)
+
+    return results
+
+
+def describe_insights_stages():
+    """List the stage graph in dependency order"""
+    ordered = []
+
+    def visit(name):
+        if name in ordered or name not in INSIGHTS_STAGES:
+            return
+        for dependency in INSIGHTS_STAGES[name][0]:
+            visit(dependency)
+        ordered.append(name)
+
+    for name in INSIGHTS_STAGES:
+        visit(name)
+
+    return [
+        {
+            "name": name,
+            "dependsOn": list(INSIGHTS_STAGES[name][0]),
+            "function": INSIGHTS_STAGES[name][1].__name__,
+            "fields": list(INSIGHTS_STAGES[name][2]),
+            "section": name in INSIGHTS_SECTIONS
+        }
+        for name in ordered
+    ]
+
+
+def insights_projection(targets, provided=()):
+    """Experience fields read by the stages that will run for `targets`
+
+    Stages in `provided` are seeded by the caller, so neither they nor the
+    stages only they depend on contribute fields.
+    """
+    visited = set(provided)
+    field_groups = []
+
+    def visit(name):
+        if name in visited or name not in INSIGHTS_STAGES:
+            return
+        visited.add(name)
+        dependencies, _, fields = INSIGHTS_STAGES[name]
+        field_groups.append(fields)
+        for dependency in dependencies:
+            visit(dependency)
+
+    for target in targets:
+        visit(target)
+
+    return field_groups
+
+
+def merge_projections(*field_groups):
+    """Merge declared field lists into one minimal find() projection"""
+    fields = sorted({field for group in field_groups for field in group})
+
+    # A parent path covers its sub-fields, and Mongo rejects both together
+    fields = [field for field in fields
+              if not any(field.startswith(parent + ".") for parent in fields)]
+
+    if not fields:
+        return {"_id": 1}
+
+    projection = {"_id": 0}
+    projection.update(dict.fromkeys(fields, 1))
+    return projection
+
+
+@analysis_bp.route("/analysis/stages", methods=["GET"])
+def get_insights_stages():
+    """Expose the insights stage graph for introspection"""
+    return jsonify({
+        "success": True,
+        "inputs": ["df", "companyName"],
+        "stages": describe_insights_stages()
+    }), 200
+
 # ========================= GET COMPANY INSIGHTS =========================
 
 
@@ -500,65 +741,40 @@ def get_company_insights(company_id):
     """Get pre-generated insights for company page - Main insights endpoint"""
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
         # Get company data
-        company = db.companies.find_one({
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        company = db.companies.find_one({"companyId": company_id})
 
         if not company:
             return jsonify({"success": False, "message": "Company not found"}), 404
 
-        # Check if we should use cached insights or generate new ones
-        experiences_cursor = db.experiences.find({
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
-        experiences = list(experiences_cursor)
-
-        if not experiences:
+        # Served from the stored materialization, computed here only for a
+        # company that has never been materialized and refreshed in the
+        # background when a submission has made it stale
+        materialized = db.company_insights.find_one({"companyId": company_id})
+        cached = materialized is not None
+        if not cached:
+            materialized = materialize_company_insights(db, company_id, company)
+        elif materialized["experienceVersion"] != company.get("experienceVersion", 0):
+            request_insights_refresh(db, company_id)
+
+        if materialized is None:
             return jsonify({
                 "success": False,
                 "message": "No interview experiences found for analysis"
             }), 404
 
-        # Always generate fresh insights from experiences data for accuracy
-        analysis_results = analyze_experiences_data(
-            experiences,
-            company.get("name", "Unknown Company"),
-            company_id
-        )
-
-        # Update company with fresh insights
-        db.companies.update_one(
-            {"$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]},
-            {"$set": {
-                # Ensure serializable before saving
-                "insights": convert_numpy_types(analysis_results),
-                "insightsUpdatedAt": datetime.utcnow(),
-                "experienceCount": len(experiences),
-                "stats": generate_company_stats(analysis_results, experiences)
-            }}
-        )
-
         return jsonify({
             "success": True,
-            "insights": convert_numpy_types(analysis_results),
+            "insights": materialized["insights"],
             "metadata": {
-                "totalExperiences": len(experiences),
-                "analysisDate": datetime.utcnow().isoformat(),
-                "companyName": company.get("name", "Unknown Company")
+                "totalExperiences": materialized["experienceCount"],
+                "analysisDate": materialized["materializedAt"].isoformat(),
+                "companyName": company.get("name", "Unknown Company"),
+                "cached": cached,
+                "experienceVersion": materialized["experienceVersion"],
+                "stale": materialized["experienceVersion"] != company.get("experienceVersion", 0)
             }
         }), 200
 
@@ -567,6 +783,147 @@ def get_company_insights(company_id):
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
 
+def request_insights_refresh(db, company_id):
+    """Queue a rematerialization of a company's insights unless one is already queued
+
+    Called after every submission and on stale reads. The refresh job clears
+    the flag before reading the experiences, so every change is followed by
+    a materialization that started after it. Stored insights therefore lag
+    a change by at most the queue delay plus one materialization. A refresh
+    queued more than INSIGHTS_REFRESH_TIMEOUT ago counts as lost.
+    """
+    now = datetime.utcnow()
+    result = db.company_insights.update_one(
+        {"companyId": company_id,
+         "$or": [{"refreshQueuedAt": None},
+                 {"refreshQueuedAt": {"$lt": now - INSIGHTS_REFRESH_TIMEOUT}}]},
+        {"$set": {"refreshQueuedAt": now}}
+    )
+    if result.modified_count:
+        job_queue.enqueue("insights.refresh", {"companyId": company_id})
+
+
+def handle_insights_refresh(db, payload):
+    """Background job: rematerialize a company's insights after new submissions"""
+    db.company_insights.update_one(
+        {"companyId": payload["companyId"]}, {"$set": {"refreshQueuedAt": None}})
+    materialize_company_insights(db, payload["companyId"])
+
+
+job_queue.register("insights.refresh", handle_insights_refresh)
+
+
+def materialize_company_insights(db, company_id, company=None, refit_questions=False):
+    """Recompute a company's insights and rounds analytics into company_insights
+
+    Runs on verify/reject and after submissions (as background jobs) so
+    public reads only fetch the stored document. Returns the document, or None when the company or
+    its experiences are missing. A run overtaken by a newer one returns the newer document.
+    """
+    if company is None:
+        company = db.companies.find_one(
+            {"companyId": company_id}, {"name": 1, "experienceVersion": 1})
+    if not company:
+        return None
+    company_name = company.get("name", "Unknown Company")
+
+    # Read the version before the experiences so a concurrent submission
+    # leaves the materialized insights stale rather than wrongly fresh
+    experience_version = company.get("experienceVersion", 0)
+
+    experiences = list(db.experiences.find(
+        {"companyId": company_id},
+        merge_projections(
+            COMPANY_STATS_FIELDS,
+            ROUNDS_ANALYTICS_FIELDS,
+            *insights_projection(INSIGHTS_SECTIONS, SUMMARY_STAGES + ["topQuestions"])
+        )
+    ))
+
+    if not experiences:
+        db.company_insights.delete_one({"companyId": company_id})
+        return None
+
+    # The numeric sections come from the running aggregate and the
+    # question clusters from the incrementally maintained store
+    question_store = QuestionVectorStore(db)
+    if refit_questions:
+        question_store.rebuild(company_id)
+    aggregator = InsightsAggregator(db)
+    insights = convert_numpy_types(analyze_experiences_data(
+        experiences,
+        company_name,
+        company_id,
+        summary=aggregator.summary(aggregator.get(company_id)),
+        top_questions=question_store.top_questions(company_id)
+    ))
+
+    df = rounds_analytics_frame(experiences, company_name)
+    rounds_analytics = None
+    if df is not None:
+        rounds_analytics = convert_numpy_types(
+            generate_rounds_analytics_data(df, company_name))
+
+    document = {
+        "companyId": company_id,
+        "experienceVersion": experience_version,
+        "experienceCount": len(experiences),
+        "insights": insights,
+        "roundsAnalytics": rounds_analytics,
+        "materializedAt": datetime.utcnow()
+    }
+    # A run that read an older version than the stored one is dropped, the
+    # upsert then collides with the newer document on the unique companyId
+    try:
+        db.company_insights.replace_one(
+            {"companyId": company_id, "experienceVersion": {"$lte": experience_version}},
+            document, upsert=True)
+    except DuplicateKeyError:
+        return db.company_insights.find_one({"companyId": company_id}) or document
+
+    # Listing fields stay on the company document, guarded the same way
+    db.companies.update_one(
+        {"companyId": company_id,
+         "$or": [{"insightsVersion": {"$exists": False}},
+                 {"insightsVersion": {"$lte": experience_version}}]},
+        {"$set": {
+            "insightsUpdatedAt": document["materializedAt"],
+            "insightsVersion": experience_version,
+            "experienceCount": len(experiences),
+            "stats": generate_company_stats(insights, experiences)
+        }}
+    )
+
+    return document
+
+
+def rounds_analytics_frame(experiences, company_name):
+    """DataFrame for generate_rounds_analytics_data, skipping malformed experiences"""
+    df_data = []
+    for exp in experiences:
+        try:
+            row = {
+                "experienceId": str(exp.get("experienceId", "")),
+                "companyName": str(exp.get("companyName", company_name)),
+                "jobRole": str(exp.get("jobRole", "")),
+                "status": str(exp.get("status", "Pending")),
+                "overallRating": float(exp.get("overallRating", 0)),
+                "selectedRounds": list(exp.get("selectedRounds", [])),
+                "roundsData": dict(exp.get("roundsData", {})),
+                "experienceSummary": str(exp.get("experienceSummary", "")),
+                "createdAt": exp.get("createdAt")
+            }
+            df_data.append(row)
+        except Exception as e:
+            current_app.logger.warning(
+                f"Error processing experience: {str(e)}")
+            continue
+
+    if not df_data:
+        return None
+    return pd.DataFrame(df_data)
+
+
 def generate_company_stats(insights, experiences):
     """Generate company stats from insights for the company document"""
     overall_stats = insights.get("overallStats", {})
@@ -574,7 +931,7 @@ def generate_company_stats(insights, experiences):
     return {
         "totalHired": int(overall_stats.get("selectedCount", 0)),
         "successRate": float(overall_stats.get("successRate", 0)),
-        "averageRating": float(overall_stats.get("averageRating", 0)),
+        "averageRating": float(overall_stats.get("averageRating") or 0),
         "totalExperiences": int(len(experiences)),
         "highestPackage": float(calculate_highest_package(experiences)),
         "thisYearHires": int(calculate_recent_hires(experiences))
@@ -607,6 +964,45 @@ def calculate_recent_hires(experiences):
 
     return recent_hires
 
+
+@analysis_bp.route("/companies/<company_id>/insights/summary", methods=["GET"])
+def get_insights_summary(company_id):
+    """Get the numeric insights from the running aggregate without loading experiences"""
+    try:
+        db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
+
+        company = db.companies.find_one({"companyId": company_id}, {"name": 1})
+
+        if not company:
+            return jsonify({"success": False, "message": "Company not found"}), 404
+
+        # ?live=true recomputes the counters server-side without storing them
+        aggregator = InsightsAggregator(db)
+        if request.args.get("live") == "true":
+            aggregate = InsightsAggregator(analytics_db(db)).pipeline_aggregate(company_id)
+        else:
+            aggregate = aggregator.get(company_id)
+
+        if aggregate.get("total", 0) <= 0:
+            return jsonify({
+                "success": False,
+                "message": "No experiences found"
+            }), 404
+
+        return jsonify({
+            "success": True,
+            "summary": convert_numpy_types(aggregator.summary(aggregate)),
+            "metadata": {
+                "companyName": company.get("name", "Unknown Company"),
+                "updatedAt": aggregate["updatedAt"].isoformat() if aggregate.get("updatedAt") else None
+            }
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Insights summary error: {str(e)}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
 # Add a new endpoint for quick insights without database update
 
 
@@ -615,14 +1011,11 @@ def get_quick_insights(company_id):
     """Get real-time insights without updating database"""
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
-        experiences_cursor = db.experiences.find({
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        experiences_cursor = analytics_db(db).experiences.find(
+            {"companyId": company_id},
+            merge_projections(*insights_projection(INSIGHTS_SECTIONS)))
         experiences = list(experiences_cursor)
 
         if not experiences:
@@ -631,13 +1024,7 @@ def get_quick_insights(company_id):
                 "message": "No experiences found"
             }), 404
 
-        company = db.companies.find_one({
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        company = db.companies.find_one({"companyId": company_id})
 
         analysis_results = analyze_experiences_data(
             experiences,
@@ -664,53 +1051,25 @@ def update_company_insights(company_id):
     """Force update of company insights"""
     try:
         db = current_app.config["MONGO_DB"]
-
-        # Get experiences
-        experiences_cursor = db.experiences.find({
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
-        experiences = list(experiences_cursor)
-
-        if not experiences:
-            return jsonify({"success": False, "message": "No experiences found for analysis"}), 404
+        company_id = company_resolver.canonical(db, company_id)
 
         # Get company info
-        company = db.companies.find_one({
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        company = db.companies.find_one({"companyId": company_id})
 
         if not company:
             return jsonify({"success": False, "message": "Company not found"}), 404
 
-        # Generate new insights
-        analysis_results = analyze_experiences_data(
-            experiences, company["name"], company_id)
-
-        # Update company
-        db.companies.update_one(
-            {"$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]},
-            {"$set": {
-                "insights": convert_numpy_types(analysis_results),
-                "insightsUpdatedAt": datetime.utcnow()
-            }}
-        )
+        # Forced updates also refit the stored question vocabularies
+        materialized = materialize_company_insights(
+            db, company_id, company, refit_questions=True)
+
+        if materialized is None:
+            return jsonify({"success": False, "message": "No experiences found for analysis"}), 404
 
         return jsonify({
             "success": True,
             "message": "Insights updated successfully",
-            "insights": convert_numpy_types(analysis_results)
+            "insights": materialized["insights"]
         }), 200
 
     except Exception as e:
@@ -726,12 +1085,16 @@ def update_company_insights(company_id):
 def generate_rounds_analytics_data(df, company_name):
     """Generate comprehensive rounds analytics with structured chart data"""
     try:
+        # Flatten roundsData once for every chart builder
+        columns = extract_round_columns(df)
+
         # Get basic chart data
-        basic_chart_data = generate_basic_chart_data(df, company_name)
+        basic_chart_data = generate_basic_chart_data(
+            df, columns, company_name)
 
         # Get comprehensive chart data
         comprehensive_data = generate_comprehensive_chart_data(
-            df, company_name)
+            df, columns, company_name)
 
         # Merge both datasets
         chart_data = {**basic_chart_data, **comprehensive_data}
@@ -740,7 +1103,7 @@ def generate_rounds_analytics_data(df, company_name):
         rounds_analytics = {}
         for round_type in ["aptitude", "coding", "technical", "hr"]:
             try:
-                round_data = generate_round_details(df, round_type)
+                round_data = generate_round_details(df, columns, round_type)
                 if round_data:
                     rounds_analytics[round_type] = round_data
             except Exception as e:
@@ -759,7 +1122,7 @@ def generate_rounds_analytics_data(df, company_name):
         return {"chartData": {}, "roundsAnalytics": {}, "summary": {}}
 
 
-def generate_basic_chart_data(df, company_name):
+def generate_basic_chart_data(df, columns, company_name):
     """Generate basic chart data"""
     chart_data = {}
 
@@ -814,28 +1177,20 @@ def generate_basic_chart_data(df, company_name):
 
     # 3. Difficulty Level by Round Data for Bar Chart
     difficulty_data = []
+    rated = rated_rounds(columns)
+    difficulty_scores = rated.groupby("round")["score"].agg(["mean", "size"])
     for round_type in ["aptitude", "coding", "technical", "hr"]:
         try:
-            difficulties = []
-            for _, exp in df.iterrows():
-                round_data = exp.get("roundsData", {})
-                if isinstance(round_data, dict):
-                    round_specific_data = round_data.get(round_type, {})
-                    if isinstance(round_specific_data, dict) and "difficulty" in round_specific_data:
-                        difficulty = round_specific_data["difficulty"]
-                        difficulty_score = {
-                            "Easy": 1, "Medium": 2, "Hard": 3}.get(difficulty, 2)
-                        difficulties.append(difficulty_score)
-
-            if difficulties:
-                avg_difficulty = float(np.mean(difficulties))
+            if round_type in difficulty_scores.index:
+                avg_difficulty = float(
+                    difficulty_scores.at[round_type, "mean"])
                 difficulty_level = get_difficulty_level(avg_difficulty)
 
                 difficulty_data.append({
                     "round": round_type.capitalize(),
                     "difficultyScore": float(round(avg_difficulty, 2)),
                     "difficultyLevel": difficulty_level,
-                    "dataCount": len(difficulties)
+                    "dataCount": int(difficulty_scores.at[round_type, "size"])
                 })
             else:
                 difficulty_data.append({
@@ -913,26 +1268,23 @@ def generate_basic_chart_data(df, company_name):
     return chart_data
 
 
-def generate_comprehensive_chart_data(df, company_name):
+def generate_comprehensive_chart_data(df, columns, company_name):
     """Generate all chart data matching the CSV analysis functionality"""
     chart_data = {}
+    rounds = columns["rounds"]
+    rated = rated_rounds(columns)
+    rated["company"] = df["companyName"].to_numpy()[rated["exp"].to_numpy()]
 
     try:
         # 1. Difficulty Distribution (Pie Chart) - Based on roundsData difficulty
         try:
-            difficulty_levels = []
-            for _, exp in df.iterrows():
-                rounds_data = exp.get("roundsData", {})
-                for round_type, round_data in rounds_data.items():
-                    if isinstance(round_data, dict) and "difficulty" in round_data:
-                        difficulty_levels.append(round_data["difficulty"])
-
-            difficulty_counter = Counter(difficulty_levels)
-            if difficulty_counter:
+            difficulty_counts = rated["difficulty"].value_counts(
+                sort=False, dropna=False)
+            if not difficulty_counts.empty:
                 chart_data["difficultyDistribution"] = [
                     {"name": str(diff), "value": int(
                         count), "count": int(count)}
-                    for diff, count in difficulty_counter.items()
+                    for diff, count in difficulty_counts.items()
                 ]
         except Exception as e:
             current_app.logger.warning(
@@ -941,34 +1293,20 @@ def generate_comprehensive_chart_data(df, company_name):
 
         # 2. Average Difficulty by Company (Horizontal Bar Chart)
         try:
-            # Calculate average difficulty score per company
-            company_difficulty_scores = {}
-            for _, exp in df.iterrows():
-                company = exp.get("companyName", "Unknown")
-                if company not in company_difficulty_scores:
-                    company_difficulty_scores[company] = []
-
-                # Calculate average difficulty for this experience
-                exp_difficulties = []
-                rounds_data = exp.get("roundsData", {})
-                for round_data in rounds_data.values():
-                    if isinstance(round_data, dict) and "difficulty" in round_data:
-                        difficulty_score = {"Easy": 1, "Medium": 2, "Hard": 3}.get(
-                            round_data["difficulty"], 2)
-                        exp_difficulties.append(difficulty_score)
-
-                if exp_difficulties:
-                    company_difficulty_scores[company].append(
-                        np.mean(exp_difficulties))
+            # Average difficulty per experience, then per company
+            exp_scores = rated.groupby("exp").agg(
+                company=("company", "first"), score=("score", "mean"))
+            company_scores = exp_scores.groupby(
+                "company")["score"].agg(["mean", "size"])
 
             chart_data["companyDifficulty"] = [
                 {
                     "company": company,
-                    "avgDifficulty": float(round(np.mean(scores), 2)),
-                    "experienceCount": len(scores)
+                    "avgDifficulty": float(round(company_scores.at[company, "mean"], 2)),
+                    "experienceCount": int(company_scores.at[company, "size"])
                 }
-                for company, scores in company_difficulty_scores.items()
-                if scores
+                for company in df["companyName"].unique()
+                if company in company_scores.index
             ]
         except Exception as e:
             current_app.logger.warning(
@@ -977,33 +1315,12 @@ def generate_comprehensive_chart_data(df, company_name):
 
         # 3. Questions per Section (Stacked Bar Chart)
         try:
+            question_counts = rounds.groupby("round")["questionCount"].sum()
             section_data = []
             for round_type in ["aptitude", "coding", "technical", "hr"]:
-                question_count = 0
-                for _, exp in df.iterrows():
-                    round_data = exp.get("roundsData", {}).get(round_type, {})
-                    if isinstance(round_data, dict):
-                        # Count questions based on round type
-                        if round_type == "aptitude" and "sampleQuestions" in round_data:
-                            questions = round_data["sampleQuestions"]
-                            if isinstance(questions, list):
-                                question_count += len(questions)
-                        elif round_type == "coding" and "top3Questions" in round_data:
-                            questions = round_data["top3Questions"]
-                            if isinstance(questions, list):
-                                question_count += len(questions)
-                        elif round_type == "technical" and "top5Questions" in round_data:
-                            questions = round_data["top5Questions"]
-                            if isinstance(questions, list):
-                                question_count += len(questions)
-                        elif round_type == "hr" and "topQuestions" in round_data:
-                            questions = round_data["topQuestions"]
-                            if isinstance(questions, list):
-                                question_count += len(questions)
-
                 section_data.append({
                     "section": round_type.capitalize(),
-                    "questionCount": question_count,
+                    "questionCount": int(question_counts.get(round_type, 0)),
                     "color": CHART_COLORS.get(round_type, "#6b7280")
                 })
 
@@ -1024,11 +1341,7 @@ def generate_comprehensive_chart_data(df, company_name):
             all_feedback.extend(df["experienceSummary"].fillna("").astype(str))
 
             # Add round-specific feedback
-            for _, exp in df.iterrows():
-                rounds_data = exp.get("roundsData", {})
-                for round_data in rounds_data.values():
-                    if isinstance(round_data, dict) and "feedback" in round_data:
-                        all_feedback.append(str(round_data["feedback"]))
+            all_feedback.extend(rounds["feedback"].dropna())
 
             combined_feedback = " ".join(
                 [fb for fb in all_feedback if fb.strip()])
@@ -1049,23 +1362,19 @@ def generate_comprehensive_chart_data(df, company_name):
 
         # 6. Review Sentiment Analysis (Bar Chart)
         try:
+            # Convert difficulty to sentiment score
+            sentiment_map = {"Easy": 4, "Medium": 3, "Hard": 2, "Very Hard": 1}
+            sentiment = rated["difficulty"].map(sentiment_map).fillna(3)
+            sentiment_scores = sentiment.groupby(
+                rated["round"]).agg(["mean", "size"])
+
             sentiment_data = []
             for round_type in ["aptitude", "coding", "technical", "hr"]:
-                ratings = []
-                for _, exp in df.iterrows():
-                    round_data = exp.get("roundsData", {}).get(round_type, {})
-                    if isinstance(round_data, dict) and "difficulty" in round_data:
-                        # Convert difficulty to sentiment score
-                        sentiment_map = {
-                            "Easy": 4, "Medium": 3, "Hard": 2, "Very Hard": 1}
-                        ratings.append(sentiment_map.get(
-                            round_data["difficulty"], 3))
-
-                if ratings:
+                if round_type in sentiment_scores.index:
                     sentiment_data.append({
                         "round": round_type.capitalize(),
-                        "avgSentiment": float(round(np.mean(ratings), 2)),
-                        "responseCount": len(ratings)
+                        "avgSentiment": float(round(sentiment_scores.at[round_type, "mean"], 2)),
+                        "responseCount": int(sentiment_scores.at[round_type, "size"])
                     })
 
             chart_data["reviewSentiment"] = sentiment_data
@@ -1082,11 +1391,11 @@ def generate_comprehensive_chart_data(df, company_name):
 
             chart_data["roundsPerCompany"] = [
                 {
-                    "company": row["companyName"],
-                    "roundCount": int(row["experienceId"]),
-                    "experienceCount": int(row["experienceId"])
+                    "company": company,
+                    "roundCount": int(count),
+                    "experienceCount": int(count)
                 }
-                for _, row in company_rounds.iterrows()
+                for company, count in zip(company_rounds["companyName"], company_rounds["experienceId"])
             ]
         except Exception as e:
             current_app.logger.warning(
@@ -1095,35 +1404,12 @@ def generate_comprehensive_chart_data(df, company_name):
 
         # 8. Question Types Count (Bar Chart)
         try:
+            question_counts = rounds.groupby("round")["questionCount"].sum()
             question_types = {
-                "Aptitude": 0,
-                "Coding": 0,
-                "Technical": 0,
-                "HR": 0
+                q_type: int(question_counts.get(q_type.lower(), 0))
+                for q_type in ["Aptitude", "Coding", "Technical", "HR"]
             }
 
-            for _, exp in df.iterrows():
-                rounds_data = exp.get("roundsData", {})
-                for round_type in question_types.keys():
-                    round_data = rounds_data.get(round_type.lower(), {})
-                    if isinstance(round_data, dict):
-                        if round_type == "Aptitude" and "sampleQuestions" in round_data:
-                            questions = round_data["sampleQuestions"]
-                            if isinstance(questions, list):
-                                question_types[round_type] += len(questions)
-                        elif round_type == "Coding" and "top3Questions" in round_data:
-                            questions = round_data["top3Questions"]
-                            if isinstance(questions, list):
-                                question_types[round_type] += len(questions)
-                        elif round_type == "Technical" and "top5Questions" in round_data:
-                            questions = round_data["top5Questions"]
-                            if isinstance(questions, list):
-                                question_types[round_type] += len(questions)
-                        elif round_type == "HR" and "topQuestions" in round_data:
-                            questions = round_data["topQuestions"]
-                            if isinstance(questions, list):
-                                question_types[round_type] += len(questions)
-
             chart_data["questionTypesCount"] = [
                 {"type": q_type, "count": count}
                 for q_type, count in question_types.items()
@@ -1138,16 +1424,12 @@ def generate_comprehensive_chart_data(df, company_name):
             heatmap_data = []
             companies = df["companyName"].unique()
             difficulty_levels = ["Easy", "Medium", "Hard"]
+            heatmap_counts = rated.groupby(
+                ["company", "difficulty"]).size().to_dict()
 
             for company in companies:
-                company_data = df[df["companyName"] == company]
                 for difficulty in difficulty_levels:
-                    count = 0
-                    for _, exp in company_data.iterrows():
-                        rounds_data = exp.get("roundsData", {})
-                        for round_data in rounds_data.values():
-                            if isinstance(round_data, dict) and round_data.get("difficulty") == difficulty:
-                                count += 1
+                    count = int(heatmap_counts.get((company, difficulty), 0))
 
                     if count > 0:
                         heatmap_data.append({
@@ -1164,38 +1446,27 @@ def generate_comprehensive_chart_data(df, company_name):
 
         # 10. Most Asked Topics (Horizontal Bar Chart)
         try:
-            all_topics = []
-            for _, exp in df.iterrows():
-                rounds_data = exp.get("roundsData", {})
-                # Technical topics
-                if "technical" in rounds_data and "focusTopics" in rounds_data["technical"]:
-                    topics = rounds_data["technical"]["focusTopics"]
-                    if isinstance(topics, list):
-                        all_topics.extend([str(t) for t in topics])
-                # Coding languages
-                if "coding" in rounds_data and "languagesUsed" in rounds_data["coding"]:
-                    langs = rounds_data["coding"]["languagesUsed"]
-                    if isinstance(langs, list):
-                        all_topics.extend([str(l) for l in langs])
-                # Aptitude question types (extract from sample questions)
-                if "aptitude" in rounds_data and "sampleQuestions" in rounds_data["aptitude"]:
-                    questions = rounds_data["aptitude"]["sampleQuestions"]
-                    if isinstance(questions, list):
-                        # Extract topics from aptitude questions
-                        for q in questions:
-                            if isinstance(q, dict) and "question" in q:
-                                question_text = str(q["question"]).lower()
-                                if "interest" in question_text:
-                                    all_topics.append("Interest Calculation")
-                                elif "percentage" in question_text:
-                                    all_topics.append("Percentage")
-                                elif "equation" in question_text or "math" in question_text:
-                                    all_topics.append("Basic Math")
-
-            topic_counter = Counter(all_topics)
+            # Technical topics, coding languages, then aptitude question
+            # types, in experience order so ties rank like the raw data
+            topics = columns["topics"]
+            questions = columns["questions"]
+            aptitude = questions[(questions["round"] == "aptitude")
+                                 & questions["hasQuestion"]]
+            aptitude_topics = aptitude_topic_labels(
+                aptitude["text"], ["equation", "math"])
+            aptitude_rows = pd.DataFrame(
+                {"exp": aptitude["exp"], "rank": 2, "topic": aptitude_topics})
+            topic_rows = pd.concat([
+                pd.DataFrame({"exp": topics.loc[topics["round"] == round_type, "exp"],
+                              "rank": rank,
+                              "topic": topics.loc[topics["round"] == round_type, "topic"].astype(str)})
+                for rank, round_type in enumerate(["technical", "coding"])
+            ] + [aptitude_rows[aptitude_topics != ""]], ignore_index=True)
+            topic_rows = topic_rows.sort_values(["exp", "rank"], kind="stable")
+
             chart_data["mostAskedTopics"] = [
-                {"topic": topic, "frequency": count}
-                for topic, count in topic_counter.most_common(10)
+                {"topic": topic, "frequency": int(count)}
+                for topic, count in ranked_counts(topic_rows["topic"]).head(10).items()
             ]
         except Exception as e:
             current_app.logger.warning(
@@ -1284,17 +1555,7 @@ CHART_COLORS = {
 }
 
 
-def get_difficulty_level(score):
-    """Convert numerical score to difficulty level"""
-    if score < 1.5:
-        return "Easy"
-    elif score < 2.5:
-        return "Medium"
-    else:
-        return "Hard"
-
-
-def generate_round_details(df, round_type):
+def generate_round_details(df, columns, round_type):
     """Generate detailed analytics for a specific round type"""
     try:
         # Safely filter rounds
@@ -1313,84 +1574,43 @@ def generate_round_details(df, round_type):
         pass_rate = (successful_in_round / total_round_experiences) * \
             100 if total_round_experiences > 0 else 0
 
-        # Calculate metrics with safe data handling
-        difficulties = []
-        time_limits = []
-        all_topics = []
-        sample_questions = []
-
-        for _, exp in round_experiences.iterrows():
-            round_data = exp.get("roundsData", {}).get(round_type, {})
-            if isinstance(round_data, dict):
-                # Difficulty
-                if "difficulty" in round_data:
-                    difficulties.append(str(round_data["difficulty"]))
-
-                # Time limits
-                if "timeLimit" in round_data:
-                    time_val = round_data["timeLimit"]
-                    if isinstance(time_val, (int, float)):
-                        time_limits.append(float(time_val))
-                    elif isinstance(time_val, str):
-                        # Extract numbers from strings like "60 minutes"
-                        numbers = re.findall(r'\d+', time_val)
-                        if numbers:
-                            time_limits.append(float(numbers[0]))
-
-                # Extract topics based on round type
-                if round_type == "technical" and "focusTopics" in round_data:
-                    topics = round_data["focusTopics"]
-                    if isinstance(topics, list):
-                        all_topics.extend([str(t) for t in topics])
-                elif round_type == "coding" and "languagesUsed" in round_data:
-                    langs = round_data["languagesUsed"]
-                    if isinstance(langs, list):
-                        all_topics.extend([str(l) for l in langs])
-                elif round_type == "aptitude":
-                    # Extract topics from aptitude questions
-                    if "sampleQuestions" in round_data:
-                        questions = round_data["sampleQuestions"]
-                        if isinstance(questions, list):
-                            for q in questions:
-                                if isinstance(q, dict) and "question" in q:
-                                    question_text = str(q["question"]).lower()
-                                    if "interest" in question_text:
-                                        all_topics.append(
-                                            "Interest Calculation")
-                                    elif "percentage" in question_text:
-                                        all_topics.append("Percentage")
-                                    elif any(math_term in question_text for math_term in ['+', '-', '*', '/', 'math', 'equation']):
-                                        all_topics.append("Basic Math")
-
-                # Extract sample questions
-                question_keys = {
-                    "aptitude": "sampleQuestions",
-                    "coding": "top3Questions",
-                    "technical": "top5Questions",
-                    "hr": "topQuestions"
-                }
-
-                q_key = question_keys.get(round_type)
-                if q_key and q_key in round_data:
-                    questions = round_data[q_key]
-                    if isinstance(questions, list):
-                        sample_questions.extend(questions)
+        # Only rounds of experiences that list this round as taken
+        rounds = columns["rounds"]
+        round_rows = rounds[(rounds["round"] == round_type)
+                            & rounds["selected"]]
+        topics = columns["topics"]
+        questions = columns["questions"]
+        round_questions = questions[(questions["round"] == round_type)
+                                    & questions["selected"]]
 
         # Get most common difficulty
-        difficulty_counter = Counter(difficulties)
-        most_common_difficulty = difficulty_counter.most_common(
-            1)[0][0] if difficulties else "Unknown"
+        difficulties = round_rows.loc[round_rows["hasDifficulty"], "difficulty"].astype(
+            str)
+        most_common_difficulty = ranked_counts(
+            difficulties).index[0] if not difficulties.empty else "Unknown"
 
         # Get average time limit
-        avg_time_limit = np.mean(time_limits) if time_limits else "Varies"
+        time_limits = round_rows["timeLimit"].dropna()
+        avg_time_limit = float(
+            time_limits.mean()) if not time_limits.empty else "Varies"
 
         # Get top topics
-        topic_counter = Counter(all_topics)
-        top_topics = [str(topic) for topic, _ in topic_counter.most_common(5)]
+        if round_type == "aptitude":
+            # Extract topics from aptitude questions
+            with_text = round_questions[round_questions["hasQuestion"]]
+            all_topics = aptitude_topic_labels(
+                with_text["text"], ['+', '-', '*', '/', 'math', 'equation'])
+            all_topics = all_topics[all_topics != ""]
+        else:
+            all_topics = topics.loc[(topics["round"] == round_type)
+                                    & topics["selected"], "topic"].astype(str)
+        top_topics = [str(topic)
+                      for topic in ranked_counts(all_topics).head(5).index]
 
         # Prepare sample questions (limit to 3)
+        sample_questions = round_questions["item"].head(3)
         formatted_questions = []
-        for i, q in enumerate(sample_questions[:3]):
+        for i, q in enumerate(sample_questions):
             if isinstance(q, dict) and "question" in q:
                 formatted_questions.append({
                     "question": str(q.get("question", "")),
@@ -1451,76 +1671,38 @@ def get_company_rounds_analytics(company_id):
             return jsonify({"success": True}), 200
 
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
         # Get company data
-        company = db.companies.find_one({
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        company = db.companies.find_one({"companyId": company_id})
 
         if not company:
             return jsonify({"success": False, "message": "Company not found"}), 404
 
-        # Get experiences with error handling
-        try:
-            experiences_cursor = db.experiences.find({
-                "$or": [
-                    {"companyId": company_id},
-                    {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                        company_id) else None}
-                ]
-            })
-            experiences = list(experiences_cursor)
-        except Exception as e:
-            current_app.logger.error(f"Database error: {str(e)}")
-            return jsonify({"success": False, "message": "Database error"}), 500
+        # Served from the stored materialization, refreshed in the background when stale
+        materialized = db.company_insights.find_one({"companyId": company_id})
+        if materialized is None:
+            materialized = materialize_company_insights(db, company_id, company)
+        elif materialized["experienceVersion"] != company.get("experienceVersion", 0):
+            request_insights_refresh(db, company_id)
 
-        if not experiences:
+        if materialized is None:
             return jsonify({
                 "success": False,
                 "message": "No experiences found for analysis"
             }), 404
 
-        # Convert to DataFrame with proper error handling
-        df_data = []
-        for exp in experiences:
-            try:
-                row = {
-                    "experienceId": str(exp.get("experienceId", "")),
-                    "companyName": str(exp.get("companyName", company.get("name", "Unknown"))),
-                    "jobRole": str(exp.get("jobRole", "")),
-                    "status": str(exp.get("status", "Pending")),
-                    "overallRating": float(exp.get("overallRating", 0)),
-                    "selectedRounds": list(exp.get("selectedRounds", [])),
-                    "roundsData": dict(exp.get("roundsData", {})),
-                    "experienceSummary": str(exp.get("experienceSummary", "")),
-                    "createdAt": exp.get("createdAt")
-                }
-                df_data.append(row)
-            except Exception as e:
-                current_app.logger.warning(
-                    f"Error processing experience: {str(e)}")
-                continue
-
-        if not df_data:
+        if materialized.get("roundsAnalytics") is None:
             return jsonify({"success": False, "message": "No valid experience data"}), 404
 
-        df = pd.DataFrame(df_data)
-
-        # Generate rounds analytics
-        rounds_analytics = generate_rounds_analytics_data(
-            df, company.get("name", "Unknown Company"))
-
         response = jsonify({
             "success": True,
-            "roundsAnalytics": convert_numpy_types(rounds_analytics),
+            "roundsAnalytics": materialized["roundsAnalytics"],
             "metadata": {
-                "totalExperiences": len(experiences),
+                "totalExperiences": materialized["experienceCount"],
                 "companyName": company.get("name", "Unknown Company"),
-                "generatedAt": datetime.utcnow().isoformat()
+                "generatedAt": materialized["materializedAt"].isoformat(),
+                "experienceVersion": materialized["experienceVersion"]
             }
         })
 
@@ -8,32 +8,59 @@ from flask_jwt_extended import (
 )
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson.objectid import ObjectId
-import uuid
 import re
 from datetime import datetime
-from services.otp_service import OTPService
+from services.otp_service import otp_service, MAX_EMAIL_ATTEMPTS
+from services.token_blocklist import token_blocklist
 from services.email_service import EmailService
+from services.index_registry import index_registry
+from services.count_cache import count_cache
+from services.student_search import student_search_fields
+from services.identity_cache import identity_cache, identity_claims, STUDENT_ROLE
 # from services.sms_service import SMSService
 
 auth_bp = Blueprint("auth", __name__)
 
+# Login, registration and profile lookups
+index_registry.declare(auth_bp.name, "students", ["email"])
+index_registry.declare(auth_bp.name, "admins", ["email", "role"])
 
 
-# Blacklist for tokens (in-memory; use Redis in production)
-blacklisted_tokens = set()
-
-# Reset tokens (simulate password reset)
-reset_tokens = {}
 
 # ========================= ROLE CHECKING UTILITIES =========================
 
 
+def token_roles(email):
+    """Roles claimed by the current request's token for `email`, None if unknown"""
+    try:
+        claims = get_jwt()
+    except RuntimeError:
+        return None
+    if claims.get("sub") != email or "roles" not in claims:
+        return None
+    return claims["roles"]
+
+
+def has_role(email, role):
+    """
+    Check a role without a database round trip when possible.
+
+    A token issued without the role is refused from its claims alone; roles
+    gained since then apply after a token refresh. A claimed role is still
+    confirmed against the identity cache, so removing it takes effect
+    within the cache TTL instead of the token lifetime.
+    """
+    claimed = token_roles(email)
+    if claimed is not None and role not in claimed:
+        return False
+    db = current_app.config["MONGO_DB"]
+    return role in identity_cache.roles(db, email)
+
+
 def is_super_admin(email):
     """Check if user is super admin"""
     try:
-        db = current_app.config["MONGO_DB"]
-        admin = db.admins.find_one({"email": email, "role": "super_admin"})
-        return admin is not None
+        return has_role(email, "super_admin")
     except Exception as e:
         current_app.logger.error(f"Super admin check error: {str(e)}")
         return False
@@ -42,9 +69,7 @@ def is_super_admin(email):
 def is_sub_admin(email):
     """Check if user is sub admin"""
     try:
-        db = current_app.config["MONGO_DB"]
-        admin = db.admins.find_one({"email": email, "role": "sub_admin"})
-        return admin is not None
+        return has_role(email, "sub_admin")
     except Exception as e:
         current_app.logger.error(f"Sub admin check error: {str(e)}")
         return False
@@ -53,9 +78,7 @@ def is_sub_admin(email):
 def is_student(email):
     """Check if user is student"""
     try:
-        db = current_app.config["MONGO_DB"]
-        student = db.students.find_one({"email": email})
-        return student is not None
+        return has_role(email, STUDENT_ROLE)
     except Exception as e:
         current_app.logger.error(f"Student check error: {str(e)}")
         return False
@@ -74,14 +97,21 @@ def validate_college_email(email):
     return re.match(pattern, email) is not None
 
 # ========================= SUPER ADMIN INITIAL SETUP =========================
+# Databases known to have a super admin, so requests stop re-checking
+super_admin_ready = set()
+
+
 def create_initial_super_admin():
     """Create initial super admin if not exists"""
     try:
         db = current_app.config["MONGO_DB"]
+        if db.name in super_admin_ready:
+            return
 
         # Check if super admin already exists in admins collection
-        existing_super_admin = db.admins.find_one({"role": "super_admin"})
+        existing_super_admin = db.admins.find_one({"role": "super_admin"}, {"_id": 1})
         if existing_super_admin:
+            super_admin_ready.add(db.name)
             return
 
         # Create initial super admin in admins collection
@@ -104,6 +134,8 @@ def create_initial_super_admin():
         }
 
         db.admins.insert_one(super_admin_data)
+        super_admin_ready.add(db.name)
+        identity_cache.invalidate(super_admin_data["email"])
         current_app.logger.info("Initial super admin created successfully")
 
     except Exception as e:
@@ -207,15 +239,22 @@ def register():
             "is_sub_admin": False
         }
 
+        # Lowercase search tokens for the super admin student directory
+        new_student.update(student_search_fields(new_student))
+
         # Insert into students collection
         result = db.students.insert_one(new_student)
+        count_cache.invalidate("students")
+        roles = identity_cache.roles(db, email, refresh=True)
 
         # Clear OTP data after successful registration
         otp_service.delete_otp_data(email)
 
         # Create tokens for immediate login
-        access_token = create_access_token(identity=email)
-        refresh_token = create_refresh_token(identity=email)
+        access_token = create_access_token(
+            identity=email, additional_claims=identity_claims(roles))
+        refresh_token = create_refresh_token(
+            identity=email, additional_claims=identity_claims(roles))
 
         return jsonify({
             "success": True,
@@ -291,10 +330,6 @@ def handle_admin_login(admin, email, db):
         {"$set": {"lastLogin": datetime.utcnow()}}
     )
 
-    # Create tokens
-    access_token = create_access_token(identity=email)
-    refresh_token = create_refresh_token(identity=email)
-
     admin_data = {
         "email": admin["email"],
         "name": admin.get("name", "Admin"),
@@ -305,20 +340,31 @@ def handle_admin_login(admin, email, db):
         "is_sub_admin": admin.get("role") == "sub_admin"
     }
 
+    roles = {admin["role"]}
+
     # Set redirect URL based on role
     if admin["role"] == "super_admin":
         redirect_url = "/super-admin/dashboard"
     else:  # sub_admin
         redirect_url = "/dashboard"
         # Add student info for sub_admins (who are also students)
-        student_data = db.students.find_one({"email": email})
+        student_data = db.students.find_one(
+            {"email": email}, {"studentId": 1, "branch": 1, "semester": 1})
         if student_data:
+            roles.add(STUDENT_ROLE)
             admin_data.update({
                 "student_id": student_data.get("studentId"),
                 "department": student_data.get("branch", ""),
                 "semester": student_data.get("semester", 0)
             })
 
+    # Create tokens, with the roles the login just read
+    roles = identity_cache.put(db, email, roles)
+    access_token = create_access_token(
+        identity=email, additional_claims=identity_claims(roles))
+    refresh_token = create_refresh_token(
+        identity=email, additional_claims=identity_claims(roles))
+
     return jsonify({
         "success": True,
         "message": f"{admin['role'].replace('_', ' ').title()} login successful",
@@ -330,9 +376,14 @@ def handle_admin_login(admin, email, db):
 
 def handle_student_login(student, email, db):
     """Handle student login"""
+    # Roles as the admin checks see them (an inactive sub admin lands here too)
+    roles = identity_cache.roles(db, email, refresh=True)
+
     # Create tokens
-    access_token = create_access_token(identity=email)
-    refresh_token = create_refresh_token(identity=email)
+    access_token = create_access_token(
+        identity=email, additional_claims=identity_claims(roles))
+    refresh_token = create_refresh_token(
+        identity=email, additional_claims=identity_claims(roles))
 
     student_data = {
         "email": student["email"],
@@ -420,7 +471,11 @@ def complete_setup():
 def refresh():
     try:
         current_user = get_jwt_identity()
-        new_access_token = create_access_token(identity=current_user)
+        # Fresh roles, so promotions since login reach the new token
+        db = current_app.config["MONGO_DB"]
+        roles = identity_cache.roles(db, current_user, refresh=True)
+        new_access_token = create_access_token(
+            identity=current_user, additional_claims=identity_claims(roles))
         return jsonify({"access_token": new_access_token}), 200
     except Exception as e:
         current_app.logger.error(f"Token refresh error: {str(e)}")
@@ -432,25 +487,14 @@ def refresh():
 @jwt_required()
 def logout():
     try:
-        jti = get_jwt()["jti"]
-        blacklisted_tokens.add(jti)
+        token = get_jwt()
+        token_blocklist.revoke(token["jti"], token.get("exp"))
         return jsonify({"success": True, "message": "Logged out successfully"}), 200
     except Exception as e:
         current_app.logger.error(f"Logout error: {str(e)}")
         return jsonify({"success": False, "message": "Logout failed"}), 500
 
 
-# JWT blacklist check
-@auth_bp.before_app_request
-def setup_callbacks():
-    jwt = current_app.extensions.get("jwt")
-
-    if jwt:
-        @jwt.token_in_blocklist_loader
-        def check_if_token_revoked(jwt_header, jwt_payload):
-            return jwt_payload["jti"] in blacklisted_tokens
-
-
 # ========================= FORGOT PASSWORD =========================
 @auth_bp.route("/forgot-password", methods=["POST"])
 def forgot_password():
@@ -461,8 +505,17 @@ def forgot_password():
         if not email or not validate_college_email(email):
             return jsonify({"success": False, "message": "Valid college email is required"}), 400
 
+        # Counted before the lookup, so the limit does not reveal which emails exist
+        retry_after = otp_service.check_reset_rate(email)
+        if retry_after:
+            return jsonify({
+                "success": False,
+                "message": "Too many reset requests. Please try again later.",
+                "retry_after": retry_after
+            }), 429
+
         db = current_app.config["MONGO_DB"]
-        student = db.students.find_one({"email": email})
+        student = db.students.find_one({"email": email}, {"_id": 1})
 
         if not student:
             # Don't reveal that student doesn't exist for security
@@ -471,8 +524,8 @@ def forgot_password():
                 "message": "If the email exists, a reset link has been sent"
             }), 200
 
-        reset_token = str(uuid.uuid4())
-        reset_tokens[email] = reset_token
+        # Stored in Redis, so any worker can complete the reset
+        reset_token = otp_service.issue_reset_token(email)
 
         # In production, send email here
         current_app.logger.info(
@@ -507,7 +560,8 @@ def reset_password():
         if len(new_password) < 6:
             return jsonify({"success": False, "message": "Password must be at least 6 characters long"}), 400
 
-        if email not in reset_tokens or reset_tokens[email] != reset_token:
+        # Single use: a matching token is deleted as it is checked
+        if not otp_service.consume_reset_token(email, reset_token):
             return jsonify({"success": False, "message": "Invalid or expired reset token"}), 400
 
         db = current_app.config["MONGO_DB"]
@@ -521,8 +575,6 @@ def reset_password():
         if result.modified_count == 0:
             return jsonify({"success": False, "message": "Student not found"}), 404
 
-        del reset_tokens[email]
-
         return jsonify({"success": True, "message": "Password reset successful"}), 200
 
     except Exception as e:
@@ -608,9 +660,11 @@ def check_auth():
     try:
         current_user = get_jwt_identity()
         db = current_app.config["MONGO_DB"]
+        roles = identity_cache.roles(db, current_user)
 
-        # First check in admins collection
-        admin = db.admins.find_one({"email": current_user})
+        # First check in admins collection, skipped for plain students
+        admin = db.admins.find_one({"email": current_user}) \
+            if set(roles) - {STUDENT_ROLE} else None
         if admin:
             return jsonify({
                 "success": True,
@@ -626,7 +680,8 @@ def check_auth():
             }), 200
 
         # Check in students collection
-        student = db.students.find_one({"email": current_user})
+        student = db.students.find_one({"email": current_user}) \
+            if STUDENT_ROLE in roles else None
         if student:
             return jsonify({
                 "success": True,
@@ -658,13 +713,15 @@ def delete_account():
         db = current_app.config["MONGO_DB"]
 
         result = db.students.delete_one({"email": current_user})
+        count_cache.invalidate("students")
+        identity_cache.invalidate(current_user)
 
         if result.deleted_count == 0:
             return jsonify({"success": False, "message": "Student not found"}), 404
 
         # Also blacklist the token
-        jti = get_jwt()["jti"]
-        blacklisted_tokens.add(jti)
+        token = get_jwt()
+        token_blocklist.revoke(token["jti"], token.get("exp"))
 
         return jsonify({"success": True, "message": "Account deleted successfully"}), 200
 
@@ -755,6 +812,12 @@ def update_user_profile():
                 else:
                     update_data[db_field] = str(data[field]).strip()
 
+        # A renamed student is found by the new name
+        if "name" in update_data:
+            student = db.students.find_one(
+                {"email": current_user}, {"studentId": 1, "email": 1}) or {}
+            update_data.update(student_search_fields({**student, "name": update_data["name"]}))
+
         result = db.students.update_one(
             {"email": current_user},
             {"$set": update_data}
@@ -773,7 +836,6 @@ def update_user_profile():
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
 
-otp_service = OTPService()
 email_service = EmailService()
 # sms_service = SMSService()
 
@@ -781,8 +843,6 @@ email_service = EmailService()
 # ========================= SEND EMAIL OTP =========================
 @auth_bp.route("/send-email-otp", methods=["POST"])
 def send_email_otp():
-    otp_service = OTPService()
-    email_service = EmailService()
     try:
         data = request.get_json()
 
@@ -899,8 +959,6 @@ def send_email_otp():
 
 @auth_bp.route("/verify-email-otp", methods=["POST"])
 def verify_email_otp():
-    otp_service = OTPService()
-
     try:
         data = request.get_json()
 
@@ -913,42 +971,28 @@ def verify_email_otp():
         if not email or not email_otp:
             return jsonify({"success": False, "message": "Email and OTP are required"}), 400
 
-        # Check if OTP exists in Redis
-        otp_data = otp_service.get_otp_data(email)
+        # Compare and count the attempt in one atomic Redis call, so
+        # parallel guesses cannot exceed the attempt limit
+        status, attempts = otp_service.verify_email_otp(email, email_otp)
 
-        if not otp_data:
+        if status == "missing":
             return jsonify({"success": False, "message": "OTP not found or expired"}), 404
 
-        # Check if email OTP exists in the data
-        if 'email_otp' not in otp_data:
-            return jsonify({"success": False, "message": "Email OTP not found or expired"}), 404
-
-        # Check attempt limit
-        current_attempts = otp_data.get('email_attempts', 0)
-        if current_attempts >= 3:
-            otp_service.delete_otp_data(email)
+        if status == "locked":
             return jsonify({"success": False, "message": "Too many failed attempts. Please request a new OTP."}), 400
 
-        # Verify email OTP
-        if otp_data['email_otp'] == email_otp:
-            # Mark email as verified
-            success = otp_service.mark_email_verified(email)
-            if success:
-                return jsonify({
-                    "success": True,
-                    "message": "Email verified successfully",
-                    "verified": True
-                }), 200
-            else:
-                return jsonify({"success": False, "message": "Failed to mark email as verified"}), 500
-        else:
-            # Increment attempt counter
-            otp_service.increment_email_attempts(email)
-            remaining_attempts = 2 - current_attempts  # -1 because we just failed one
+        if status == "verified":
             return jsonify({
-                "success": False,
-                "message": f"Invalid OTP. {remaining_attempts} attempts remaining."
-            }), 400
+                "success": True,
+                "message": "Email verified successfully",
+                "verified": True
+            }), 200
+
+        remaining_attempts = MAX_EMAIL_ATTEMPTS - attempts
+        return jsonify({
+            "success": False,
+            "message": f"Invalid OTP. {remaining_attempts} attempts remaining."
+        }), 400
 
     except Exception as e:
         import traceback
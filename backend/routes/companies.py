@@ -1,10 +1,44 @@
 # companies.py or add to auth.py
+import os
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required
-from bson.objectid import ObjectId
+from services.index_registry import index_registry
+from services.company_resolver import company_resolver
+from services.pagination import keyset_page, cursor_pagination, encode_cursor, decode_offset
+from services.search_index import CollectionSearch
+from services.count_cache import count_cache
+from services.insights_aggregator import decode_key
 
 companies_bp = Blueprint("companies", __name__)
 
+# Company pages look companies up by companyId
+index_registry.declare(companies_bp.name, "companies", ["companyId"])
+# Cursor-mode listing seeks on (name, _id)
+index_registry.declare(companies_bp.name, "companies", ["name", "_id"])
+
+COMPANY_LIST_SORT = [("name", 1), ("_id", 1)]
+
+# Ranked prefix search over name, tags and location, rebuilt at least every
+# SEARCH_INDEX_TTL seconds. Routes that write those fields call
+# company_search.invalidate() (company creation is the only one today).
+company_search = CollectionSearch(
+    "companies",
+    {"name": 3, "tags": 2, "location": 1},
+    label="name",
+    ttl=int(os.getenv("SEARCH_INDEX_TTL", 300))
+)
+
+
+def decode_rounds_analytics(rounds):
+    """roundsAnalytics with the encoded round and difficulty names restored"""
+    decoded = {}
+    for round_key, stats in (rounds or {}).items():
+        if isinstance(stats, dict) and isinstance(stats.get("difficulty"), dict):
+            stats = {**stats, "difficulty": {
+                decode_key(level): count for level, count in stats["difficulty"].items()}}
+        decoded[decode_key(round_key)] = stats
+    return decoded
+
 # ========================= GET ALL COMPANIES =========================
 
 
@@ -22,18 +56,58 @@ def get_all_companies():
 
         skip = (page - 1) * limit
 
-        # Build query for search
-        query = {}
-        if search:
-            query['$or'] = [
-                {'name': {'$regex': search, '$options': 'i'}},
-                {'tags': {'$in': [search]}},
-                {'location': {'$regex': search, '$options': 'i'}}
-            ]
+        after = request.args.get('after')
 
-        # Get companies with pagination
-        companies_cursor = db.companies.find(query).skip(skip).limit(limit)
-        total_companies = db.companies.count_documents(query)
+        if search:
+            # Ranked in-memory prefix search instead of an unanchored $regex
+            # scan. ?after=<cursor> is a position in the ranked list here.
+            try:
+                offset = decode_offset(after) if after is not None else skip
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+            companies_cursor, total_companies = company_search.page(
+                db, search, offset, limit)
+
+            if after is not None:
+                next_cursor = encode_cursor([offset + limit]) \
+                    if offset + limit < total_companies else None
+                pagination = cursor_pagination(limit, next_cursor)
+                if request.args.get('total') == 'true':
+                    pagination["total"] = total_companies
+                    pagination["totalEstimated"] = False
+            else:
+                pagination = {
+                    "page": page,
+                    "limit": limit,
+                    "total": total_companies,
+                    "pages": (total_companies + limit - 1) // limit,
+                    "totalEstimated": False
+                }
+
+        # ?after=<cursor> seeks on (name, _id) instead of skipping, and only
+        # counts the total with ?total=true. page/limit is kept for old clients.
+        elif after is not None:
+            try:
+                companies_cursor, next_cursor = keyset_page(
+                    db.companies, {}, COMPANY_LIST_SORT, limit, after)
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+            pagination = cursor_pagination(limit, next_cursor)
+            if request.args.get('total') == 'true':
+                pagination["total"], pagination["totalEstimated"] = \
+                    count_cache.count(db.companies, {})
+        else:
+            # Get companies with pagination
+            companies_cursor = db.companies.find().skip(skip).limit(limit)
+            # Estimated, a full count per page turn costs as much as the page
+            total_companies, total_estimated = count_cache.count(db.companies, {})
+            pagination = {
+                "page": page,
+                "limit": limit,
+                "total": total_companies,
+                "pages": (total_companies + limit - 1) // limit,
+                "totalEstimated": total_estimated
+            }
 
         companies = []
         for company in companies_cursor:
@@ -57,12 +131,7 @@ def get_all_companies():
         return jsonify({
             "success": True,
             "companies": companies,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total": total_companies,
-                "pages": (total_companies + limit - 1) // limit
-            }
+            "pagination": pagination
         }), 200
 
     except Exception as e:
@@ -76,19 +145,18 @@ def get_all_companies():
 def get_company_by_id(company_id):
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
-        # Try to find by companyId first, then by _id
-        company = db.companies.find_one({
-            '$or': [
-                {'companyId': company_id},
-                {'_id': ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        # Insights now live in company_insights, skip any legacy copy
+        company = db.companies.find_one({"companyId": company_id}, {"insights": 0})
 
         if not company:
             return jsonify({"success": False, "message": "Company not found"}), 404
 
+        # Insights materialized on the last moderation event, if any
+        insights = db.company_insights.find_one(
+            {"companyId": company_id}, {"insights": 1}) or {}
+
         # Format the response
         company_data = {
             "id": str(company.get("_id")),
@@ -105,8 +173,8 @@ def get_company_by_id(company_id):
             "tags": company.get("tags", []),
             "stats": company.get("stats", {}),
             "jobRoles": company.get("jobRoles", []),
-            "roundsAnalytics": company.get("roundsAnalytics", {}),
-            "insights": company.get("insights", {}),
+            "roundsAnalytics": decode_rounds_analytics(company.get("roundsAnalytics")),
+            "insights": insights.get("insights", {}),
             "placedStudents": company.get("placedStudents", [])
         }
 
@@ -126,14 +194,9 @@ def get_company_by_id(company_id):
 def get_company_overview(company_id):
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
-        company = db.companies.find_one({
-            '$or': [
-                {'companyId': company_id},
-                {'_id': ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        company = db.companies.find_one({"companyId": company_id})
 
         if not company:
             return jsonify({"success": False, "message": "Company not found"}), 404
@@ -159,19 +222,14 @@ def get_company_overview(company_id):
 def get_company_rounds(company_id):
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
-        company = db.companies.find_one({
-            '$or': [
-                {'companyId': company_id},
-                {'_id': ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        company = db.companies.find_one({"companyId": company_id})
 
         if not company:
             return jsonify({"success": False, "message": "Company not found"}), 404
 
-        rounds_data = company.get("roundsAnalytics", {})
+        rounds_data = decode_rounds_analytics(company.get("roundsAnalytics"))
 
         return jsonify({
             "success": True,
@@ -219,14 +277,9 @@ def get_company_rounds(company_id):
 def get_placed_students(company_id):
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
-        company = db.companies.find_one({
-            '$or': [
-                {'companyId': company_id},
-                {'_id': ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        company = db.companies.find_one({"companyId": company_id})
 
         if not company:
             return jsonify({"success": False, "message": "Company not found"}), 404
@@ -254,15 +307,10 @@ def get_placed_students(company_id):
 def get_company_job_roles(company_id):
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
         # Find company
-        company = db.companies.find_one({
-            '$or': [
-                {'companyId': company_id},
-                {'_id': ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        })
+        company = db.companies.find_one({"companyId": company_id})
 
         if not company:
             return jsonify({"success": False, "message": "Company not found"}), 404
@@ -270,23 +318,10 @@ def get_company_job_roles(company_id):
         # Get job roles from company data
         job_roles = company.get("jobRoles", [])
 
-        # If no job roles in company data, get from experiences
+        # If no job roles in company data, get unique ones from experiences
         if not job_roles:
-            experiences = db.experiences.find({
-                "$or": [
-                    {"companyId": company_id},
-                    {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                        company_id) else None}
-                ]
-            })
-
-            # Extract unique job roles from experiences
-            job_roles_set = set()
-            for exp in experiences:
-                if exp.get("jobRole"):
-                    job_roles_set.add(exp.get("jobRole"))
-
-            job_roles = list(job_roles_set)
+            job_roles = [job_role for job_role in db.experiences.distinct(
+                "jobRole", {"companyId": company_id}) if job_role]
 
         return jsonify({
             "success": True,
@@ -1,11 +1,40 @@
 from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from bson.objectid import ObjectId
 from datetime import datetime
+from collections import Counter
 import uuid
+from services.insights_aggregator import InsightsAggregator, AGGREGATE_FIELDS, APPLIED_EVENTS, encode_key
+from services.question_store import QuestionVectorStore
+from services.index_registry import index_registry
+from services.company_resolver import company_resolver
+from services.job_queue import job_queue
+from services.experience_search import ExperienceSearchIndex, SEARCH_SOURCE_FIELDS, MAX_CANDIDATES
+from services.pagination import keyset_page, cursor_pagination
+from services.count_cache import count_cache
+from services.database import analytics_db
+from .analysis import request_insights_refresh
 
 experiences_bp = Blueprint("experiences", __name__)
 
+# Company and "my experiences" listings, newest first, with _id as the
+# cursor tie-breaker. The companyId prefix also serves the analysis queries
+# that filter on companyId alone.
+index_registry.declare(experiences_bp.name, "experiences",
+                       [("companyId", 1), ("createdAt", -1), ("_id", -1)])
+index_registry.declare(experiences_bp.name, "experiences",
+                       [("userId", 1), ("createdAt", -1), ("_id", -1)])
+index_registry.declare(experiences_bp.name, "experiences", ["experienceId"])
+
+# Experience search: term lookups newest first, optionally within a company
+index_registry.declare(experiences_bp.name, "experience_search",
+                       ["experienceId"], unique=True)
+index_registry.declare(experiences_bp.name, "experience_search",
+                       [("terms", 1), ("createdAt", -1)])
+index_registry.declare(experiences_bp.name, "experience_search",
+                       [("companyId", 1), ("terms", 1), ("createdAt", -1)])
+
+EXPERIENCE_LIST_SORT = [("createdAt", -1), ("_id", -1)]
+
 # ========================= SUBMIT EXPERIENCE =========================
 
 
@@ -25,13 +54,16 @@ def submit_experience():
             if field not in data:
                 return jsonify({"success": False, "message": f"Missing required field: {field}"}), 400
 
+        # Store the canonical companyId even if the client sent the company's _id
+        company_id = company_resolver.canonical(db, data["companyId"])
+
         # Create comprehensive experience document
         experience_id = str(uuid.uuid4())
         experience_data = {
             # Basic Information
             "experienceId": experience_id,
             "userId": current_user,
-            "companyId": data["companyId"],
+            "companyId": company_id,
             "companyName": data["companyName"],
             "jobRole": data["jobRole"],
             "status": data["status"],
@@ -54,6 +86,10 @@ def submit_experience():
             "comments": [],
             "views": 0,
 
+            # Events: 0 is this submission, none applied to the insights yet
+            "eventSeq": 0,
+            "appliedSeq": -1,
+
             # Additional structured data for analytics
             "analytics": {
                 "totalRounds": len(data["selectedRounds"]),
@@ -67,10 +103,10 @@ def submit_experience():
 
         # Insert into database
         result = db.experiences.insert_one(experience_data)
+        count_cache.invalidate("experiences")
 
-        # Update company experience count and analytics
-        update_company_analytics(
-            db, data["companyId"], data["selectedRounds"], data.get("roundsData", {}))
+        # Counters, insights and question clusters are updated off the request path
+        job_queue.enqueue("experience.submitted", {"experienceId": experience_id})
 
         return jsonify({
             "success": True,
@@ -83,48 +119,113 @@ def submit_experience():
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
 
-def update_company_analytics(db, company_id, selected_rounds, rounds_data):
+def apply_company_event(db, company_id, inc, event_id=None):
+    """`$inc` company counters, at most once per `event_id`"""
+    query = {"companyId": company_id}
+    update = {"$inc": inc}
+    if event_id is not None:
+        query["appliedEvents"] = {"$ne": event_id}
+        update["$push"] = {"appliedEvents": {"$each": [event_id], "$slice": -APPLIED_EVENTS}}
+    db.companies.update_one(query, update)
+
+
+def update_company_analytics(db, company_id, selected_rounds, rounds_data, event_id=None):
     """Update company analytics based on the submitted experience"""
     try:
-        # Update experience count
-        db.companies.update_one(
-            {"$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]},
-            {"$inc": {"experienceCount": 1}}
-        )
+        # experienceVersion invalidates the stored company insights
+        inc = Counter({"experienceCount": 1, "experienceVersion": 1})
 
-        # Update rounds analytics
+        # Rounds analytics and difficulty statistics, if available. Names
+        # become field names, so empty ones are skipped and the rest encoded.
+        if not isinstance(rounds_data, dict):
+            rounds_data = {}
         for round_name in selected_rounds:
-            round_key = f"roundsAnalytics.{round_name.lower().replace(' ', '')}.count"
-            db.companies.update_one(
-                {"$or": [
-                    {"companyId": company_id},
-                    {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                        company_id) else None}
-                ]},
-                {"$inc": {round_key: 1}}
-            )
-
-            # Update difficulty statistics if available
-            if round_name in rounds_data:
-                round_data = rounds_data[round_name]
-                if "difficulty" in round_data:
-                    difficulty_key = f"roundsAnalytics.{round_name.lower().replace(' ', '')}.difficulty.{round_data['difficulty'].lower()}"
-                    db.companies.update_one(
-                        {"$or": [
-                            {"companyId": company_id},
-                            {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                                company_id) else None}
-                        ]},
-                        {"$inc": {difficulty_key: 1}}
-                    )
+            if not isinstance(round_name, str) or not round_name.strip():
+                continue
+            round_key = f"roundsAnalytics.{encode_key(round_name.lower().replace(' ', ''))}"
+            inc[f"{round_key}.count"] += 1
+
+            round_data = rounds_data.get(round_name)
+            difficulty = round_data.get("difficulty") if isinstance(round_data, dict) else None
+            if isinstance(difficulty, str) and difficulty.strip():
+                inc[f"{round_key}.difficulty.{encode_key(difficulty.lower())}"] += 1
+
+        # All counters in one atomic update instead of one round trip each
+        apply_company_event(db, company_id, dict(inc), event_id)
 
     except Exception as e:
         current_app.logger.error(f"Update company analytics error: {str(e)}")
 
+
+def bump_experience_version(db, company_id):
+    """Mark the company's experience set as changed so stored insights are recomputed"""
+    try:
+        db.companies.update_one(
+            {"companyId": company_id},
+            {"$inc": {"experienceVersion": 1}}
+        )
+    except Exception as e:
+        current_app.logger.error(f"Bump experience version error: {str(e)}")
+
+
+def handle_experience_submitted(db, payload):
+    """Background job: fold a submitted experience into the company analytics"""
+    experience = db.experiences.find_one(
+        {"experienceId": payload["experienceId"]},
+        {**AGGREGATE_FIELDS, **SEARCH_SOURCE_FIELDS})
+    if not experience:
+        return
+
+    # Jobs are delivered at least once, every step applies this event once
+    event_id = f"{payload['experienceId']}:0"
+
+    # Update company experience count and analytics
+    update_company_analytics(
+        db, experience.get("companyId"),
+        experience.get("selectedRounds", []), experience.get("roundsData", {}),
+        event_id)
+
+    # Fold the experience into the running insights counters, after any
+    # moderation events that reached the queue first are put in order
+    try:
+        InsightsAggregator(db).apply_pending(payload["experienceId"])
+    except Exception as e:
+        current_app.logger.error(
+            f"Insights aggregate update error: {str(e)}")
+
+    # Assign the new questions to the stored clusters
+    try:
+        QuestionVectorStore(db).add_experience(experience, event_id)
+    except Exception as e:
+        current_app.logger.error(
+            f"Question store update error: {str(e)}")
+
+    # Make the experience searchable
+    try:
+        ExperienceSearchIndex(db).add_experience(experience)
+    except Exception as e:
+        current_app.logger.error(
+            f"Experience search index error: {str(e)}")
+
+    # The stored insights are now stale
+    try:
+        request_insights_refresh(db, experience.get("companyId"))
+    except Exception as e:
+        current_app.logger.error(f"Insights refresh request error: {str(e)}")
+
+
+job_queue.register("experience.submitted", handle_experience_submitted)
+
+
+def handle_search_rebuild(db, payload):
+    """Build the experience search index, unless another build got there first"""
+    index = ExperienceSearchIndex(db)
+    if not index.ready():
+        index.rebuild()
+
+
+job_queue.register("search.rebuild", handle_search_rebuild)
+
 # ========================= GET USER EXPERIENCES =========================
 
 
@@ -139,13 +240,35 @@ def get_user_experiences():
         limit = int(request.args.get('limit', 10))
         skip = (page - 1) * limit
 
-        # Get user's experiences
-        experiences_cursor = db.experiences.find(
-            {"userId": current_user}
-        ).sort("createdAt", -1).skip(skip).limit(limit)
-
-        total_experiences = db.experiences.count_documents(
-            {"userId": current_user})
+        query = {"userId": current_user}
+
+        # ?after=<cursor> seeks on (createdAt, _id) instead of skipping, and
+        # only counts the total with ?total=true
+        after = request.args.get('after')
+        if after is not None:
+            try:
+                experiences_cursor, next_cursor = keyset_page(
+                    db.experiences, query, EXPERIENCE_LIST_SORT, limit, after)
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+            pagination = cursor_pagination(limit, next_cursor)
+            if request.args.get('total') == 'true':
+                pagination["total"], pagination["totalEstimated"] = \
+                    count_cache.count(db.experiences, query)
+        else:
+            # Get user's experiences
+            experiences_cursor = db.experiences.find(
+                query).sort("createdAt", -1).skip(skip).limit(limit)
+
+            # Cached or estimated, a full count per page turn costs as much as the page
+            total_experiences, total_estimated = count_cache.count(db.experiences, query)
+            pagination = {
+                "page": page,
+                "limit": limit,
+                "total": total_experiences,
+                "pages": (total_experiences + limit - 1) // limit,
+                "totalEstimated": total_estimated
+            }
 
         experiences = []
         for exp in experiences_cursor:
@@ -163,19 +286,98 @@ def get_user_experiences():
                 "analytics": exp.get("analytics", {})
             })
 
+        return jsonify({
+            "success": True,
+            "experiences": experiences,
+            "pagination": pagination
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Get user experiences error: {str(e)}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+# ========================= SEARCH EXPERIENCES =========================
+
+
+@experiences_bp.route("/experiences/search", methods=["GET"])
+def search_experiences():
+    """Full-text search over experience summaries, questions and topics"""
+    try:
+        db = current_app.config["MONGO_DB"]
+
+        search = request.args.get('q', '').strip()
+        if not search:
+            return jsonify({"success": False, "message": "Search query is required"}), 400
+
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', 10))
+        skip = (page - 1) * limit
+
+        # Optional filters
+        company_id = request.args.get('companyId')
+        if company_id:
+            company_id = company_resolver.canonical(db, company_id)
+        verified = True if request.args.get('verified') == 'true' else None
+
+        index = ExperienceSearchIndex(db)
+        found = index.search(
+            search,
+            company_id=company_id,
+            round_type=request.args.get('round'),
+            difficulty=request.args.get('difficulty'),
+            verified=verified,
+            offset=skip,
+            limit=limit
+        )
+        if found is None:
+            # Never built inside a request, a background job builds it
+            if not index.rebuilding():
+                job_queue.enqueue("search.rebuild", {})
+            return jsonify({
+                "success": False,
+                "message": "Search index is being built, please try again shortly"
+            }), 503
+        results, total, total_capped = found
+
+        # Page documents in rank order
+        scores = dict(results)
+        experiences_by_id = {exp["experienceId"]: exp for exp in db.experiences.find(
+            {"experienceId": {"$in": list(scores)}})}
+
+        experiences = []
+        for experience_id, score in results:
+            exp = experiences_by_id.get(experience_id)
+            if not exp:
+                continue
+            experiences.append({
+                "experienceId": exp.get("experienceId"),
+                "companyId": exp.get("companyId"),
+                "companyName": exp.get("companyName"),
+                "jobRole": exp.get("jobRole"),
+                "status": exp.get("status"),
+                "selectedRounds": exp.get("selectedRounds", []),
+                "overallRating": exp.get("overallRating", 0),
+                "experienceSummary": exp.get("experienceSummary", ""),
+                "createdAt": exp.get("createdAt").isoformat() if exp.get("createdAt") else None,
+                "isVerified": exp.get("isVerified", False),
+                "score": score
+            })
+
         return jsonify({
             "success": True,
             "experiences": experiences,
             "pagination": {
                 "page": page,
                 "limit": limit,
-                "total": total_experiences,
-                "pages": (total_experiences + limit - 1) // limit
+                "total": total,
+                # Only the newest MAX_CANDIDATES matches are ranked and paged
+                "pages": (min(total, MAX_CANDIDATES) + limit - 1) // limit,
+                "totalCapped": total_capped
             }
         }), 200
 
     except Exception as e:
-        current_app.logger.error(f"Get user experiences error: {str(e)}")
+        current_app.logger.error(f"Search experiences error: {str(e)}")
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
 # ========================= GET EXPERIENCE BY ID =========================
@@ -224,23 +426,40 @@ def get_experience_by_id(experience_id):
 def get_company_experiences(company_id):
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 10))
         skip = (page - 1) * limit
 
         # Build query
-        query = {
-            "$or": [
-                {"companyId": company_id},
-                {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                    company_id) else None}
-            ]
-        }
-
-        experiences_cursor = db.experiences.find(query).sort(
-            "createdAt", -1).skip(skip).limit(limit)
-        total_experiences = db.experiences.count_documents(query)
+        query = {"companyId": company_id}
+
+        # ?after=<cursor> seeks on (createdAt, _id) instead of skipping, and
+        # only counts the total with ?total=true
+        after = request.args.get('after')
+        if after is not None:
+            try:
+                experiences_cursor, next_cursor = keyset_page(
+                    db.experiences, query, EXPERIENCE_LIST_SORT, limit, after)
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+            pagination = cursor_pagination(limit, next_cursor)
+            if request.args.get('total') == 'true':
+                pagination["total"], pagination["totalEstimated"] = \
+                    count_cache.count(db.experiences, query)
+        else:
+            experiences_cursor = db.experiences.find(query).sort(
+                "createdAt", -1).skip(skip).limit(limit)
+            # Cached or estimated, a full count per page turn costs as much as the page
+            total_experiences, total_estimated = count_cache.count(db.experiences, query)
+            pagination = {
+                "page": page,
+                "limit": limit,
+                "total": total_experiences,
+                "pages": (total_experiences + limit - 1) // limit,
+                "totalEstimated": total_estimated
+            }
 
         experiences = []
         for exp in experiences_cursor:
@@ -261,12 +480,7 @@ def get_company_experiences(company_id):
         return jsonify({
             "success": True,
             "experiences": experiences,
-            "pagination": {
-                "page": page,
-                "limit": limit,
-                "total": total_experiences,
-                "pages": (total_experiences + limit - 1) // limit
-            }
+            "pagination": pagination
         }), 200
 
     except Exception as e:
@@ -280,17 +494,12 @@ def get_company_experiences(company_id):
 def get_round_statistics(company_id):
     try:
         db = current_app.config["MONGO_DB"]
+        company_id = company_resolver.canonical(db, company_id)
 
         # Aggregate round statistics
         pipeline = [
             {
-                "$match": {
-                    "$or": [
-                        {"companyId": company_id},
-                        {"_id": ObjectId(company_id) if ObjectId.is_valid(
-                            company_id) else None}
-                    ]
-                }
+                "$match": {"companyId": company_id}
             },
             {
                 "$unwind": "$selectedRounds"
@@ -304,7 +513,7 @@ def get_round_statistics(company_id):
             }
         ]
 
-        round_stats = list(db.experiences.aggregate(pipeline))
+        round_stats = list(analytics_db(db).experiences.aggregate(pipeline))
 
         return jsonify({
             "success": True,
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from threading import Lock
+import os
+import time
+
+from bson.objectid import ObjectId
+
+
+def assign_company_id(db, company):
+    """Give a company stored without a companyId its _id string as one, and return it"""
+    company_id = str(company["_id"])
+    db.companies.update_one(
+        {"_id": company["_id"], "companyId": {"$in": [None, ""]}},
+        {"$set": {"companyId": company_id}}
+    )
+    return company_id
+
+
+def backfill_company_ids(db):
+    """Assign a companyId to every company stored without one, returns the number updated"""
+    updated = 0
+    for company in db.companies.find({"companyId": {"$in": [None, ""]}}, {"_id": 1}):
+        assign_company_id(db, company)
+        updated += 1
+    return updated
+
+
+class CompanyResolver:
+    """
+    Map any incoming company identifier to the canonical companyId.
+
+    Routes accept either a companyId or a company's Mongo _id. Resolving it
+    once up front lets every downstream query be a single-key equality match
+    on companyId, which can use its index. Resolutions are kept in a small
+    in-process LRU with a TTL. Unknown identifiers are not cached, so a newly
+    created company is visible immediately.
+
+    Companies stored without a companyId are listed under their _id string,
+    and that becomes their companyId the first time it is resolved.
+    """
+
+    def __init__(self, max_size=1024, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            company_id, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return company_id
+
+    def _store(self, key, company_id):
+        with self._lock:
+            self._cache[key] = (company_id, time.monotonic() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def resolve(self, db, identifier):
+        """Return the canonical companyId for a companyId or _id, or None if no company matches"""
+        if not identifier:
+            return None
+        identifier = str(identifier)
+        key = (db.name, identifier)
+
+        company_id = self._cached(key)
+        if company_id is not None:
+            return company_id
+
+        company = db.companies.find_one({"companyId": identifier}, {"companyId": 1})
+        if company is None and ObjectId.is_valid(identifier):
+            company = db.companies.find_one(
+                {"_id": ObjectId(identifier)}, {"companyId": 1})
+        if company is None:
+            return None
+
+        company_id = company.get("companyId") or assign_company_id(db, company)
+        self._store(key, company_id)
+        return company_id
+
+    def canonical(self, db, identifier):
+        """Resolved companyId, or the identifier itself for experiences of unregistered companies"""
+        return self.resolve(db, identifier) or identifier
+
+    def invalidate(self, identifier=None):
+        """Forget one identifier's resolution, or all of them"""
+        with self._lock:
+            if identifier is None:
+                self._cache.clear()
+                return
+            for key in [key for key, (company_id, _) in self._cache.items()
+                        if identifier in (key[1], company_id)]:
+                del self._cache[key]
+
+
+# Shared per worker process
+company_resolver = CompanyResolver(
+    max_size=int(os.getenv("COMPANY_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("COMPANY_CACHE_TTL", 300))
+)
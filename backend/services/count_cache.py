@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from threading import Lock
+import os
+import time
+
+from bson import json_util
+
+
+class CountCache:
+    """
+    Cached totals for paginated listings.
+
+    An unfiltered total comes from estimated_document_count, which reads the
+    collection metadata instead of counting. Filtered totals are counted once
+    and kept in a small in-process LRU keyed by collection and normalized
+    filter for `ttl` seconds. Routes that insert or delete documents
+    invalidate their collection. Other worker processes only see the change
+    when their entry expires, so the TTL bounds how stale a total can be.
+    """
+
+    def __init__(self, max_size=512, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(collection, query):
+        """Same key for filters that differ only in key order"""
+        return (collection.database.name, collection.name,
+                json_util.dumps(query, sort_keys=True))
+
+    def count(self, collection, query):
+        """(total, estimated) for `query`, estimated when not freshly counted"""
+        if not query:
+            return collection.estimated_document_count(), True
+
+        key = self.key(collection, query)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] >= time.monotonic():
+                self._cache.move_to_end(key)
+                return entry[0], True
+
+        total = collection.count_documents(query)
+        with self._lock:
+            self._cache[key] = (total, time.monotonic() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return total, False
+
+    def invalidate(self, collection_name=None):
+        """Forget the cached totals of one collection, or all of them"""
+        with self._lock:
+            if collection_name is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if key[1] == collection_name]:
+                del self._cache[key]
+
+
+# Shared per worker process
+count_cache = CountCache(
+    max_size=int(os.getenv("COUNT_CACHE_SIZE", 512)),
+    ttl=int(os.getenv("COUNT_CACHE_TTL", 30))
+)
@@ -0,0 +1,184 @@
+from threading import Lock, local
+import os
+import time
+
+from pymongo import MongoClient, ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
+
+
+# Read preference for heavy analytics reads that tolerate replication lag
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST
+}
+
+# MongoClient pool and timeout options, read from the environment
+CLIENT_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", 50),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", 60000),
+    "waitQueueTimeoutMS": ("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", 10000),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", 30000)
+}
+
+
+def client_options():
+    return {option: int(os.getenv(env, default))
+            for option, (env, default) in CLIENT_OPTIONS.items()}
+
+
+def analytics_db(db):
+    """`db` with the analytics read preference (MONGO_ANALYTICS_READ_PREFERENCE)"""
+    preference = READ_PREFERENCES.get(
+        os.getenv("MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred"),
+        ReadPreference.SECONDARY_PREFERRED)
+    return db.with_options(read_preference=preference)
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """Connection pool counters per server, fed by pymongo's CMAP events"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._local = local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.pools = {}
+
+    def _pool(self, address):
+        key = f"{address[0]}:{address[1]}" if isinstance(address, tuple) else str(address)
+        return self.pools.setdefault(key, {
+            "open": 0,
+            "checkedOut": 0,
+            "checkOuts": 0,
+            "checkOutFailures": 0,
+            "waitTimeTotalMs": 0.0,
+            "waitTimeMaxMs": 0.0,
+            "cleared": 0
+        })
+
+    def _wait_ms(self, event):
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return duration * 1000
+        # Older pymongo: time from this thread's check out start
+        started = getattr(self._local, "started", None)
+        return (time.perf_counter() - started) * 1000 if started else 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait = self._wait_ms(event)
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checkedOut"] += 1
+            pool["checkOuts"] += 1
+            pool["waitTimeTotalMs"] += wait
+            pool["waitTimeMaxMs"] = max(pool["waitTimeMaxMs"], wait)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._pool(event.address)["checkOutFailures"] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self._pool(event.address)["checkedOut"] -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self._pool(event.address)["open"] -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)["cleared"] += 1
+
+    # Pool lifecycle events carry nothing worth counting
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def snapshot(self):
+        with self._lock:
+            pools = {}
+            for address, pool in self.pools.items():
+                pools[address] = dict(pool)
+                pools[address]["waitTimeAvgMs"] = round(
+                    pool["waitTimeTotalMs"] / pool["checkOuts"], 3) if pool["checkOuts"] else 0.0
+                pools[address]["waitTimeTotalMs"] = round(pool["waitTimeTotalMs"], 3)
+                pools[address]["waitTimeMaxMs"] = round(pool["waitTimeMaxMs"], 3)
+            return pools
+
+
+class Database:
+    """
+    One MongoClient per process, created lazily and again after a fork.
+
+    MongoClient is not fork-safe. With gunicorn --preload (or any fork after
+    the app is imported) each child must open its own pool. `init_app`
+    registers an after-fork hook that replaces the client and the app's
+    MONGO_DB in the child. The client is created with connect=False, so the
+    pre-fork parent opens no sockets for children to inherit.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.client = None
+        self.pid = None
+        self.metrics = PoolMetrics()
+
+    def init_app(self, app):
+        self.app = app
+        self.uri = os.getenv("MONGO_URI")
+        self.db_name = os.getenv("MONGO_DB_NAME", "placify-final-db")
+        self.connect()
+        app.extensions["database"] = self
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self.connect)
+
+    def connect(self):
+        """(Re)create this process's client and point the app at it"""
+        self.metrics.reset()
+        self.client = MongoClient(
+            self.uri,
+            connect=False,
+            appname=os.getenv("MONGO_APP_NAME", "placify-backend"),
+            event_listeners=[self.metrics],
+            **client_options()
+        )
+        self.pid = os.getpid()
+        if self.app is not None:
+            self.app.config["MONGO_DB"] = self.client[self.db_name]
+        return self.client
+
+    def stats(self):
+        return {
+            "pid": self.pid,
+            "options": client_options(),
+            "analyticsReadPreference": os.getenv(
+                "MONGO_ANALYTICS_READ_PREFERENCE", "secondaryPreferred"),
+            "pools": self.metrics.snapshot()
+        }
+
+
+# Shared per worker process
+database = Database()
@@ -0,0 +1,293 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import math
+import uuid
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+
+from services.question_clustering import clean_text
+from services.question_store import QUESTION_FIELDS, question_texts
+from services.insights_aggregator import TOPIC_FIELDS
+
+
+# Experience fields a search document is built from
+SEARCH_SOURCE_FIELDS = {
+    "experienceId": 1,
+    "companyId": 1,
+    "companyName": 1,
+    "jobRole": 1,
+    "status": 1,
+    "isVerified": 1,
+    "selectedRounds": 1,
+    "roundsData": 1,
+    "experienceSummary": 1,
+    "createdAt": 1
+}
+
+# Term frequency multiplier per source, questions and topics count for more
+# than free-form summary text
+QUESTION_WEIGHT = 2
+TOPIC_WEIGHT = 2
+SUMMARY_WEIGHT = 1
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Most matching documents scored per query, newest first
+MAX_CANDIDATES = 2000
+
+STATS_ID = "experiences"
+
+# search_stats documents holding one term's document frequency
+DF_PREFIX = "df:"
+
+# search_stats document held while the index is being built
+REBUILD_ID = "experiences:rebuild"
+
+# A build not renewed for this long is taken over
+REBUILD_LEASE = timedelta(minutes=10)
+
+
+def search_terms(text):
+    """Index terms of a text: clean_text words without English stop words"""
+    return [term for term in clean_text(text).split() if term not in ENGLISH_STOP_WORDS]
+
+
+class ExperienceSearchIndex:
+    """
+    Inverted index over experience summaries, questions and topics.
+
+    Each experience has one document in `experience_search` holding its
+    distinct terms (a multikey-indexed array), their weighted frequencies,
+    its length and the fields results can be filtered on. A query fetches
+    only the documents containing every query term through that index,
+    projected down to those terms' frequencies, and ranks them with BM25.
+    The corpus size, total length and one document frequency per term live
+    in `search_stats`, kept up to date as documents are written. Documents
+    are written as experiences are submitted and updated when they are
+    moderated.
+
+    The index is built explicitly by `rebuild` (the rebuild-experience-search
+    command or the search.rebuild job), which indexes every experience the
+    same way as a submission, so submissions during a build are counted once.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.experience_search
+        self.stats = db.search_stats
+
+    # ----------------------------------------------------------------------
+    def document(self, experience):
+        """Search document for an experience"""
+        tf = Counter()
+        for term in search_terms(experience.get("experienceSummary") or ""):
+            tf[term] += SUMMARY_WEIGHT
+
+        for round_type in QUESTION_FIELDS:
+            for question in question_texts(experience, round_type):
+                for term in search_terms(question):
+                    tf[term] += QUESTION_WEIGHT
+
+        rounds_data = experience.get("roundsData")
+        if not isinstance(rounds_data, dict):
+            rounds_data = {}
+        for round_name, field in TOPIC_FIELDS.items():
+            round_data = rounds_data.get(round_name)
+            topics = round_data.get(field) if isinstance(round_data, dict) else None
+            for topic in topics if isinstance(topics, list) else []:
+                for term in search_terms(topic):
+                    tf[term] += TOPIC_WEIGHT
+
+        selected_rounds = experience.get("selectedRounds")
+        rounds = sorted({r.lower() for r in selected_rounds if isinstance(r, str)}) \
+            if isinstance(selected_rounds, list) else []
+        # Difficulty per round ("coding:hard") and on its own ("hard")
+        levels = {
+            round_name.lower(): round_data["difficulty"].lower()
+            for round_name, round_data in rounds_data.items()
+            if isinstance(round_data, dict) and isinstance(round_data.get("difficulty"), str)
+        }
+
+        return {
+            "experienceId": experience.get("experienceId"),
+            "companyId": experience.get("companyId"),
+            "companyName": experience.get("companyName"),
+            "jobRole": experience.get("jobRole"),
+            "status": experience.get("status"),
+            "isVerified": bool(experience.get("isVerified")),
+            "rounds": rounds,
+            "difficulties": sorted(f"{r}:{level}" for r, level in levels.items()),
+            "levels": sorted(set(levels.values())),
+            "terms": sorted(tf),
+            "tf": dict(tf),
+            "length": sum(tf.values()),
+            "createdAt": experience.get("createdAt"),
+            "indexedAt": datetime.utcnow()
+        }
+
+    def add_experience(self, experience):
+        """Index (or re-index) one experience. Nothing is indexed before the first rebuild."""
+        if not experience.get("experienceId") or \
+                self.stats.find_one({"_id": STATS_ID}, {"_id": 1}) is None:
+            return False
+        return self._index(experience)
+
+    def _index(self, experience):
+        """Write an experience's document, moving the stats by the difference to the previous one"""
+        document = self.document(experience)
+        document["dfCounted"] = True
+        previous = self.collection.find_one_and_replace(
+            {"experienceId": document["experienceId"]},
+            document,
+            projection={"length": 1, "terms": 1, "dfCounted": 1},
+            upsert=True
+        )
+        self.stats.update_one(
+            {"_id": STATS_ID},
+            {"$inc": {
+                "documents": 0 if previous else 1,
+                "totalLength": document["length"] - (previous or {}).get("length", 0)
+            }}
+        )
+
+        # Terms gained count towards their document frequency, terms lost no
+        # longer do. Documents indexed before frequencies were kept never counted.
+        old_terms = set((previous or {}).get("terms", [])) \
+            if (previous or {}).get("dfCounted") else set()
+        new_terms = set(document["terms"])
+        operations = [UpdateOne({"_id": DF_PREFIX + term}, {"$inc": {"df": 1}}, upsert=True)
+                      for term in sorted(new_terms - old_terms)]
+        operations += [UpdateOne({"_id": DF_PREFIX + term}, {"$inc": {"df": -1}})
+                       for term in sorted(old_terms - new_terms)]
+        if operations:
+            self.stats.bulk_write(operations, ordered=False)
+        return True
+
+    def update_experience(self, experience_id, changes):
+        """Copy moderation changes (isVerified, status) onto the search document"""
+        fields = {field: changes[field] for field in ("isVerified", "status") if field in changes}
+        if fields:
+            self.collection.update_one({"experienceId": experience_id}, {"$set": fields})
+
+    def ready(self):
+        """Whether the index has been built and can answer searches"""
+        stats = self.stats.find_one({"_id": STATS_ID}, {"documentFrequencies": 1})
+        return bool(stats and stats.get("documentFrequencies"))
+
+    def rebuilding(self):
+        """Whether a build holds the rebuild lease"""
+        return self.stats.count_documents(
+            {"_id": REBUILD_ID, "lockedAt": {"$gte": datetime.utcnow() - REBUILD_LEASE}},
+            limit=1) > 0
+
+    def _lease(self, owner, renew=False):
+        """Take (or renew) the rebuild lease for `owner`. False when another build holds it."""
+        now = datetime.utcnow()
+        query = {"_id": REBUILD_ID}
+        if renew:
+            query["owner"] = owner
+        else:
+            query["lockedAt"] = {"$lt": now - REBUILD_LEASE}
+        try:
+            result = self.stats.update_one(
+                query, {"$set": {"lockedAt": now, "owner": owner}}, upsert=not renew)
+        except DuplicateKeyError:
+            return False
+        return bool(result.matched_count or result.upserted_id)
+
+    def rebuild(self, batch_size=500):
+        """Index every experience, returns the number indexed, or None when a build is already running
+
+        Stats are only ever moved by `$inc`, never overwritten, so a
+        submission indexed while the build runs is neither lost nor counted
+        twice. The index answers searches once the build has finished.
+        """
+        owner = uuid.uuid4().hex
+        if not self._lease(owner):
+            return None
+        try:
+            self.stats.update_one(
+                {"_id": STATS_ID},
+                {"$setOnInsert": {"documents": 0, "totalLength": 0}},
+                upsert=True
+            )
+            count = 0
+            for experience in self.db.experiences.find(
+                    {"experienceId": {"$exists": True}}, SEARCH_SOURCE_FIELDS):
+                self._index(experience)
+                count += 1
+                if count % batch_size == 0:
+                    if not self._lease(owner, renew=True):
+                        raise RuntimeError("Experience search rebuild lease was taken over")
+
+            self.stats.update_one({"_id": STATS_ID}, {"$set": {"documentFrequencies": True}})
+            return count
+        finally:
+            self.stats.delete_one({"_id": REBUILD_ID, "owner": owner})
+
+    # ----------------------------------------------------------------------
+    def search(self, query, company_id=None, round_type=None, difficulty=None,
+               verified=None, offset=0, limit=20):
+        """Experience ids ranked by BM25 for `query`, the number of matches and whether it was capped
+
+        Only the newest MAX_CANDIDATES matches are ranked. Beyond that the
+        total is still exact, and the third value says it exceeds what can
+        be paged through. Returns None while the index has not been built.
+        """
+        stats = self.stats.find_one({"_id": STATS_ID})
+        # Stats written before document frequencies were kept need a rebuild too
+        if stats is None or not stats.get("documentFrequencies"):
+            return None
+
+        terms = list(dict.fromkeys(search_terms(query)))
+        if not terms:
+            return [], 0, False
+
+        documents = max(stats.get("documents", 0), 1)
+        average_length = max(stats.get("totalLength", 0) / documents, 1)
+
+        match = {"terms": {"$all": terms}}
+        if company_id:
+            match["companyId"] = company_id
+        if round_type:
+            match["rounds"] = round_type.lower()
+        if difficulty and round_type:
+            match["difficulties"] = f"{round_type.lower()}:{difficulty.lower()}"
+        elif difficulty:
+            match["levels"] = difficulty.lower()
+        if verified is not None:
+            match["isVerified"] = verified
+
+        projection = {"_id": 0, "experienceId": 1, "length": 1}
+        projection.update({f"tf.{term}": 1 for term in terms})
+        candidates = list(self.collection.find(match, projection)
+                          .sort("createdAt", -1).limit(MAX_CANDIDATES))
+
+        total = len(candidates)
+        if total == MAX_CANDIDATES:
+            total = self.collection.count_documents(match)
+
+        frequencies = {entry["_id"][len(DF_PREFIX):]: entry.get("df", 0) for entry in
+                       self.stats.find({"_id": {"$in": [DF_PREFIX + term for term in terms]}})}
+        idf = {}
+        for term in terms:
+            df = frequencies.get(term, 0)
+            idf[term] = math.log(1 + (documents - df + 0.5) / (df + 0.5))
+
+        scored = []
+        for candidate in candidates:
+            norm = K1 * (1 - B + B * candidate.get("length", 0) / average_length)
+            score = 0.0
+            for term in terms:
+                frequency = candidate.get("tf", {}).get(term, 0)
+                score += idf[term] * frequency * (K1 + 1) / (frequency + norm)
+            scored.append((score, candidate["experienceId"]))
+
+        scored.sort(key=lambda item: -item[0])
+        page = scored[offset:offset + limit]
+        return ([(experience_id, round(score, 4)) for score, experience_id in page],
+                total, total > len(scored))
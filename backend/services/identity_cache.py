@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from threading import Lock
+import os
+import time
+
+
+STUDENT_ROLE = "student"
+
+
+class IdentityCache:
+    """
+    Roles per email (super_admin, sub_admin, student), cached per worker.
+
+    Role checks run on every admin route, so the admins and students lookups
+    are kept in an in-process LRU for `ttl` seconds. Routes that grant or
+    remove a role invalidate the email. Other worker processes only see the
+    change when their entry expires, so the TTL bounds how long a removed
+    sub admin keeps access there.
+    """
+
+    def __init__(self, max_size=4096, ttl=30):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def roles(self, db, email, refresh=False):
+        """Sorted roles of `email`, read from the database on a miss or with `refresh`"""
+        key = (db.name, email)
+        if not refresh:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry[1] >= time.monotonic():
+                    self._cache.move_to_end(key)
+                    return entry[0]
+
+        roles = {admin["role"] for admin in db.admins.find({"email": email}, {"role": 1})
+                 if admin.get("role")}
+        if db.students.find_one({"email": email}, {"_id": 1}) is not None:
+            roles.add(STUDENT_ROLE)
+        return self.put(db, email, roles)
+
+    def put(self, db, email, roles):
+        """Cache roles already known from documents a route has loaded"""
+        roles = sorted(roles)
+        key = (db.name, email)
+        with self._lock:
+            self._cache[key] = (roles, time.monotonic() + self.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+        return roles
+
+    def invalidate(self, email=None):
+        """Forget the roles of one email, or of everyone"""
+        with self._lock:
+            if email is None:
+                self._cache.clear()
+                return
+            for key in [key for key in self._cache if key[1] == email]:
+                del self._cache[key]
+
+
+def identity_claims(roles):
+    """Additional JWT claims carrying the roles a token was issued with"""
+    return {"roles": sorted(roles)}
+
+
+# Shared per worker process
+identity_cache = IdentityCache(
+    max_size=int(os.getenv("IDENTITY_CACHE_SIZE", 4096)),
+    ttl=int(os.getenv("IDENTITY_CACHE_TTL", 30))
+)
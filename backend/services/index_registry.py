@@ -0,0 +1,100 @@
+from pymongo.errors import ConnectionFailure, OperationFailure, PyMongoError
+
+
+def index_name(keys):
+    """The name MongoDB gives an index by default, e.g. companyId_1_createdAt_-1"""
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+class IndexRegistry:
+    """
+    Declared MongoDB indexes, grouped by the blueprint whose queries need them.
+
+    Blueprint modules declare their indexes at import time. `ensure` creates
+    any that are missing (create_index is a no-op for an identical existing
+    index), and `report` compares the declarations with what the server has,
+    using `$indexStats` to flag indexes that have never been used.
+    """
+
+    def __init__(self):
+        self.declarations = []
+
+    def declare(self, owner, collection, keys, **options):
+        """Declare an index on `collection` as a list of (field, direction) pairs"""
+        keys = [(key, 1) if isinstance(key, str) else tuple(key) for key in keys]
+        name = options.pop("name", None) or index_name(keys)
+        self.declarations.append({
+            "owner": owner,
+            "collection": collection,
+            "keys": keys,
+            "name": name,
+            "options": options
+        })
+
+    def for_collection(self, collection):
+        return [d for d in self.declarations if d["collection"] == collection]
+
+    def collections(self):
+        return sorted({d["collection"] for d in self.declarations})
+
+    # ----------------------------------------------------------------------
+    def ensure(self, db, logger=None):
+        """Create every declared index. Failures are logged and do not stop the rest."""
+        created, failed = [], []
+        for declaration in self.declarations:
+            label = f"{declaration['collection']}.{declaration['name']}"
+            try:
+                db[declaration["collection"]].create_index(
+                    declaration["keys"],
+                    name=declaration["name"],
+                    **declaration["options"]
+                )
+                created.append(label)
+            except ConnectionFailure as e:
+                # Server unreachable, the remaining indexes would only time out too
+                if logger:
+                    logger.error(f"Ensure indexes error: {str(e)}")
+                failed.extend(
+                    f"{d['collection']}.{d['name']}" for d in self.declarations
+                    if f"{d['collection']}.{d['name']}" not in created)
+                break
+            except PyMongoError as e:
+                failed.append(label)
+                if logger:
+                    logger.error(f"Ensure index {label} error: {str(e)}")
+        return {"ensured": created, "failed": failed}
+
+    def report(self, db):
+        """Missing, unused and undeclared indexes for every declared collection"""
+        report = {}
+        for collection in self.collections():
+            declared = {d["name"]: d for d in self.for_collection(collection)}
+            existing = db[collection].index_information()
+
+            try:
+                usage = {stats["name"]: int(stats["accesses"]["ops"])
+                         for stats in db[collection].aggregate([{"$indexStats": {}}])}
+            except OperationFailure:
+                # $indexStats needs the clusterMonitor role on some deployments
+                usage = {}
+
+            report[collection] = {
+                "missing": [
+                    {"name": name, "owner": d["owner"], "keys": d["keys"]}
+                    for name, d in declared.items() if name not in existing
+                ],
+                "unused": sorted(
+                    name for name in existing
+                    if name != "_id_" and usage.get(name, 1) == 0
+                ),
+                "undeclared": sorted(
+                    name for name in existing
+                    if name != "_id_" and name not in declared
+                ),
+                "accesses": usage
+            }
+        return report
+
+
+# Shared registry, blueprint modules declare into it on import
+index_registry = IndexRegistry()
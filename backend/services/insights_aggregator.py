@@ -0,0 +1,588 @@
+from collections import Counter
+from datetime import datetime
+import math
+
+from pymongo.errors import DuplicateKeyError
+
+
+DIFFICULTY_SCORES = {"Easy": 1, "Medium": 2, "Hard": 3}
+
+# Round specific list fields counted as "common topics"
+TOPIC_FIELDS = {
+    "technical": "focusTopics",
+    "coding": "languagesUsed"
+}
+
+# Fields an aggregate delta reads from an experience document
+AGGREGATE_FIELDS = {
+    "companyId": 1,
+    "jobRole": 1,
+    "status": 1,
+    "overallRating": 1,
+    "selectedRounds": 1,
+    "roundsData": 1,
+    "isVerified": 1
+}
+
+# Expressions for the server-side rebuild, same defaults as experience_delta
+STATUS_EXPR = {"$ifNull": ["$status", "Pending"]}
+RATING_EXPR = {"$ifNull": ["$overallRating", 0]}
+
+# Numeric, non-NaN ratings only, like the pandas mean (NaN sorts below -inf)
+IS_RATED_EXPR = {"$and": [{"$isNumber": RATING_EXPR},
+                          {"$gte": [RATING_EXPR, float("-inf")]}]}
+
+# Largest groups first, ties by value so rebuilt counters are deterministic
+BY_COUNT = {"$sort": {"count": -1, "_id": 1}}
+
+# Rebuild attempts before giving up when deltas keep landing mid-rebuild
+REBUILD_ATTEMPTS = 5
+
+# Ids of the most recently applied events kept on a target document, so a
+# redelivered event is recognised until its experience records it as applied
+APPLIED_EVENTS = 1000
+
+# Experience fields read when applying its events
+EVENT_FIELDS = {**AGGREGATE_FIELDS, "experienceId": 1, "appliedSeq": 1,
+                "pendingEvents": 1, "applyingEvent": 1}
+
+# Submitted experiences whose events are not all applied yet
+PENDING_EVENTS_QUERY = {"$or": [{"appliedSeq": -1}, {"pendingEvents.0": {"$exists": True}},
+                                {"applyingEvent": {"$exists": True}}]}
+
+# Server-side view of an experience as the aggregate has applied it: the
+# state before its first pending event, excluding unapplied submissions.
+# Claimed events count as applied, the rebuild marks them on the aggregate.
+APPLIED_STATE_STAGES = [
+    {"$match": {"appliedSeq": {"$ne": -1}}},
+    {"$replaceRoot": {"newRoot": {"$cond": [
+        {"$gt": [{"$size": {"$ifNull": ["$pendingEvents", []]}}, 0]},
+        {"$mergeObjects": ["$$ROOT", {"$arrayElemAt": ["$pendingEvents.before", 0]}]},
+        "$$ROOT"
+    ]}}}
+]
+
+# Mongo field names cannot contain "." or start with "$", and "" breaks dotted paths
+EMPTY_KEY = "␀"
+
+
+def encode_key(value):
+    """Turn a free-text value into a safe Mongo field name"""
+    key = str(value)
+    if key == "":
+        return EMPTY_KEY
+    key = key.replace(".", "．")
+    if key.startswith("$"):
+        key = "＄" + key[1:]
+    return key
+
+
+def decode_key(key):
+    """Reverse encode_key"""
+    if key == EMPTY_KEY:
+        return ""
+    if key.startswith("＄"):
+        key = "$" + key[1:]
+    return key.replace("．", ".")
+
+
+def get_difficulty_level(score):
+    """Convert numerical score to difficulty level"""
+    if score < 1.5:
+        return "Easy"
+    elif score < 2.5:
+        return "Medium"
+    else:
+        return "Hard"
+
+
+def aggregate_facets():
+    """
+    `$facet` stage computing every aggregate counter server-side, so only
+    the summarized numbers leave the database instead of each experience
+    with its roundsData.
+    """
+    facets = {
+        "totals": [
+            {"$group": {
+                "_id": None,
+                "total": {"$sum": 1},
+                "ratingSum": {"$sum": {"$cond": [IS_RATED_EXPR, RATING_EXPR, 0]}},
+                "ratingCount": {"$sum": {"$cond": [IS_RATED_EXPR, 1, 0]}},
+                "verifiedCount": {"$sum": {"$cond": [{"$ifNull": ["$isVerified", False]}, 1, 0]}}
+            }}
+        ],
+        "status": [
+            {"$group": {
+                "_id": STATUS_EXPR,
+                "count": {"$sum": 1},
+                "ratingSum": {"$sum": {"$cond": [IS_RATED_EXPR, RATING_EXPR, 0]}},
+                "ratingCount": {"$sum": {"$cond": [IS_RATED_EXPR, 1, 0]}},
+                "roundsTotal": {"$sum": {"$size": {"$cond": [
+                    {"$isArray": "$selectedRounds"}, "$selectedRounds", []]}}}
+            }},
+            BY_COUNT
+        ],
+        "statusRounds": [
+            {"$match": {"selectedRounds": {"$type": "array"}}},
+            {"$unwind": "$selectedRounds"},
+            {"$group": {
+                "_id": {"status": STATUS_EXPR, "round": "$selectedRounds"},
+                "count": {"$sum": 1}
+            }},
+            BY_COUNT
+        ],
+        "jobRoles": [
+            {"$group": {"_id": {"$ifNull": ["$jobRole", ""]}, "count": {"$sum": 1}}},
+            BY_COUNT
+        ],
+        "difficulty": [
+            {"$match": {"roundsData": {"$type": "object"}}},
+            {"$project": {"round": {"$objectToArray": "$roundsData"}}},
+            {"$unwind": "$round"},
+            {"$match": {"round.v.difficulty": {"$exists": True}}},
+            {"$group": {
+                "_id": {"round": "$round.k", "level": "$round.v.difficulty"},
+                "count": {"$sum": 1}
+            }},
+            BY_COUNT
+        ]
+    }
+
+    for round_name, field in TOPIC_FIELDS.items():
+        path = f"roundsData.{round_name}.{field}"
+        facets[f"{round_name}Topics"] = [
+            {"$match": {path: {"$type": "array"}}},
+            {"$unwind": f"${path}"},
+            {"$group": {"_id": f"${path}", "count": {"$sum": 1}}},
+            BY_COUNT
+        ]
+
+    return {"$facet": facets}
+
+
+def event_snapshot(experience):
+    """Every AGGREGATE_FIELDS value of an experience, None when missing, for a pending event"""
+    return {field: experience.get(field) for field in AGGREGATE_FIELDS}
+
+
+def _present(snapshot):
+    return {field: value for field, value in snapshot.items() if value is not None}
+
+
+def _rating(value):
+    """Return the rating as a float, or None when pandas would treat it as missing"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if math.isnan(value):
+        return None
+    return float(value)
+
+
+def _decoded(counter):
+    return {decode_key(k): v for k, v in (counter or {}).items()}
+
+
+def _most_common(counter, n=None):
+    """Counter.most_common over a stored dict, ties keep insertion order"""
+    return Counter(_decoded(counter)).most_common(n)
+
+
+class InsightsAggregator:
+    """
+    Running sufficient statistics for a company's experiences.
+
+    One document per company in `company_aggregates` holds counts by status,
+    rating sums, round frequencies, difficulty histograms and topic counters.
+    Submissions and moderation events apply a `$inc` delta instead of
+    re-reading every experience, and the numeric insight sections are
+    derived from the stored counters. Full rebuilds run as a single `$facet`
+    aggregation on the server.
+
+    Every delta increments the aggregate's `experienceVersion`. A rebuild
+    only replaces the version it started from, so a delta applied while
+    the experiences were being read is never overwritten.
+
+    Experience events are applied through `apply_pending`, once each and in
+    order. Each experience numbers its events (0 is the submission) and keeps
+    the unapplied moderation events with their pre-change snapshot, and the
+    aggregate keeps the ids of the events it has recently applied.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.company_aggregates
+
+    # ----------------------------------------------------------------------
+    def experience_delta(self, experience, sign=1):
+        """Build the flat `$inc` document for adding (sign=1) or removing (sign=-1) an experience"""
+        delta = Counter()
+        status_key = f"status.{encode_key(experience.get('status', 'Pending'))}"
+        selected_rounds = experience.get("selectedRounds", [])
+        if not isinstance(selected_rounds, list):
+            selected_rounds = []
+        rounds_data = experience.get("roundsData", {}) or {}
+        rating = _rating(experience.get("overallRating", 0))
+
+        delta["total"] += sign
+        delta[f"{status_key}.count"] += sign
+        delta[f"{status_key}.roundsTotal"] += sign * len(selected_rounds)
+        if rating is not None:
+            delta["ratingSum"] += sign * rating
+            delta["ratingCount"] += sign
+            delta[f"{status_key}.ratingSum"] += sign * rating
+            delta[f"{status_key}.ratingCount"] += sign
+
+        if experience.get("isVerified"):
+            delta["verifiedCount"] += sign
+
+        job_role = experience.get("jobRole", "")
+        if isinstance(job_role, str):
+            delta[f"jobRoles.{encode_key(job_role)}"] += sign
+
+        for round_name in selected_rounds:
+            delta[f"rounds.{encode_key(round_name)}"] += sign
+            delta[f"{status_key}.rounds.{encode_key(round_name)}"] += sign
+
+        for round_name, round_data in rounds_data.items():
+            if not isinstance(round_data, dict):
+                continue
+            round_key = encode_key(round_name)
+            if "difficulty" in round_data:
+                delta[f"difficulty.{round_key}.{encode_key(round_data['difficulty'])}"] += sign
+
+            topic_field = TOPIC_FIELDS.get(round_name)
+            if topic_field and isinstance(round_data.get(topic_field), list):
+                for topic in round_data[topic_field]:
+                    delta[f"topics.{round_key}.{encode_key(topic)}"] += sign
+
+        return {path: value for path, value in delta.items() if value != 0}
+
+    # ----------------------------------------------------------------------
+    def apply(self, company_id, inc, event_id=None):
+        """Apply a delta to an existing aggregate. Missing aggregates are built lazily on read.
+
+        With `event_id` the delta is applied at most once. True when this
+        call applied it.
+        """
+        if not inc and event_id is None:
+            return False
+        query = {"companyId": company_id}
+        update = {"$inc": {**inc, "experienceVersion": 1},
+                  "$set": {"updatedAt": datetime.utcnow()}}
+        if event_id is not None:
+            query["appliedEvents"] = {"$ne": event_id}
+            update["$push"] = {"appliedEvents": {"$each": [event_id], "$slice": -APPLIED_EVENTS}}
+
+        return self.collection.update_one(query, update).matched_count > 0
+
+    def add_experience(self, experience):
+        """Fold a newly submitted experience into its company aggregate"""
+        return self.apply(experience.get("companyId"), self.experience_delta(experience))
+
+    def replace_delta(self, old_experience, new_experience):
+        inc = Counter(self.experience_delta(old_experience, -1))
+        inc.update(self.experience_delta(new_experience))
+        return {path: value for path, value in inc.items() if value != 0}
+
+    def replace_experience(self, old_experience, new_experience, event_id=None):
+        """Swap an experience's old contribution for its new one in a single update"""
+        return self.apply(new_experience.get("companyId"),
+                          self.replace_delta(old_experience, new_experience), event_id)
+
+    def apply_pending(self, experience_id):
+        """Apply an experience's unapplied events in order
+
+        Returns the experience (None when it does not exist) and the number
+        of events this call recorded as applied, 0 for a redelivered event.
+
+        Each event is first claimed on the experience, which advances its
+        `appliedSeq` and keeps the delta in `applyingEvent` until the
+        aggregate has it. A rebuild counts claimed events and marks them as
+        applied, so a claim racing a rebuild is never lost or doubled.
+        """
+        applied = 0
+        while True:
+            experience = self.db.experiences.find_one(
+                {"experienceId": experience_id}, EVENT_FIELDS)
+            if experience is None:
+                return None, applied
+
+            claim = experience.get("applyingEvent")
+            if claim is None:
+                claim = self._claim_next(experience)
+                if claim is None:
+                    return experience, applied
+                if claim is False:
+                    # Claimed or moderated concurrently, read it again
+                    continue
+
+            # A missing aggregate is built from the claimed state on first read
+            self.apply(experience["companyId"], dict(claim["inc"]),
+                       f"{experience_id}:{claim['seq']}")
+            result = self.db.experiences.update_one(
+                {"_id": experience["_id"], "applyingEvent.seq": claim["seq"]},
+                {"$unset": {"applyingEvent": ""}}
+            )
+            applied += result.modified_count
+
+    def _claim_next(self, experience):
+        """Claim the experience's next event. None when there is none, False when the claim lost a race."""
+        # Experiences from before event numbering count as applied
+        applied = experience.get("appliedSeq", 0)
+        pending = experience.get("pendingEvents") or []
+        if applied < 0:
+            # The submission adds the state before any later event
+            seq = 0
+            inc = self.experience_delta(
+                _present(pending[0]["before"]) if pending else experience)
+        else:
+            event = next((e for e in pending if e["seq"] == applied + 1), None)
+            if event is None:
+                return None
+            seq = event["seq"]
+            before = _present(event["before"])
+            inc = self.replace_delta(before, {**before, **event["changes"]})
+
+        # Delta paths contain dots, so it is kept as [path, value] pairs
+        claim = {"seq": seq, "inc": [[path, value] for path, value in inc.items()]}
+        result = self.db.experiences.update_one(
+            {"_id": experience["_id"], "appliedSeq": experience.get("appliedSeq"),
+             "applyingEvent": {"$exists": False}},
+            {"$set": {"appliedSeq": seq, "applyingEvent": claim},
+             "$pull": {"pendingEvents": {"seq": {"$lte": seq}}}}
+        )
+        return claim if result.modified_count else False
+
+    # ----------------------------------------------------------------------
+    def rebuild(self, company_id):
+        """Recompute a company aggregate from scratch with one server-side aggregation"""
+        for _ in range(REBUILD_ATTEMPTS):
+            current = self.collection.find_one(
+                {"companyId": company_id}, {"experienceVersion": 1})
+            aggregate = self.pipeline_aggregate(company_id)
+            aggregate["updatedAt"] = datetime.utcnow()
+
+            if current is None:
+                aggregate["experienceVersion"] = 0
+                try:
+                    self.collection.insert_one(aggregate)
+                    return self._apply_pending_events(company_id, aggregate)
+                except DuplicateKeyError:
+                    # Built concurrently, rebuild on top of that one
+                    aggregate.pop("_id", None)
+                    continue
+
+            # Only replace the version that was read, a delta applied in
+            # between means the experiences read may be missing it
+            version = current.get("experienceVersion", 0)
+            aggregate["experienceVersion"] = version + 1
+            result = self.collection.replace_one(
+                {"companyId": company_id,
+                 "experienceVersion": current.get("experienceVersion")},
+                aggregate)
+            if result.matched_count:
+                return self._apply_pending_events(company_id, aggregate)
+
+        raise RuntimeError(
+            f"Aggregate for {company_id} kept changing during rebuild")
+
+    def _apply_pending_events(self, company_id, aggregate):
+        """Apply the events a rebuild left out, returning the stored aggregate"""
+        pending = [experience["experienceId"] for experience in self.db.experiences.find(
+            {"companyId": company_id, **PENDING_EVENTS_QUERY}, {"experienceId": 1})]
+        for experience_id in pending:
+            self.apply_pending(experience_id)
+        if not pending:
+            return aggregate
+        return self.collection.find_one({"companyId": company_id})
+
+    def pipeline_aggregate(self, company_id):
+        """Run aggregate_facets for one company and shape the groups like a stored aggregate
+
+        Counts each experience as its applied and claimed events left it, so
+        the events still pending can be applied on top. The claimed events
+        are listed in `appliedEvents`, their delta is already counted.
+        """
+        facets = aggregate_facets()
+        facets["$facet"]["claimed"] = [
+            {"$match": {"applyingEvent": {"$exists": True}}},
+            {"$project": {"_id": 0, "experienceId": 1, "seq": "$applyingEvent.seq"}}
+        ]
+        result = next(self.db.experiences.aggregate([
+            {"$match": {"companyId": company_id}},
+            *APPLIED_STATE_STAGES,
+            facets
+        ]), {})
+
+        totals = (result.get("totals") or [{}])[0]
+        aggregate = {
+            "companyId": company_id,
+            "total": totals.get("total", 0),
+            "ratingSum": float(totals.get("ratingSum", 0)),
+            "ratingCount": totals.get("ratingCount", 0),
+            "verifiedCount": totals.get("verifiedCount", 0),
+            "status": {},
+            "jobRoles": {},
+            "rounds": Counter(),
+            "difficulty": {},
+            "topics": {},
+            "appliedEvents": [f"{claim['experienceId']}:{claim['seq']}"
+                              for claim in result.get("claimed", [])]
+        }
+
+        for group in result.get("status", []):
+            aggregate["status"][encode_key(group["_id"])] = {
+                "count": group["count"],
+                "ratingSum": float(group["ratingSum"]),
+                "ratingCount": group["ratingCount"],
+                "roundsTotal": group["roundsTotal"],
+                "rounds": {}
+            }
+
+        for group in result.get("statusRounds", []):
+            status_key = encode_key(group["_id"]["status"])
+            round_key = encode_key(group["_id"]["round"])
+            aggregate["status"][status_key]["rounds"][round_key] = group["count"]
+            aggregate["rounds"][round_key] += group["count"]
+        aggregate["rounds"] = dict(aggregate["rounds"].most_common())
+
+        # Only string job roles are counted, as in experience_delta
+        for group in result.get("jobRoles", []):
+            if isinstance(group["_id"], str):
+                aggregate["jobRoles"][encode_key(group["_id"])] = group["count"]
+
+        for group in result.get("difficulty", []):
+            histogram = aggregate["difficulty"].setdefault(
+                encode_key(group["_id"]["round"]), {})
+            histogram[encode_key(group["_id"]["level"])] = group["count"]
+
+        for round_name in TOPIC_FIELDS:
+            groups = result.get(f"{round_name}Topics", [])
+            if groups:
+                aggregate["topics"][encode_key(round_name)] = {
+                    encode_key(group["_id"]): group["count"] for group in groups}
+
+        return aggregate
+
+    def get(self, company_id):
+        """Return the stored aggregate, building it on first access"""
+        aggregate = self.collection.find_one({"companyId": company_id})
+        if aggregate is None:
+            aggregate = self.rebuild(company_id)
+        return aggregate
+
+    # ========================= DERIVED INSIGHTS =========================
+
+    def overall_stats(self, aggregate):
+        """Same shape as generate_overall_stats"""
+        total = aggregate.get("total", 0)
+        statuses = _decoded(aggregate.get("status"))
+        selected_count = statuses.get("Selected", {}).get("count", 0)
+        rating_count = aggregate.get("ratingCount", 0)
+
+        success_rate = (selected_count / total) * 100 if total > 0 else 0
+        # 0.0 without numeric ratings, the stored stats expect a number
+        avg_rating = aggregate.get("ratingSum", 0.0) / \
+            rating_count if rating_count else 0.0
+
+        return {
+            "totalExperiences": int(total),
+            "successRate": float(round(success_rate, 1)),
+            "selectedCount": int(selected_count),
+            "rejectedCount": int(statuses.get("Rejected", {}).get("count", 0)),
+            "pendingCount": int(statuses.get("Pending", {}).get("count", 0)),
+            "averageRating": float(round(avg_rating, 1)),
+            "topJobRoles": {str(role): int(count) for role, count in _most_common(aggregate.get("jobRoles"), 5) if count > 0}
+        }
+
+    def rounds_analysis(self, aggregate):
+        """Same shape as generate_rounds_analysis"""
+        total = aggregate.get("total", 0)
+        difficulty = aggregate.get("difficulty", {})
+        topics = aggregate.get("topics", {})
+
+        rounds_analysis = {}
+        for round_name, count in _most_common(aggregate.get("rounds")):
+            if count <= 0:
+                continue
+            round_key = encode_key(round_name)
+            histogram = [(level, n) for level, n in _most_common(
+                difficulty.get(round_key)) if n > 0]
+            rounds_analysis[round_name] = {
+                "frequency": int(count),
+                "percentage": float(round((count / total) * 100, 1)),
+                "difficulty": histogram[0][0] if histogram else "Unknown",
+                "commonTopics": [
+                    {"topic": str(topic), "frequency": int(n)}
+                    for topic, n in _most_common(topics.get(round_key), 5) if n > 0
+                ]
+            }
+
+        return rounds_analysis
+
+    def difficulty_analysis(self, aggregate):
+        """Same shape as generate_difficulty_analysis"""
+        avg_difficulties = {}
+        for round_key, histogram in aggregate.get("difficulty", {}).items():
+            histogram = _decoded(histogram)
+            count = sum(histogram.values())
+            if count <= 0:
+                continue
+            score = sum(DIFFICULTY_SCORES.get(level, 2) * n for level, n in histogram.items())
+            avg_score = score / count
+            avg_difficulties[decode_key(round_key)] = {
+                "averageDifficulty": float(round(avg_score, 1)),
+                "difficultyLevel": get_difficulty_level(avg_score)
+            }
+
+        return avg_difficulties
+
+    def success_patterns(self, aggregate):
+        """Same shape as generate_success_patterns"""
+        statuses = _decoded(aggregate.get("status"))
+        successful = statuses.get("Selected", {})
+        unsuccessful = statuses.get("Rejected", {})
+
+        if successful.get("count", 0) <= 0:
+            return {"message": "Not enough successful cases for analysis"}
+
+        def avg(bucket, field, count_field="count"):
+            count = bucket.get(count_field, 0)
+            # NaN is not valid JSON, an empty group averages 0.0
+            return bucket.get(field, 0) / count if count > 0 else 0.0
+
+        successful_rating = avg(successful, "ratingSum", "ratingCount")
+        unsuccessful_rating = avg(unsuccessful, "ratingSum", "ratingCount") \
+            if unsuccessful.get("count", 0) > 0 else 0.0
+        successful_rounds_avg = avg(successful, "roundsTotal")
+        unsuccessful_rounds_avg = avg(unsuccessful, "roundsTotal") \
+            if unsuccessful.get("count", 0) > 0 else 0.0
+
+        differentiators = []
+        if successful_rounds_avg > unsuccessful_rounds_avg:
+            differentiators.append(
+                f"Successful candidates complete more rounds on average ({successful_rounds_avg:.1f} vs {unsuccessful_rounds_avg:.1f})")
+        if successful_rating > unsuccessful_rating:
+            differentiators.append("Higher overall interview experience rating")
+
+        return {
+            "successfulCandidates": int(successful["count"]),
+            "averageRatingSuccessful": float(round(successful_rating, 1)),
+            "averageRatingUnsuccessful": float(round(unsuccessful_rating, 1)),
+            "commonRoundsSuccessful": [
+                {"round": round_name, "frequency": int(count)}
+                for round_name, count in _most_common(successful.get("rounds")) if count > 0
+            ],
+            "keyDifferentiators": differentiators
+        }
+
+    def summary(self, aggregate):
+        """All sections that can be served from the counters alone"""
+        return {
+            "overallStats": self.overall_stats(aggregate),
+            "roundsAnalysis": self.rounds_analysis(aggregate),
+            "difficultyAnalysis": self.difficulty_analysis(aggregate),
+            "successPatterns": self.success_patterns(aggregate),
+            "verifiedCount": int(aggregate.get("verifiedCount", 0))
+        }
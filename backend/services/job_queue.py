@@ -0,0 +1,219 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+import redis
+
+
+# Redis keys. Jobs are pushed on the left and moved to the processing list
+# while a worker runs them, so a crashed worker leaves them recoverable.
+QUEUE_KEY = "placify:jobs"
+PROCESSING_KEY = "placify:jobs:processing"
+FAILED_KEY = "placify:jobs:failed"
+
+MAX_ATTEMPTS = 3
+
+# Consumer back-off after a Redis error, doubling up to the maximum (seconds)
+BACKOFF_INITIAL = 1
+BACKOFF_MAX = 30
+
+
+class JobQueue:
+    """
+    Background jobs for work that does not need to finish inside a request.
+
+    Routes `enqueue` events such as "experience.submitted"; handlers
+    registered for an event run later as handler(db, payload) inside the
+    app context. Jobs go to a Redis list when Redis is reachable and to an
+    in-process queue otherwise. A daemon thread in each web worker consumes
+    them, and `flask jobs-worker` runs a dedicated consumer for the Redis
+    list. JOB_QUEUE_BACKEND=inline runs handlers immediately instead.
+    """
+
+    def __init__(self):
+        self.handlers = {}
+        self.app = None
+        self.backend = "memory"
+        self.redis_client = None
+        self._local = queue.Queue()
+        self._worker_pid = None
+        self._lock = threading.Lock()
+
+    def register(self, event, handler):
+        self.handlers[event] = handler
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = os.getenv("JOB_QUEUE_BACKEND", "redis")
+
+        if self.backend == "redis":
+            try:
+                self.redis_client = redis.Redis.from_url(
+                    os.getenv("REDIS_URL", "redis://localhost:6379"),
+                    password=os.getenv("REDIS_PASSWORD"),
+                    decode_responses=True,
+                    socket_connect_timeout=5,
+                    socket_timeout=5
+                )
+                self.redis_client.ping()
+            except redis.RedisError as e:
+                app.logger.warning(
+                    f"Job queue Redis unavailable, using in-process queue: {str(e)}")
+                self.redis_client = None
+                self.backend = "memory"
+
+        app.extensions["job_queue"] = self
+
+    # ----------------------------------------------------------------------
+    def enqueue(self, event, payload):
+        """Queue an event for the background workers and return its job id"""
+        job = {
+            "id": str(uuid.uuid4()),
+            "event": event,
+            "payload": payload,
+            "attempts": 0,
+            "enqueuedAt": time.time()
+        }
+
+        if self.backend == "inline":
+            self.process(job)
+            return job["id"]
+
+        self._push(job)
+        self._ensure_worker()
+        return job["id"]
+
+    def _push(self, job):
+        if self.redis_client is not None:
+            try:
+                self.redis_client.lpush(QUEUE_KEY, json.dumps(job))
+                return
+            except redis.RedisError as e:
+                self.app.logger.error(
+                    f"Job queue push error, running in-process: {str(e)}")
+        self._local.put(job)
+
+    def process(self, job):
+        """Run one job, re-queueing it on failure until MAX_ATTEMPTS"""
+        handler = self.handlers.get(job["event"])
+        if handler is None:
+            self.app.logger.error(f"No job handler for event: {job['event']}")
+            return False
+
+        with self.app.app_context():
+            try:
+                handler(self.app.config["MONGO_DB"], job["payload"])
+                return True
+            except Exception as e:
+                job["attempts"] += 1
+                self.app.logger.error(
+                    f"Job {job['event']} error (attempt {job['attempts']}): {str(e)}")
+
+        if job["attempts"] < MAX_ATTEMPTS:
+            self._push(job)
+        elif self.redis_client is not None:
+            try:
+                self.redis_client.lpush(FAILED_KEY, json.dumps(job))
+            except redis.RedisError as e:
+                self.app.logger.error(
+                    f"Job queue failed-list push error, dropping job {job['id']}: {str(e)}")
+        return False
+
+    # ----------------------------------------------------------------------
+    def _ensure_worker(self):
+        """Start this process's consumer thread, once per (forked) process"""
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+            threading.Thread(target=self._run_thread, daemon=True,
+                             name="job-queue-worker").start()
+
+    def _run_thread(self):
+        try:
+            self.run_worker()
+        finally:
+            # Let the next enqueue start a new consumer if this one died
+            with self._lock:
+                if self._worker_pid == os.getpid():
+                    self._worker_pid = None
+
+    def _next_job(self, timeout=1):
+        try:
+            return self._local.get_nowait(), None
+        except queue.Empty:
+            pass
+
+        if self.redis_client is None:
+            try:
+                return self._local.get(timeout=timeout), None
+            except queue.Empty:
+                return None, None
+
+        try:
+            raw = self.redis_client.brpoplpush(
+                QUEUE_KEY, PROCESSING_KEY, timeout=timeout)
+        except redis.RedisError as e:
+            self.app.logger.error(f"Job queue pop error: {str(e)}")
+            time.sleep(timeout)
+            return None, None
+        return (json.loads(raw), raw) if raw else (None, None)
+
+    def run_worker(self, stop=None):
+        """Consume jobs until `stop` (a threading.Event) is set"""
+        backoff = BACKOFF_INITIAL
+        while stop is None or not stop.is_set():
+            try:
+                job, raw = self._next_job()
+                if job is None:
+                    continue
+                try:
+                    self.process(job)
+                finally:
+                    if raw is not None:
+                        self.redis_client.lrem(PROCESSING_KEY, 1, raw)
+                backoff = BACKOFF_INITIAL
+            except redis.RedisError as e:
+                # A job left in the processing list is recovered by jobs-requeue
+                self.app.logger.error(
+                    f"Job queue worker Redis error, retrying in {backoff}s: {str(e)}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, BACKOFF_MAX)
+            except Exception as e:
+                self.app.logger.error(f"Job queue worker error: {str(e)}")
+
+    def drain(self):
+        """Run every job queued in-process, for scripts and tests"""
+        while True:
+            try:
+                job = self._local.get_nowait()
+            except queue.Empty:
+                return
+            self.process(job)
+
+    def requeue_processing(self):
+        """Move jobs left in the processing list by crashed workers back to the queue"""
+        moved = 0
+        while self.redis_client is not None and \
+                self.redis_client.rpoplpush(PROCESSING_KEY, QUEUE_KEY):
+            moved += 1
+        return moved
+
+    def stats(self):
+        if self.redis_client is None:
+            return {"backend": self.backend, "queued": self._local.qsize()}
+        return {
+            "backend": self.backend,
+            "queued": self.redis_client.llen(QUEUE_KEY),
+            "processing": self.redis_client.llen(PROCESSING_KEY),
+            "failed": self.redis_client.llen(FAILED_KEY)
+        }
+
+
+# Shared queue, blueprint modules register their handlers on import
+job_queue = JobQueue()
@@ -1,64 +1,129 @@
 import redis
 from redis import ConnectionPool
 import os
-import json
 from datetime import timedelta
+import hashlib
 import random
+import secrets
 import string
-import traceback
 from dotenv import load_dotenv
+from flask import current_app
 # from .sms_service import SMSService
 
 
 load_dotenv()
 
 
+# Redis connection pool options, read from the environment
+POOL_OPTIONS = {
+    "max_connections": ("OTP_REDIS_MAX_CONNECTIONS", int, 20),
+    "socket_connect_timeout": ("OTP_REDIS_CONNECT_TIMEOUT", float, 5),
+    "socket_timeout": ("OTP_REDIS_SOCKET_TIMEOUT", float, 5),
+    "health_check_interval": ("OTP_REDIS_HEALTH_CHECK_INTERVAL", int, 30)
+}
+
+
+def pool_options():
+    return {option: cast(os.getenv(env, default))
+            for option, (env, cast, default) in POOL_OPTIONS.items()}
+
+
+# Failed verifications allowed before an OTP is discarded
+MAX_EMAIL_ATTEMPTS = 3
+
+# Verify an OTP and count the attempt atomically. HSET/HINCRBY leave the
+# key's TTL alone, so the original expiry holds.
+# KEYS[1] record, ARGV: submitted otp, max attempts, timestamp
+VERIFY_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+    return {'missing', 0}
+end
+local stored = redis.call('HGET', KEYS[1], 'email_otp')
+if not stored then
+    return {'missing', 0}
+end
+local attempts = tonumber(redis.call('HGET', KEYS[1], 'email_attempts') or '0')
+if attempts >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    return {'locked', attempts}
+end
+if stored == ARGV[1] then
+    redis.call('HSET', KEYS[1], 'email_verified', 1,
+               'email_verified_at', ARGV[3], 'updated_at', ARGV[3])
+    return {'verified', attempts}
+end
+attempts = redis.call('HINCRBY', KEYS[1], 'email_attempts', 1)
+redis.call('HSET', KEYS[1], 'updated_at', ARGV[3])
+return {'invalid', attempts}
+"""
+
+# Update an existing record only, never recreating an expired one without TTL.
+# KEYS[1] record, ARGV: attempts increment, timestamp, then field/value pairs
+UPDATE_SCRIPT = """
+if redis.call('TYPE', KEYS[1]).ok ~= 'hash' then
+    return nil
+end
+redis.call('HSET', KEYS[1], 'updated_at', ARGV[2], unpack(ARGV, 3))
+return redis.call('HINCRBY', KEYS[1], 'email_attempts', tonumber(ARGV[1]))
+"""
+
+
+# Password reset tokens: lifetime, and requests allowed per email per window
+RESET_TOKEN_EXPIRY = int(os.getenv('RESET_TOKEN_EXPIRY', 1800))
+RESET_RATE_LIMIT = int(os.getenv('RESET_RATE_LIMIT', 3))
+RESET_RATE_WINDOW = int(os.getenv('RESET_RATE_WINDOW', 3600))
+
+# Delete the reset token only if it matches, so a wrong guess cannot burn it.
+# KEYS[1] token hash key, ARGV[1] submitted token hash
+CONSUME_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
 class OTPService:
-    def __init__(self, app=None):
-        """Initialize Redis connection with connection pooling for OTP management."""
+    """
+    OTP storage in Redis, one instance and connection pool per worker.
 
+    Routes use the module-level `otp_service`, set up once by `init_app`.
+    Connections are opened on first use and reused across requests, and
+    checked with a PING only when idle longer than the health check interval.
+    redis-py resets the pool in a forked child, so workers never share sockets.
+    """
+
+    def __init__(self, app=None):
         self.connection_pool = None
         self.redis_client = None
         self.otp_expiry = 600  # 10 minutes
+        self._verify_script = None
+        self._update_script = None
+        self._consume_script = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Create the shared connection pool from REDIS_URL and OTP_REDIS_* settings"""
+        self.connection_pool = ConnectionPool.from_url(
+            os.getenv('REDIS_URL', 'redis://localhost:6379'),
+            password=os.getenv('REDIS_PASSWORD'),
+            decode_responses=True,
+            retry_on_timeout=True,
+            **pool_options()
+        )
+        self.redis_client = redis.Redis(connection_pool=self.connection_pool)
+        # Scripts are cached server-side by SHA and run with EVALSHA
+        self._verify_script = self.redis_client.register_script(VERIFY_SCRIPT)
+        self._update_script = self.redis_client.register_script(UPDATE_SCRIPT)
+        self._consume_script = self.redis_client.register_script(CONSUME_SCRIPT)
+        app.extensions["otp_service"] = self
 
-    
-        """Initialize Redis with Flask app configuration."""
         try:
-            # Get Redis configuration from app config or environment
-            redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
-            redis_password = os.getenv('REDIS_PASSWORD')
-
-
-            # Create connection pool with optimized settings
-            self.connection_pool = ConnectionPool.from_url(
-                redis_url,
-                decode_responses=True,
-                max_connections=20,
-                socket_connect_timeout=5,
-                socket_timeout=5,
-                retry_on_timeout=True,
-                health_check_interval=30
-            )
-
-            # Create Redis client with connection pool
-            self.redis_client = redis.Redis(
-                connection_pool=self.connection_pool)
-
-            # Test connection
-            pong = self.redis_client.ping()
-
-        except Exception as e:
-            traceback.print_exc()
-            # Fallback: create a basic connection without pool
-            try:
-                self.redis_client = redis.Redis.from_url(
-                    os.getenv('REDIS_URL', 'redis://localhost:6379'),
-                    password=os.getenv('REDIS_PASSWORD'),
-                    decode_responses=True
-                )
-            except Exception as fallback_error:
-                print(
-                    f"❌ [DEBUG] Fallback connection also failed: {fallback_error}")
+            self.redis_client.ping()
+        except redis.RedisError as e:
+            # Not fatal: the pool reconnects on the next OTP request
+            app.logger.warning(f"OTP Redis unavailable: {str(e)}")
 
     # ----------------------------------------------------------------------
     def generate_otp(self, length=6):
@@ -75,50 +140,45 @@ class OTPService:
 
     # ----------------------------------------------------------------------
     def store_email_otp(self, email, email_otp):
-        """Store email OTP using simple Redis set operation."""
+        """Store a fresh email OTP record as a Redis hash with the OTP expiry."""
 
         try:
-            # Create OTP data structure
-            otp_data = {
+            key = self._get_cache_key(email)
+            # One MULTI/EXEC round trip, replacing any previous record
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.delete(key)
+            pipe.hset(key, mapping={
                 'email_otp': email_otp,
                 'email_attempts': 0,
-                'email_verified': False,
+                'email_verified': 0,
                 'created_at': self._get_current_timestamp()
-            }
-
-            # Use simple Redis set with expiry - just like in the screenshot example
-            key = self._get_cache_key(email)
-            result = self.redis_client.setex(
-                key,
-                timedelta(seconds=self.otp_expiry),
-                json.dumps(otp_data)
-            )
+            })
+            pipe.expire(key, timedelta(seconds=self.otp_expiry))
+            pipe.execute()
 
             return True
 
-        except Exception as e:
-            print(f"❌ [DEBUG] Failed to store email OTP: {e}")
-            traceback.print_exc()
+        except Exception:
+            current_app.logger.exception(f"Store email OTP error for {email}")
             return False
 
 
     # ----------------------------------------------------------------------
     def get_otp_data(self, email):
-        """Retrieve OTP data using simple Redis get operation."""
+        """Retrieve the OTP record, with attempts as int and verified as bool."""
         key = self._get_cache_key(email)
 
         try:
-            # Use simple Redis get - just like in the screenshot example
-            data = self.redis_client.get(key)
+            data = self.redis_client.hgetall(key)
             if data:
-                parsed_data = json.loads(data)
-                return parsed_data
+                data['email_attempts'] = int(data.get('email_attempts', 0))
+                data['email_verified'] = data.get('email_verified') == '1'
+                return data
             else:
                 return None
 
-        except json.JSONDecodeError as e:
-            return None
-        except Exception as e:
+        except Exception:
+            # Includes WRONGTYPE for records stored as JSON before hashes
             return None
 
     # ----------------------------------------------------------------------
@@ -131,8 +191,8 @@ class OTPService:
             result = self.redis_client.delete(key)
             return result > 0
 
-        except Exception as e:
-            traceback.print_exc()
+        except Exception:
+            current_app.logger.exception(f"Delete OTP data error for {email}")
             return False
 
     # ----------------------------------------------------------------------
@@ -141,61 +201,101 @@ class OTPService:
         from datetime import datetime
         return datetime.utcnow().isoformat()
 
+    # ----------------------------------------------------------------------
+    def verify_email_otp(self, email, email_otp, max_attempts=MAX_EMAIL_ATTEMPTS):
+        """
+        Check an email OTP and count the attempt in one atomic round trip.
+
+        Returns (status, attempts), status being "verified", "invalid",
+        "locked" (too many failed attempts, the record is deleted) or
+        "missing" (no record, or it expired). Redis errors propagate.
+        """
+        status, attempts = self._verify_script(
+            keys=[self._get_cache_key(email)],
+            args=[email_otp, max_attempts, self._get_current_timestamp()],
+            client=self.redis_client
+        )
+        return status, int(attempts)
+
     # ----------------------------------------------------------------------
     def increment_email_attempts(self, email):
-        """Increment failed email attempt counter."""
+        """Increment failed email attempt counter, keeping the OTP expiry."""
 
         try:
-            otp_data = self.get_otp_data(email)
-            if otp_data:
-                otp_data['email_attempts'] = otp_data.get(
-                    'email_attempts', 0) + 1
-                otp_data['updated_at'] = self._get_current_timestamp()
-
-                # Use simple set to update
-                key = self._get_cache_key(email)
-                result = self.redis_client.setex(
-                    key,
-                    timedelta(seconds=self.otp_expiry),
-                    json.dumps(otp_data)
-                )
-                
-                return True
-            else:
-                return False
+            attempts = self._update_script(
+                keys=[self._get_cache_key(email)],
+                args=[1, self._get_current_timestamp()],
+                client=self.redis_client
+            )
+            return attempts is not None
 
-        except Exception as e:
-            traceback.print_exc()
+        except Exception:
+            current_app.logger.exception(f"Increment email attempts error for {email}")
             return False
 
 
     def mark_email_verified(self, email):
-        """Mark email as verified."""
+        """Mark email as verified, keeping the OTP expiry."""
 
         try:
-            otp_data = self.get_otp_data(email)
-            if otp_data:
-                otp_data['email_verified'] = True
-                otp_data['email_verified_at'] = self._get_current_timestamp()
-                otp_data['updated_at'] = self._get_current_timestamp()
-
-                # Use simple set to update
-                key = self._get_cache_key(email)
-                result = self.redis_client.setex(
-                    key,
-                    timedelta(seconds=self.otp_expiry),
-                    json.dumps(otp_data)
-                )
-                return True
-            else:
-                return False
+            now = self._get_current_timestamp()
+            updated = self._update_script(
+                keys=[self._get_cache_key(email)],
+                args=[0, now, 'email_verified', 1, 'email_verified_at', now],
+                client=self.redis_client
+            )
+            return updated is not None
 
-        except Exception as e:
-            print(f"❌ [DEBUG] Failed to mark email as verified: {e}")
-            traceback.print_exc()
+        except Exception:
+            current_app.logger.exception(f"Mark email verified error for {email}")
             return False
 
 
+    # ----------------------------------------------------------------------
+    # Password Reset Tokens
+    # ----------------------------------------------------------------------
+
+    def _get_reset_keys(self, email):
+        """Keys of the reset token hash and of the request counter."""
+        return f"reset:{email}", f"reset_rate:{email}"
+
+    def _hash_token(self, token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def check_reset_rate(self, email):
+        """
+        Count a reset request for `email` against RESET_RATE_LIMIT.
+
+        Returns 0 when allowed, otherwise the seconds until the window ends.
+        """
+        _, rate_key = self._get_reset_keys(email)
+
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.set(rate_key, 0, ex=RESET_RATE_WINDOW, nx=True)
+        pipe.incr(rate_key)
+        pipe.ttl(rate_key)
+        _, requests, window_left = pipe.execute()
+        if requests > RESET_RATE_LIMIT:
+            return max(window_left, 1)
+        return 0
+
+    def issue_reset_token(self, email):
+        """Create a single-use reset token, replacing any earlier one. Only its hash is stored."""
+        token_key, _ = self._get_reset_keys(email)
+        token = secrets.token_urlsafe(32)
+        self.redis_client.set(token_key, self._hash_token(token), ex=RESET_TOKEN_EXPIRY)
+        return token
+
+    def consume_reset_token(self, email, token):
+        """Check a reset token and delete it in the same atomic call, True if valid."""
+        token_key, _ = self._get_reset_keys(email)
+        deleted = self._consume_script(
+            keys=[token_key],
+            args=[self._hash_token(token)],
+            client=self.redis_client
+        )
+        return deleted == 1
+
     # ----------------------------------------------------------------------
     # Health Check
     # ----------------------------------------------------------------------
@@ -336,3 +436,7 @@ class OTPService:
     #     print(f"❌ [DEBUG] Verification error for {phone}: {e}")
     #     traceback.print_exc()
     #     return False
+
+
+# Shared per worker process, initialized by app.py
+otp_service = OTPService()
@@ -0,0 +1,82 @@
+import base64
+
+from bson import json_util
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe token for the sort key values of the last document on a page"""
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Sort key values from an `after` token. Raises ValueError for a malformed token."""
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def decode_offset(token):
+    """Position in a ranked result list from an `after` token, 0 for the first page"""
+    if not token:
+        return 0
+    values = decode_cursor(token)
+    if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+        raise ValueError("Invalid cursor")
+    return values[0]
+
+
+def keyset_filter(sort, values):
+    """Match the documents that come after `values` in `sort` order
+
+    For sort [(a, -1), (b, -1)] this is {a < va} or {a == va and b < vb}, which
+    the server answers by seeking an index on (a, b) instead of skipping.
+    """
+    if len(values) != len(sort):
+        raise ValueError("Invalid cursor")
+
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {f: v for (f, _), v in zip(sort[:i], values[:i])}
+        if values[i] is None:
+            # Missing values sort first ascending and last descending
+            if direction == -1:
+                continue
+            clause[field] = {"$ne": None}
+        else:
+            clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses} if clauses else {"_id": {"$exists": False}}
+
+
+def keyset_page(collection, query, sort, limit, after=None, projection=None):
+    """One page in `sort` order starting after the `after` token
+
+    `sort` must end with a unique field (normally _id) so the order is total.
+    Returns the documents and the token for the next page, None on the last.
+    """
+    if after:
+        seek = keyset_filter(sort, decode_cursor(after))
+        query = {"$and": [query, seek]} if query else seek
+
+    # One extra document tells whether another page follows
+    limit = max(limit, 1)
+    documents = list(collection.find(query, projection).sort(sort).limit(limit + 1))
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor([documents[-1].get(field) for field, _ in sort])
+    return documents, next_cursor
+
+
+def cursor_pagination(limit, next_cursor):
+    """`pagination` block of a cursor-mode listing response"""
+    return {
+        "limit": limit,
+        "nextCursor": next_cursor,
+        "hasMore": next_cursor is not None
+    }
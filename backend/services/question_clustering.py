@@ -0,0 +1,73 @@
+import re
+
+import numpy as np
+import scipy.sparse as sp
+
+# TF-IDF settings shared by request-time clustering and the question store
+VECTORIZER_OPTIONS = {"ngram_range": (1, 2), "stop_words": "english"}
+
+
+def clean_text(text):
+    """Clean text for NLP processing"""
+    text = str(text).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text
+
+
+def similarity_neighbors(X, threshold, block_size=512):
+    """
+    Find, for every row of an L2-normalised sparse matrix, the later rows
+    whose cosine similarity is at least `threshold`.
+
+    Similarities are computed as sparse products one block of rows at a
+    time, only against rows from the block onwards, and thresholded right
+    away. Memory stays proportional to the candidate pairs instead of the
+    n x n matrix that cosine_similarity(X) would allocate.
+    """
+    X = sp.csr_matrix(X, dtype=np.float64)
+    n = X.shape[0]
+    blocks = []
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        sims = (X[start:stop] @ X[start:].T).tocoo()
+        keep = sims.data >= threshold
+
+        # Shift columns back to absolute row numbers
+        blocks.append(sp.csr_matrix(
+            (sims.data[keep], (sims.row[keep], sims.col[keep] + start)),
+            shape=(stop - start, n)
+        ))
+
+    if not blocks:
+        return sp.csr_matrix((0, 0))
+
+    neighbors = sp.vstack(blocks).tocsr()
+    neighbors.sort_indices()
+    return neighbors
+
+
+def greedy_threshold_clusters(neighbors):
+    """
+    Greedy single pass clustering: each unassigned row, in order, takes
+    every later unassigned row among its neighbors.
+
+    Same grouping as walking the full similarity matrix with a double loop.
+    """
+    n = neighbors.shape[0]
+    indptr, indices = neighbors.indptr, neighbors.indices
+    assigned = np.zeros(n, dtype=bool)
+    clusters = []
+
+    for i in range(n):
+        if assigned[i]:
+            continue
+        assigned[i] = True
+
+        row = indices[indptr[i]:indptr[i + 1]]
+        members = row[(row > i) & ~assigned[row]]
+        assigned[members] = True
+        clusters.append([i] + members.tolist())
+
+    return clusters
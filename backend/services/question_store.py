@@ -0,0 +1,457 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import hashlib
+import math
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+
+from services.insights_aggregator import APPLIED_EVENTS
+from services.question_clustering import (
+    VECTORIZER_OPTIONS,
+    clean_text,
+    similarity_neighbors,
+    greedy_threshold_clusters
+)
+
+
+# Round types shown in the top questions section, with their question list field
+QUESTION_FIELDS = {
+    "aptitude": "sampleQuestions",
+    "coding": "top3Questions",
+    "technical": "top5Questions",
+    "hr": "topQuestions"
+}
+
+# A stored vocabulary is refitted once the new questions assigned against it
+# reach this share of the fitted ones (and at least REFIT_MIN_NEW of them)
+REFIT_GROWTH = 0.25
+REFIT_MIN_NEW = 20
+
+# A refit holds a lease on the round's header document; an abandoned lease
+# (crashed worker) can be taken over after this long
+REFIT_LEASE = timedelta(minutes=10)
+
+# Documents per bulk write when a fit is stored
+WRITE_BATCH = 1000
+
+# Fields of the pre-generation layout, dropped when a round is refitted
+LEGACY_FIELDS = ["questions", "counts", "vocabulary", "idf", "clusters",
+                 "assignments", "revision"]
+
+
+def question_texts(experience, round_type):
+    """Question texts of one round of an experience, in submission order"""
+    round_data = (experience.get("roundsData") or {}).get(round_type)
+    if not isinstance(round_data, dict):
+        return []
+    question_list = round_data.get(QUESTION_FIELDS[round_type])
+    if not isinstance(question_list, list):
+        return []
+    return [str(q["question"]) for q in question_list
+            if isinstance(q, dict) and q.get("question")]
+
+
+def question_hash(question):
+    return hashlib.sha1(question.encode("utf-8")).hexdigest()
+
+
+class QuestionVectorStore:
+    """
+    Persistent question clusters per (companyId, roundType).
+
+    Every piece lives in its own small document so no write grows with the
+    round: `question_vectors` holds one header per round (generation,
+    counters, refit lease), `question_entries` one document per unique
+    question with its count, `question_clusters` one per cluster with its
+    seed vector, and `question_terms` one per vocabulary term with its idf.
+
+    A new question is transformed by looking up only its own terms, compared
+    with the clusters whose seed shares a term with it (the others have
+    similarity 0), and joined to the first one similar enough with `$inc`
+    and `$push`, which is where the greedy pass over all questions would put
+    it. Once enough new questions have accumulated the round is refitted into
+    a new generation, and the header switches to it when the fit is stored.
+    """
+
+    def __init__(self, db, threshold=0.65):
+        self.db = db
+        self.collection = db.question_vectors
+        self.entries = db.question_entries
+        self.clusters = db.question_clusters
+        self.terms = db.question_terms
+        self.threshold = threshold
+
+    # ----------------------------------------------------------------------
+    def fit(self, counts):
+        """Vocabulary, idf and clusters of {question: count} in first-seen order"""
+        questions = list(counts)
+        fitted = {
+            "questions": questions,
+            "counts": [int(count) for count in counts.values()],
+            "vocabulary": None,
+            "idf": None,
+            "clusters": [],
+            "assignments": [None] * len(questions)
+        }
+
+        if len(questions) <= 1:
+            return fitted
+
+        try:
+            vectorizer = TfidfVectorizer(**VECTORIZER_OPTIONS)
+            X = vectorizer.fit_transform([clean_text(q) for q in questions])
+        except ValueError:
+            # Nothing left after stop words, served as plain counts
+            return fitted
+
+        vocabulary = [None] * len(vectorizer.vocabulary_)
+        for term, index in vectorizer.vocabulary_.items():
+            vocabulary[index] = term
+        fitted["vocabulary"] = vocabulary
+        fitted["idf"] = vectorizer.idf_.tolist()
+
+        X = X.tocsr()
+        clusters = greedy_threshold_clusters(similarity_neighbors(X, self.threshold))
+        for cluster_id, members in enumerate(clusters):
+            seed = X[members[0]].tocsr()
+            seed.sort_indices()
+            cluster = self._new_cluster(
+                cluster_id, dict(zip(seed.indices.tolist(), seed.data.tolist())),
+                questions[members[0]])
+            for index in members[1:]:
+                self._join(cluster, questions[index])
+            for index in members:
+                fitted["assignments"][index] = cluster_id
+            fitted["clusters"].append(cluster)
+
+        return fitted
+
+    def transform(self, key, generation, questions):
+        """TF-IDF vectors ({term index: weight}) of questions, reading only their terms"""
+        analyzer = CountVectorizer(**VECTORIZER_OPTIONS).build_analyzer()
+        term_counts = [Counter(analyzer(clean_text(q))) for q in questions]
+        wanted = sorted(set().union(*term_counts))
+
+        vocabulary = {}
+        if wanted:
+            for term in self.terms.find(
+                    {**key, "generation": generation, "term": {"$in": wanted}},
+                    {"term": 1, "index": 1, "idf": 1}):
+                vocabulary[term["term"]] = (term["index"], term["idf"])
+
+        vectors = []
+        for counts in term_counts:
+            weights = {vocabulary[t][0]: count * vocabulary[t][1]
+                       for t, count in counts.items() if t in vocabulary}
+            norm = math.sqrt(sum(w * w for w in weights.values()))
+            vectors.append({i: w / norm for i, w in weights.items()} if norm else {})
+        return vectors
+
+    def assign(self, key, generation, vector, question):
+        """Join the first cluster whose seed matches `vector`, or start one. Returns its id."""
+        best = None
+        if vector:
+            for cluster in self.clusters.find(
+                    {**key, "generation": generation, "terms": {"$in": sorted(vector)}},
+                    {"clusterId": 1, "terms": 1, "weights": 1}):
+                similarity = sum(w * vector.get(t, 0.0)
+                                 for t, w in zip(cluster["terms"], cluster["weights"]))
+                if similarity >= self.threshold and \
+                        (best is None or cluster["clusterId"] < best["clusterId"]):
+                    best = cluster
+
+        if best is None:
+            header = self.collection.find_one_and_update(
+                key, {"$inc": {"clusterCount": 1}}, {"clusterCount": 1},
+                return_document=ReturnDocument.AFTER)
+            cluster = self._new_cluster(header["clusterCount"] - 1, vector, question)
+            self.clusters.insert_one({**key, "generation": generation, **cluster})
+            return cluster["clusterId"]
+
+        self.clusters.update_one(
+            {"_id": best["_id"]},
+            {"$inc": {"size": 1},
+             "$push": {"similarQuestions": {"$each": [question], "$slice": 3}}}
+        )
+        # Longest question represents the cluster, earliest wins ties
+        self.clusters.update_one(
+            {"_id": best["_id"], "representativeLength": {"$lt": len(question)}},
+            {"$set": {"representative": question,
+                      "representativeLength": len(question)}}
+        )
+        return best["clusterId"]
+
+    @staticmethod
+    def _new_cluster(cluster_id, vector, question):
+        terms = sorted(vector)
+        return {
+            "clusterId": cluster_id,
+            "terms": terms,
+            "weights": [vector[t] for t in terms],
+            "size": 1,
+            "representative": question,
+            "representativeLength": len(question),
+            "similarQuestions": [question]
+        }
+
+    @staticmethod
+    def _join(cluster, question):
+        cluster["size"] += 1
+        if len(question) > cluster["representativeLength"]:
+            cluster["representative"] = question
+            cluster["representativeLength"] = len(question)
+        if len(cluster["similarQuestions"]) < 3:
+            cluster["similarQuestions"].append(question)
+
+    # ----------------------------------------------------------------------
+    def add_questions(self, company_id, round_type, questions, event_id=None):
+        """Fold new questions into an existing store. Missing stores are built lazily on read.
+
+        With `event_id` the questions are added at most once: the id is
+        recorded on the header before the entries are touched.
+        """
+        key = {"companyId": company_id, "roundType": round_type}
+        if event_id is None:
+            header = self.collection.find_one(key, {"generation": 1})
+        else:
+            header = self.collection.find_one_and_update(
+                {**key, "generation": {"$exists": True}, "appliedEvents": {"$ne": event_id}},
+                {"$push": {"appliedEvents": {"$each": [event_id], "$slice": -APPLIED_EVENTS}}},
+                {"generation": 1})
+        if header is None or "generation" not in header:
+            return False
+
+        added = []
+        for question, count in Counter(questions).items():
+            result = self.entries.update_one(
+                {**key, "questionHash": question_hash(question)},
+                {"$inc": {"count": count},
+                 "$setOnInsert": {"question": question, "generation": None}},
+                upsert=True
+            )
+            # Only the writer that created the entry assigns it to a cluster
+            if result.upserted_id is not None:
+                added.append((result.upserted_id, question))
+
+        if not added:
+            return True
+
+        generation = header["generation"]
+        for (entry_id, question), vector in zip(
+                added, self.transform(key, generation, [q for _, q in added])):
+            header = self.collection.find_one_and_update(
+                key, {"$inc": {"questionCount": 1}},
+                {"questionCount": 1, "fittedCount": 1, "hasVocabulary": 1},
+                return_document=ReturnDocument.AFTER)
+            cluster_id = self.assign(key, generation, vector, question)
+            self.entries.update_one(
+                {"_id": entry_id},
+                {"$set": {"seq": header["questionCount"] - 1,
+                          "clusterId": cluster_id, "generation": generation}}
+            )
+            self._follow_generation(key, entry_id, question, generation)
+        self.collection.update_one(key, {"$set": {"updatedAt": datetime.utcnow()}})
+
+        fitted = header.get("fittedCount", 0)
+        needed = REFIT_MIN_NEW if header.get("hasVocabulary") else 1
+        if header["questionCount"] - fitted >= max(needed, REFIT_GROWTH * fitted):
+            self.refit(company_id, round_type)
+        return True
+
+    def _follow_generation(self, key, entry_id, question, generation):
+        """Move an entry assigned into `generation` on to the round's current generation
+
+        A refit that switched generations while the entry was being assigned
+        may have run its straggler pass before the entry was stamped. Either
+        side moves the entry only out of the generation it last saw, so
+        exactly one of them assigns it.
+        """
+        while True:
+            header = self.collection.find_one(key, {"generation": 1})
+            if header is None or header.get("generation") == generation:
+                return
+            result = self.entries.update_one(
+                {"_id": entry_id, "generation": generation},
+                {"$set": {"generation": header["generation"], "clusterId": None}})
+            # Clusters started in the retired generation after it was cleaned up
+            self.clusters.delete_many({**key, "generation": generation})
+            self.terms.delete_many({**key, "generation": generation})
+            if not result.modified_count:
+                return
+
+            generation = header["generation"]
+            vector = self.transform(key, generation, [question])[0]
+            cluster_id = self.assign(key, generation, vector, question)
+            self.entries.update_one(
+                {"_id": entry_id, "generation": generation},
+                {"$set": {"clusterId": cluster_id}})
+
+    def add_experience(self, experience, event_id=None):
+        """Fold a newly submitted experience's questions into its company stores"""
+        company_id = experience.get("companyId")
+        for round_type in QUESTION_FIELDS:
+            questions = question_texts(experience, round_type)
+            if questions:
+                self.add_questions(company_id, round_type, questions, event_id)
+
+    # ----------------------------------------------------------------------
+    def _lease(self, key):
+        """Take the round's refit lease, creating its header. None when another refit holds it."""
+        now = datetime.utcnow()
+        try:
+            return self.collection.find_one_and_update(
+                {**key, "$or": [{"refittingAt": {"$exists": False}},
+                                {"refittingAt": {"$lt": now - REFIT_LEASE}}]},
+                {"$set": {"refittingAt": now}},
+                {"generation": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return None
+
+    def refit(self, company_id, round_type):
+        """Refit a round from its stored questions into a new generation"""
+        key = {"companyId": company_id, "roundType": round_type}
+        header = self._lease(key)
+        if header is None:
+            return False
+        counts = {entry["question"]: entry["count"] for entry in self.entries.find(
+            {**key, "seq": {"$exists": True}}, {"question": 1, "count": 1}).sort("seq", 1)}
+        self.store(key, header.get("generation", 0) + 1, self.fit(counts), rebuilt=False)
+        return True
+
+    def store(self, key, generation, fitted, rebuilt):
+        """Write a fit as `generation` and switch the header to it
+
+        A rebuild also resets the counts and drops questions no longer
+        submitted. A refit keeps the counts, and questions added while it ran
+        are assigned into the new generation after the switch.
+        """
+        questions = fitted["questions"]
+
+        if fitted["vocabulary"]:
+            for start in range(0, len(fitted["vocabulary"]), WRITE_BATCH):
+                self.terms.insert_many([
+                    {**key, "generation": generation, "term": term,
+                     "index": index, "idf": fitted["idf"][index]}
+                    for index, term in enumerate(
+                        fitted["vocabulary"][start:start + WRITE_BATCH], start)
+                ], ordered=False)
+        for start in range(0, len(fitted["clusters"]), WRITE_BATCH):
+            self.clusters.insert_many([
+                {**key, "generation": generation, **cluster}
+                for cluster in fitted["clusters"][start:start + WRITE_BATCH]
+            ], ordered=False)
+
+        for start in range(0, len(questions), WRITE_BATCH):
+            operations = []
+            for seq in range(start, min(start + WRITE_BATCH, len(questions))):
+                fields = {"clusterId": fitted["assignments"][seq],
+                          "generation": generation}
+                if rebuilt:
+                    fields.update(question=questions[seq], count=fitted["counts"][seq], seq=seq)
+                operations.append(UpdateOne(
+                    {**key, "questionHash": question_hash(questions[seq])},
+                    {"$set": fields}, upsert=rebuilt))
+            self.entries.bulk_write(operations, ordered=False)
+
+        now = datetime.utcnow()
+        header = {
+            "generation": generation,
+            "fittedCount": len(questions),
+            "clusterCount": len(fitted["clusters"]),
+            "hasVocabulary": fitted["vocabulary"] is not None,
+            "fittedAt": now,
+            "updatedAt": now
+        }
+        if rebuilt:
+            header["questionCount"] = len(questions)
+        self.collection.update_one(key, {
+            "$set": header,
+            "$unset": {field: "" for field in LEGACY_FIELDS + ["refittingAt"]}
+        })
+
+        stale = {**key, "generation": {"$ne": generation}}
+        if rebuilt:
+            self.entries.delete_many(stale)
+        else:
+            stragglers = list(self.entries.find(
+                {**stale, "seq": {"$exists": True}},
+                {"question": 1, "generation": 1}).sort("seq", 1))
+            vectors = self.transform(key, generation, [e["question"] for e in stragglers])
+            for entry, vector in zip(stragglers, vectors):
+                # Taken out of its old generation first, see _follow_generation
+                result = self.entries.update_one(
+                    {"_id": entry["_id"], "generation": entry.get("generation")},
+                    {"$set": {"generation": generation, "clusterId": None}})
+                if not result.modified_count:
+                    continue
+                cluster_id = self.assign(key, generation, vector, entry["question"])
+                self.entries.update_one(
+                    {"_id": entry["_id"], "generation": generation},
+                    {"$set": {"clusterId": cluster_id}})
+        self.terms.delete_many(stale)
+        self.clusters.delete_many(stale)
+
+    def rebuild(self, company_id):
+        """Refit every round type of a company from its experiences"""
+        counts = {round_type: {} for round_type in QUESTION_FIELDS}
+        projection = {f"roundsData.{round_type}.{field}": 1
+                      for round_type, field in QUESTION_FIELDS.items()}
+
+        for experience in self.db.experiences.find({"companyId": company_id}, projection):
+            for round_type, round_counts in counts.items():
+                for question in question_texts(experience, round_type):
+                    round_counts[question] = round_counts.get(question, 0) + 1
+
+        headers = {}
+        for round_type, round_counts in counts.items():
+            key = {"companyId": company_id, "roundType": round_type}
+            header = self._lease(key)
+            if header is None:
+                continue
+            self.store(key, header.get("generation", 0) + 1,
+                       self.fit(round_counts), rebuilt=True)
+            headers[round_type] = self.collection.find_one(key)
+        return headers
+
+    # ----------------------------------------------------------------------
+    def top_questions(self, company_id, top_n=5):
+        """Same shape as generate_top_questions, read from the stored clusters"""
+        headers = {header["roundType"]: header
+                   for header in self.collection.find({"companyId": company_id})}
+        if not headers or any("generation" not in h for h in headers.values()):
+            headers = self.rebuild(company_id)
+
+        top_questions = {}
+        for round_type in QUESTION_FIELDS:
+            header = headers.get(round_type)
+            if header and header.get("questionCount"):
+                top_questions[round_type] = self.top_clusters(header, top_n)
+        return top_questions
+
+    def top_clusters(self, header, top_n=5):
+        """Same shape as cluster_questions"""
+        key = {"companyId": header["companyId"], "roundType": header["roundType"]}
+        if header["questionCount"] == 1 or not header.get("hasVocabulary"):
+            # Same fallback as cluster_questions: most frequent questions
+            entries = self.entries.find(key, {"question": 1, "count": 1}).sort(
+                [("count", -1), ("seq", 1)]).limit(top_n)
+            return [{"question": e["question"], "frequency": int(e["count"])}
+                    for e in entries]
+
+        clusters = self.clusters.find(
+            {**key, "generation": header["generation"]},
+            {"representative": 1, "size": 1, "similarQuestions": 1}
+        ).sort([("size", -1), ("clusterId", 1)]).limit(top_n)
+        return [
+            {
+                "representativeQuestion": cluster["representative"],
+                "frequency": int(cluster["size"]),
+                "similarQuestions": list(cluster["similarQuestions"])
+            }
+            for cluster in clusters
+        ]
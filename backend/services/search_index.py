@@ -0,0 +1,168 @@
+from bisect import bisect_left
+import heapq
+from threading import Lock
+import re
+import time
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Lowercase word tokens of a string, or of every string in a list"""
+    if isinstance(text, (list, tuple)):
+        return [token for item in text for token in tokenize(item)]
+    if not isinstance(text, str):
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class SearchIndex:
+    """
+    In-memory inverted index with prefix matching and weighted ranking.
+
+    Every token of the indexed fields maps to the documents containing it,
+    with the weight of the best field it appeared in. The vocabulary is kept
+    sorted, so a query token matches every indexed token it prefixes with
+    one bisect plus a scan over the matches. This is what makes
+    search-as-you-type work on partial words. A document must match every
+    query token. It scores the sum of its best field weight per query token,
+    doubled for a whole-word match.
+    """
+
+    def __init__(self, weights):
+        self.weights = weights
+        self.keys = []
+        self.labels = []
+        self.postings = {}
+        self.vocabulary = []
+
+    def build(self, documents, key, label=None):
+        """Index `documents` (dicts), identified by document[key], ties ordered by document[label]"""
+        postings = {}
+        for document in documents:
+            index = len(self.keys)
+            self.keys.append(document[key])
+            self.labels.append(str(document.get(label) or "").lower() if label else "")
+            for field, weight in self.weights.items():
+                for token in tokenize(document.get(field)):
+                    documents_weights = postings.setdefault(token, {})
+                    if documents_weights.get(index, 0) < weight:
+                        documents_weights[index] = weight
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+        return self
+
+    def _matches(self, token):
+        """{document: score} for one query token, prefix matches included"""
+        scores = {}
+        vocabulary = self.vocabulary
+        for position in range(bisect_left(vocabulary, token), len(vocabulary)):
+            term = vocabulary[position]
+            if not term.startswith(token):
+                break
+            exact = 2 if term == token else 1
+            for index, weight in self.postings[term].items():
+                score = weight * exact
+                if scores.get(index, 0) < score:
+                    scores[index] = score
+        return scores
+
+    def search(self, query, limit=None):
+        """Keys of the documents matching every token of `query`, best first"""
+        return self.rank(query, limit)[0]
+
+    def rank(self, query, limit=None):
+        """(keys of the best `limit` matches, total number of matches)"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return [], 0
+
+        # Rarest token first keeps the intersection small
+        matches = sorted((self._matches(token) for token in tokens), key=len)
+        scores = matches[0]
+        for token_scores in matches[1:]:
+            scores = {index: score + token_scores[index]
+                      for index, score in scores.items() if index in token_scores}
+            if not scores:
+                return [], 0
+
+        def order(index):
+            return (-scores[index], self.labels[index], index)
+
+        # Short prefixes match much of the collection, only order the page
+        if limit is not None and limit < len(scores):
+            ranked = heapq.nsmallest(limit, scores, key=order)
+        else:
+            ranked = sorted(scores, key=order)
+        return [self.keys[index] for index in ranked], len(scores)
+
+
+class CollectionSearch:
+    """
+    A SearchIndex over one collection, rebuilt on demand.
+
+    The index is built on first use, and rebuilt after `invalidate` (called
+    by the routes that change the indexed fields) or once it is `ttl`
+    seconds old. The TTL picks up changes made by other worker processes.
+
+    Rebuilds run outside the lock and swap the new index in when done. One
+    request rebuilds an expired index while the others keep searching the
+    previous one.
+    """
+
+    def __init__(self, collection, weights, key="_id", label=None, ttl=300):
+        self.collection = collection
+        self.weights = weights
+        self.key = key
+        self.label = label
+        self.ttl = ttl
+        self._indexes = {}
+        self._building = set()
+        self._generation = 0
+        self._lock = Lock()
+
+    def index(self, db):
+        entry = self._indexes.get(db.name)
+        if entry is not None and entry[1] >= time.monotonic():
+            return entry[0]
+
+        with self._lock:
+            building = db.name in self._building
+            self._building.add(db.name)
+            generation = self._generation
+        if building and entry is not None:
+            return entry[0]
+
+        try:
+            fields = set(self.weights) | {self.key} | ({self.label} if self.label else set())
+            documents = db[self.collection].find({}, dict.fromkeys(fields, 1))
+            index = SearchIndex(self.weights).build(documents, self.key, self.label)
+        finally:
+            if not building:
+                with self._lock:
+                    self._building.discard(db.name)
+
+        with self._lock:
+            # Invalidated while building: serve it, but rebuild on the next search
+            expires = time.monotonic() + self.ttl if generation == self._generation else 0
+            self._indexes[db.name] = (index, expires)
+        return index
+
+    def search(self, db, query, limit=None):
+        return self.index(db).search(query, limit)
+
+    def page(self, db, query, offset, limit, projection=None):
+        """One page of ranked matches as (documents, total), fetched in rank order"""
+        keys, total = self.index(db).rank(query, offset + limit)
+        page_keys = keys[offset:offset + limit]
+        documents = {document[self.key]: document for document in
+                     db[self.collection].find({self.key: {"$in": page_keys}}, projection)}
+        # Documents deleted since the index was built are skipped
+        return [documents[key] for key in page_keys if key in documents], total
+
+    def invalidate(self):
+        """Expire every index; searches use the old one until a rebuild replaces it"""
+        with self._lock:
+            self._generation += 1
+            self._indexes = {name: (index, 0) for name, (index, _) in self._indexes.items()}
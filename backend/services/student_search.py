@@ -0,0 +1,57 @@
+import re
+
+from pymongo import UpdateOne
+
+from services.search_index import tokenize
+
+
+# Shadow field holding the lowercase search tokens of a student
+SEARCH_FIELD = "searchTokens"
+
+
+def student_search_tokens(student):
+    """Lowercase tokens a student can be found by: name words, student ID and email"""
+    tokens = tokenize(student.get("name"))
+    for field in ("studentId", "email"):
+        value = student.get(field)
+        if isinstance(value, str) and value.strip():
+            # The whole value, so "21cp0" and "s2@bvm" match as typed,
+            # plus its parts for searches on a fragment after a separator
+            tokens.append(value.strip().lower())
+            tokens.extend(tokenize(value))
+    return sorted(set(tokens))
+
+
+def student_search_fields(student):
+    """$set-able shadow fields for a student document"""
+    return {SEARCH_FIELD: student_search_tokens(student)}
+
+
+def student_search_filter(search):
+    """Filter matching students with a token starting with every word of `search`
+
+    Each word becomes an anchored, case-sensitive regex on the lowercase
+    tokens, which MongoDB answers with an index range scan instead of
+    running the regex over every student.
+    """
+    words = [word for word in search.lower().split() if word]
+    if not words:
+        return {}
+    prefixes = [re.compile("^" + re.escape(word)) for word in dict.fromkeys(words)]
+    if len(prefixes) == 1:
+        return {SEARCH_FIELD: prefixes[0]}
+    return {SEARCH_FIELD: {"$all": prefixes}}
+
+
+def backfill_student_search(db, batch_size=500):
+    """Fill the shadow fields of every student, returns the number updated"""
+    updated, batch = 0, []
+    for student in db.students.find({}, {"name": 1, "studentId": 1, "email": 1}):
+        batch.append(UpdateOne({"_id": student["_id"]},
+                               {"$set": student_search_fields(student)}))
+        if len(batch) >= batch_size:
+            updated += db.students.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += db.students.bulk_write(batch, ordered=False).modified_count
+    return updated
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from threading import Lock
+import os
+import time
+
+import redis
+
+
+KEY_PREFIX = "placify:revoked:"
+
+
+class MemoryBlocklistBackend:
+    """Revoked JTIs in this process only, for tests and single-process runs"""
+
+    def __init__(self):
+        self._expiry = {}
+        self._lock = Lock()
+
+    def add(self, jti, ttl):
+        now = time.time()
+        with self._lock:
+            # Drop lapsed entries so the set stays bounded by live tokens
+            for expired in [key for key, expires in self._expiry.items() if expires <= now]:
+                del self._expiry[expired]
+            self._expiry[jti] = now + ttl
+
+    def contains(self, jti):
+        expires = self._expiry.get(jti)
+        return expires is not None and expires > time.time()
+
+
+class RedisBlocklistBackend:
+    """Revoked JTIs as Redis keys that expire with the token, shared by all workers"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def add(self, jti, ttl):
+        self.client.set(KEY_PREFIX + jti, 1, ex=ttl)
+
+    def contains(self, jti):
+        return self.client.exists(KEY_PREFIX + jti) > 0
+
+
+class TokenBlocklist:
+    """
+    Revoked access and refresh tokens, checked on every @jwt_required call.
+
+    Revocations go to the backend (Redis unless TOKEN_BLOCKLIST_BACKEND is
+    "memory") with a TTL equal to the token's remaining lifetime, so nothing
+    outlives the token it blocks. Lookups go through a per-worker LRU first.
+    Revoked answers are cached until the token expires. Not-revoked answers
+    are cached for TOKEN_BLOCKLIST_CACHE_TTL seconds, which bounds how long
+    a logout on another worker can go unnoticed here.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.backend = MemoryBlocklistBackend()
+        self.cache_size = 10000
+        self.cache_ttl = 2.0
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.cache_size = int(os.getenv("TOKEN_BLOCKLIST_CACHE_SIZE", 10000))
+        self.cache_ttl = float(os.getenv("TOKEN_BLOCKLIST_CACHE_TTL", 2))
+
+        if os.getenv("TOKEN_BLOCKLIST_BACKEND", "redis") == "redis":
+            try:
+                client = redis.Redis.from_url(
+                    os.getenv("REDIS_URL", "redis://localhost:6379"),
+                    password=os.getenv("REDIS_PASSWORD"),
+                    socket_connect_timeout=2,
+                    socket_timeout=2
+                )
+                client.ping()
+                self.backend = RedisBlocklistBackend(client)
+            except redis.RedisError as e:
+                app.logger.warning(
+                    f"Token blocklist Redis unavailable, using in-process store: {str(e)}")
+                self.backend = MemoryBlocklistBackend()
+        else:
+            self.backend = MemoryBlocklistBackend()
+
+        jwt = app.extensions.get("flask-jwt-extended")
+        if jwt is not None:
+            @jwt.token_in_blocklist_loader
+            def check_if_token_revoked(jwt_header, jwt_payload):
+                return self.is_revoked(jwt_payload["jti"], jwt_payload.get("exp"))
+
+        app.extensions["token_blocklist"] = self
+
+    # ----------------------------------------------------------------------
+    def _cached(self, jti):
+        with self._lock:
+            entry = self._cache.get(jti)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._cache[jti]
+                return None
+            self._cache.move_to_end(jti)
+            return entry[0]
+
+    def _remember(self, jti, revoked, until):
+        with self._lock:
+            self._cache[jti] = (revoked, until)
+            self._cache.move_to_end(jti)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # ----------------------------------------------------------------------
+    def revoke(self, jti, expires_at=None):
+        """Block a token until `expires_at` (its `exp` claim, epoch seconds)"""
+        now = time.time()
+        ttl = max(int((expires_at or now + 86400) - now) + 1, 1)
+        self._remember(jti, True, now + ttl)
+        self.backend.add(jti, ttl)
+
+    def is_revoked(self, jti, expires_at=None):
+        revoked = self._cached(jti)
+        if revoked is not None:
+            return revoked
+
+        try:
+            revoked = self.backend.contains(jti)
+        except redis.RedisError as e:
+            # Revocations made by this worker are still in the cache
+            if self.app is not None:
+                self.app.logger.error(f"Token blocklist lookup error: {str(e)}")
+            return False
+
+        now = time.time()
+        until = (expires_at or now) if revoked else now + self.cache_ttl
+        self._remember(jti, revoked, max(until, now + self.cache_ttl))
+        return revoked
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+
+# Shared per worker process
+token_blocklist = TokenBlocklist()